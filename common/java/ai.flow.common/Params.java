@@ -21,8 +21,10 @@ public class Params extends ParamsInterface {
         if (env != null) // Each process should have a single environment.
             return;
         env = new Env();
-        String home = System.getenv("HOME");
-        String dbPath = home + "/.flowdrive/params";
+        // PARAMS_PATH moves the store elsewhere, like for the native params
+        String dbPath = System.getenv("PARAMS_PATH");
+        if (dbPath == null)
+            dbPath = System.getenv("HOME") + "/.flowdrive/params";
         new File(dbPath).mkdirs();
         env.setMapSize(1024*1024*1024);
         env.open(dbPath);
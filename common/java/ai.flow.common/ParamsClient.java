@@ -6,6 +6,7 @@ import org.zeromq.ZMsg;
 
 import java.nio.ByteBuffer;
 import java.nio.ByteOrder;
+import java.util.Map;
 
 public class ParamsClient extends ParamsInterface {
 
@@ -14,15 +15,18 @@ public class ParamsClient extends ParamsInterface {
     public ZMQ.Socket sockGet;
     public ZMQ.Socket sockPut;
     public ZMQ.Socket sockDel;
+    public ZMQ.Socket sockBatch;
     public ZMQ.Poller poller = context.poller();
 
     public ParamsClient(){
         sockGet = context.socket(ZMQ.REQ);
         sockPut = context.socket(ZMQ.REQ);
         sockDel = context.socket(ZMQ.REQ);
+        sockBatch = context.socket(ZMQ.REQ);
         sockGet.connect(Utils.getSocketPath("6001")); // get socket
         sockPut.connect(Utils.getSocketPath("6002")); // put socket
         sockDel.connect(Utils.getSocketPath("6003")); // delete socket
+        sockBatch.connect(Utils.getSocketPath("6005")); // multi key socket
 
         sockGet.setLinger(50);
         poller.register(sockGet, ZMQ.Poller.POLLIN);
@@ -130,6 +134,30 @@ public class ParamsClient extends ParamsInterface {
         return new String(data).equals("1");
     }
 
+    public byte[][] getMany(String... keys){
+        ZMsg msg = makeFrame("get".getBytes());
+        for (String key : keys)
+            msg.add(key.getBytes());
+        msg.send(sockBatch);
+        ZMsg reply = ZMsg.recvMsg(sockBatch);
+        byte[][] values = new byte[keys.length][];
+        for (int i = 0; i < keys.length; i++)
+            values[i] = reply.pop().getData();
+        return values;
+    }
+
+    public void putMany(Map<String, byte[]> values){
+        ZMsg msg = makeFrame("put".getBytes());
+        for (Map.Entry<String, byte[]> entry : values.entrySet()) {
+            msg.add(entry.getKey().getBytes());
+            msg.add(entry.getValue());
+        }
+        msg.send(sockBatch);
+        // nothing is written if any of the keys is unknown
+        if (!new String(sockBatch.recv()).equals("1"))
+            throw new IllegalArgumentException("keyvald rejected the params " + values.keySet());
+    }
+
     public void deleteKey(String key){
         sockDel.send(key.getBytes(), 0);
         sockDel.recv();
@@ -142,8 +170,23 @@ public class ParamsClient extends ParamsInterface {
     }
 
     public void blockTillExists(String key) throws InterruptedException {
-        while (!exists(key))
-            Thread.sleep(50);
+        // keyvald publishes the current value on subscribing and then every change of it
+        ZMQ.Socket sockChanges = context.socket(ZMQ.SUB);
+        sockChanges.connect(Utils.getSocketPath("6006")); // changes socket
+        sockChanges.subscribe(key.getBytes());
+        try {
+            while (!Thread.currentThread().isInterrupted()) {
+                ZMsg msg = ZMsg.recvMsg(sockChanges);
+                if (msg == null)
+                    break;
+                // subscriptions match prefixes of the key
+                if (new String(msg.pop().getData()).equals(key) && msg.pop().getData().length != 0)
+                    return;
+            }
+            throw new InterruptedException();
+        } finally {
+            sockChanges.close();
+        }
     }
 
     public boolean existsAndCompare(String key, boolean value){
@@ -163,6 +206,7 @@ public class ParamsClient extends ParamsInterface {
         sockGet.close();
         sockDel.close();
         sockPut.close();
+        sockBatch.close();
     }
 }
 
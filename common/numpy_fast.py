@@ -2,23 +2,55 @@
 '''
 taken from https://github.com/commaai/openpilot
 '''
+from bisect import bisect_left
+
+import numpy as np
 
 def clip(x, lo, hi):
   return max(lo, min(hi, x))
 
+def _interp(xv, xp, fp):
+  # first breakpoint >= xv
+  hi = bisect_left(xp, xv)
+  if hi == 0:
+    return fp[0]
+  if hi == len(xp):
+    return fp[-1]
+  low = hi - 1
+  return (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low]
+
 def interp(x, xp, fp):
-  N = len(xp)
-
-  def get_interp(xv):
-    hi = 0
-    while hi < N and xv > xp[hi]:
-      hi += 1
-    low = hi - 1
-    return fp[-1] if hi == N and xv > xp[low] else (
-      fp[0] if hi == 0 else
-      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
-
-  return [get_interp(v) for v in x] if hasattr(x, '__iter__') else get_interp(x)
+  return [_interp(v, xp, fp) for v in x] if hasattr(x, '__iter__') else _interp(x, xp, fp)
+
+
+class Interpolator:
+  """interp over a fixed table of breakpoints, for tables that are looked up every cycle.
+  The slopes are computed once, scalars are looked up by bisection and arrays in one np.interp call."""
+  def __init__(self, xp, fp):
+    if len(xp) != len(fp) or len(xp) == 0:
+      raise ValueError("xp and fp must have the same, non zero length")
+    self.xp = [float(v) for v in xp]
+    self.fp = [float(v) for v in fp]
+    self._n = len(self.xp)
+    self._slopes = [(f1 - f0) / (x1 - x0) if x1 != x0 else 0.
+                    for x0, x1, f0, f1 in zip(self.xp, self.xp[1:], self.fp, self.fp[1:])]
+    self._xp = np.array(self.xp)
+    self._fp = np.array(self.fp)
+
+  def __call__(self, x):
+    if hasattr(x, '__iter__'):
+      return self.batch(x)
+    hi = bisect_left(self.xp, x)
+    if hi == 0:
+      return self.fp[0]
+    if hi == self._n:
+      return self.fp[-1]
+    return (x - self.xp[hi - 1]) * self._slopes[hi - 1] + self.fp[hi - 1]
+
+  def batch(self, x):
+    """Interpolates an array of values at once, returns an array"""
+    return np.interp(x, self._xp, self._fp)
+
 
 def mean(x):
   return sum(x) / len(x)
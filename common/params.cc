@@ -88,15 +88,20 @@ std::unordered_map<std::string, uint32_t> keys = {
 };
 
 lmdb::env Params::env = nullptr;
+std::string Params::env_path;
 
 Params::Params(const std::string &path) {
-    if (env!=nullptr)
-        return;
+    // a single environment per process, reopened if PARAMS_PATH changed since it was opened
     std::string db_path = getParamPath();
+    if (env!=nullptr && db_path == env_path)
+        return;
     util::create_directories(db_path, 0775);
-    env = lmdb::env::create();
-    env.set_mapsize(1UL * 1024UL * 1024UL * 1024UL);
-    env.open(db_path.c_str(), 0);
+    lmdb::env new_env = lmdb::env::create();
+    new_env.set_mapsize(1UL * 1024UL * 1024UL * 1024UL);
+    new_env.open(db_path.c_str(), 0);
+    // the previous environment is closed when new_env goes out of scope
+    env = std::move(new_env);
+    env_path = db_path;
 }
 
 bool Params::checkKey(const std::string &key) {
@@ -115,6 +120,16 @@ int Params::put(const std::string &key, const std::string &value) {
     return 1;
 }
 
+int Params::putMany(const std::vector<std::pair<std::string, std::string>> &values) {
+    lmdb::txn txn = lmdb::txn::begin(env);
+    lmdb::dbi dbi = lmdb::dbi::open(txn, nullptr);
+    for (auto &[key, value] : values) {
+        dbi.put(txn, key, value);
+    }
+    txn.commit();
+    return 1;
+}
+
 std::string Params::get(const std::string &key, bool block) {
     bool ret = false;
     std::string_view val;
@@ -145,6 +160,19 @@ std::string Params::get(const std::string &key, bool block) {
     return std::string(val);
 }
 
+std::vector<std::string> Params::getMany(const std::vector<std::string> &keys) {
+    std::vector<std::string> ret;
+    ret.reserve(keys.size());
+    lmdb::txn txn = lmdb::txn::begin(env, nullptr, MDB_RDONLY);
+    lmdb::dbi dbi = lmdb::dbi::open(txn, nullptr);
+    for (auto &key : keys) {
+        std::string_view val;
+        dbi.get(txn, key, val);
+        ret.emplace_back(val);
+    }
+    return ret;
+}
+
 std::map<std::string, std::string> Params::readAll() {
     std::map<std::string, std::string> ret;
     auto txn = lmdb::txn::begin(env, nullptr, MDB_RDONLY);
@@ -162,6 +190,12 @@ std::map<std::string, std::string> Params::readAll() {
     return ret;
 }
 
+uint64_t Params::changeCounter() {
+    MDB_envinfo info;
+    lmdb::env_info(env, &info);
+    return info.me_last_txnid;
+}
+
 int Params::remove(const std::string &key) {
     lmdb::txn txn = lmdb::txn::begin(env);
     lmdb::dbi dbi = lmdb::dbi::open(txn, nullptr);
@@ -171,10 +205,22 @@ int Params::remove(const std::string &key) {
     return 1;
 }
 
+int Params::removeMany(const std::vector<std::string> &keys) {
+    lmdb::txn txn = lmdb::txn::begin(env);
+    lmdb::dbi dbi = lmdb::dbi::open(txn, nullptr);
+    for (auto &key : keys) {
+        dbi.del(txn, key);
+    }
+    txn.commit();
+    return 1;
+}
+
 void Params::clearAll(ParamKeyType key_type) {
+  std::vector<std::string> to_remove;
   for (auto &[key, type] : keys) {
       if (type & key_type) {
-          remove(key);
+          to_remove.push_back(key);
     }
-  } 
+  }
+  removeMany(to_remove);
 }
@@ -3,6 +3,8 @@
 
 #include <map>
 #include <string>
+#include <utility>
+#include <vector>
 
 #include "common/util.h"
 #include <common/lmdb++.h>
@@ -22,26 +24,35 @@ public:
   bool checkKey(const std::string &key);
   ParamKeyType getKeyType(const std::string &key);
   inline std::string getParamPath(const std::string &key = {}) {
-    return util::getenv("HOME", "/home") + "/.flowdrive" + "/params";
+    // PARAMS_PATH moves the store elsewhere, e.g. for tests
+    std::string default_path = util::getenv("HOME", "/home") + "/.flowdrive" + "/params";
+    return util::getenv("PARAMS_PATH", default_path.c_str());
   }
 
   // Delete a value
   int remove(const std::string &key);
+  int removeMany(const std::vector<std::string> &keys);
   void clearAll(ParamKeyType type);
 
   // helpers for reading values
   std::string get(const std::string &key, bool block = false);
+  // values of the keys in a single transaction, empty for the missing ones
+  std::vector<std::string> getMany(const std::vector<std::string> &keys);
   inline bool getBool(const std::string &key, bool block = false) {
     return get(key, block) == "1";
   }
   std::map<std::string, std::string> readAll();
+  // id of the last committed write transaction, changes whenever any process writes a param
+  uint64_t changeCounter();
 
   // helpers for writing values
   int put(const std::string &key, const std::string &val);
+  int putMany(const std::vector<std::pair<std::string, std::string>> &values);
   inline int putBool(const std::string &key, bool val) {
     return put(key.c_str(), val ? "1" : "0");
   }
 
 private:
   static lmdb::env env;
+  static std::string env_path;
 };
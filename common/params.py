@@ -6,6 +6,40 @@ assert UnknownKeyName
 assert put_nonblocking
 assert put_bool_nonblocking
 
+
+class CachedParams:
+  """Params whose non-blocking reads are cached in the process, for loops that read the same params every cycle.
+
+  The cache is dropped whenever the change counter of the params moved, which happens on every write
+  by any process. Reading unchanged params then costs a lookup of the counter and of a dict.
+  """
+  def __init__(self, d=""):
+    self.params = Params(d)
+    self._cache = {}
+    self._counter = None
+
+  def __getattr__(self, attr):
+    return getattr(self.params, attr)
+
+  def get(self, key, block=False, encoding=None):
+    if block:
+      return self.params.get(key, block, encoding)
+
+    # the counter is read before the value, a write in between only drops the cache once more
+    counter = self.params.change_counter()
+    if counter != self._counter:
+      self._cache.clear()
+      self._counter = counter
+
+    try:
+      val = self._cache[key]
+    except KeyError:
+      val = self._cache[key] = self.params.get(key)
+    return val if encoding is None or val is None else val.decode(encoding)
+
+  def get_bool(self, key):
+    return self.get(key) == b"1"
+
 if __name__ == "__main__":
   import sys
 
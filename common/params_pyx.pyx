@@ -2,6 +2,9 @@
 # cython: language_level = 3
 from libcpp cimport bool
 from libcpp.string cimport string
+from libcpp.utility cimport pair
+from libcpp.vector cimport vector
+from libc.stdint cimport uint64_t
 import threading
 
 cdef extern from "common/params.h":
@@ -15,12 +18,16 @@ cdef extern from "common/params.h":
   cdef cppclass c_Params "Params":
     c_Params(string) nogil
     string get(string, bool) nogil
+    vector[string] getMany(vector[string]) nogil
     bool getBool(string) nogil
     int remove(string) nogil
+    int removeMany(vector[string]) nogil
     int put(string, string) nogil
+    int putMany(vector[pair[string, string]]) nogil
     int putBool(string, bool) nogil
     bool checkKey(string) nogil
     string getParamPath(string) nogil
+    uint64_t changeCounter() nogil
     void clearAll(ParamKeyType)
 
 
@@ -66,6 +73,22 @@ cdef class Params:
 
     return val if encoding is None else val.decode(encoding)
 
+  def get_many(self, keys, encoding=None):
+    """Reads the keys in a single transaction, returns a dict with None for the missing keys"""
+    keys = list(keys)
+    cdef vector[string] ks = [self.check_key(k) for k in keys]
+    cdef vector[string] vals
+    with nogil:
+      vals = self.p.getMany(ks)
+
+    ret = {}
+    for key, val in zip(keys, vals):
+      if val == b"":
+        ret[key] = None
+      else:
+        ret[key] = val if encoding is None else val.decode(encoding)
+    return ret
+
   def get_bool(self, key):
     cdef string k = self.check_key(key)
     cdef bool r
@@ -85,6 +108,14 @@ cdef class Params:
     with nogil:
       self.p.put(k, dat_bytes)
 
+  def put_many(self, values):
+    """Writes a dict of keys and values in a single transaction"""
+    cdef vector[pair[string, string]] kvs
+    for key, dat in values.items():
+      kvs.push_back(pair[string, string](self.check_key(key), ensure_bytes(dat)))
+    with nogil:
+      self.p.putMany(kvs)
+
   def put_bool(self, key, bool val):
     cdef string k = self.check_key(key)
     with nogil:
@@ -95,6 +126,16 @@ cdef class Params:
     with nogil:
       self.p.remove(k)
 
+  def delete_many(self, keys):
+    """Deletes the keys in a single transaction"""
+    cdef vector[string] ks = [self.check_key(k) for k in keys]
+    with nogil:
+      self.p.removeMany(ks)
+
+  def change_counter(self):
+    """Changes whenever a param is written or deleted, by any process"""
+    return self.p.changeCounter()
+
   def get_param_path(self, key=""):
     cdef string key_bytes = ensure_bytes(key)
     return self.p.getParamPath(key_bytes).decode("utf-8")
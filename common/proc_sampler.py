@@ -0,0 +1,282 @@
+"""Samples process and device vitals from /proc and sysfs, as a cheaper psutil for loops that sample them periodically.
+
+The files are opened once and re-read with pread, CPU usage is computed from the deltas between two samples.
+Values match their psutil counterparts: Process.status(), cpu_percent(), memory_percent(), create_time(),
+psutil.cpu_percent(percpu=True), virtual_memory().percent, sensors_temperatures() and sensors_battery().
+"""
+import os
+import glob
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+READ_SIZE = 64 * 1024
+
+# sensors_temperatures names the thermald cpu temperatures come from
+TEMPERATURE_SENSORS = ("coretemp", "battery")
+
+# /proc/<pid>/stat state to psutil status
+PROC_STATUS = {
+  "R": "running", "S": "sleeping", "D": "disk-sleep", "T": "stopped", "t": "tracing-stop",
+  "Z": "zombie", "X": "dead", "x": "dead", "K": "wake-kill", "W": "waking", "I": "idle", "P": "parked",
+}
+
+ProcessSample = namedtuple("ProcessSample", ["pid", "name", "status", "ppid", "priority", "nice", "num_threads",
+                                             "create_time", "cpu_user", "cpu_system", "cpu_percent", "memory_vms",
+                                             "memory_rss", "memory_percent", "processor", "cpu_affinity",
+                                             "cmdline", "exe"])
+DeviceSample = namedtuple("DeviceSample", ["cpu_percent", "memory_percent", "temperatures", "battery_percent",
+                                           "power_plugged"])
+CPUTimes = namedtuple("CPUTimes", ["user", "nice", "system", "idle", "iowait", "irq", "softirq"])
+MemInfo = namedtuple("MemInfo", ["total", "free", "available", "buffers", "cached", "active", "inactive", "shared"])
+
+
+def _open(path: str) -> Optional[int]:
+  try:
+    return os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+  except OSError:
+    return None
+
+
+def _read(fd: int) -> bytes:
+  return os.pread(fd, READ_SIZE, 0)
+
+
+def _meminfo_field(data: bytes, key: bytes, default: int = 0) -> int:
+  # only the fields that are used are parsed, splitting all of meminfo takes longer than reading it
+  if data.startswith(key):
+    start = len(key)
+  else:
+    start = data.find(b"\n" + key)
+    if start == -1:
+      return default
+    start += len(key) + 1
+  return int(data[start:data.index(b"k", start)]) * 1024
+
+
+def _read_once(path: str, default: str = "") -> str:
+  try:
+    with open(path) as f:
+      return f.read().strip()
+  except OSError:
+    return default
+
+
+class _Process:
+  def __init__(self, pid: int):
+    self.pid = pid
+    self.stat_fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY | os.O_CLOEXEC)
+    self.cmdline = _read_once(f"/proc/{pid}/cmdline").split("\0")
+    self.cmdline = [c for c in self.cmdline if c]
+    try:
+      self.exe = os.readlink(f"/proc/{pid}/exe")
+    except OSError:
+      self.exe = ""
+    self.last_cpu: Optional[float] = None
+    self.last_time = 0.
+
+  def close(self):
+    os.close(self.stat_fd)
+
+
+class ProcSampler:
+  """Samples the vitals of processes and of the device. Not thread safe."""
+
+  def __init__(self):
+    self._stat_fd = os.open("/proc/stat", os.O_RDONLY | os.O_CLOEXEC)
+    self._meminfo_fd = os.open("/proc/meminfo", os.O_RDONLY | os.O_CLOEXEC)
+    self._procs: Dict[int, _Process] = {}
+    self._last_cpu_times: Optional[List[CPUTimes]] = None
+
+    self.boot_time = 0.
+    for line in _read(self._stat_fd).split(b"\n"):
+      if line.startswith(b"btime"):
+        self.boot_time = float(line.split()[1])
+    self.mem_total = self.meminfo().total
+
+    # the sensors are only looked up by the first sample_device
+    self._temperature_fds: Optional[Dict[str, List[int]]] = None
+    self._battery_fds = (None, None, None)
+
+  # *** device ***
+
+  @staticmethod
+  def _find_temperature_sensors() -> Dict[str, List[int]]:
+    """Opens the inputs of the TEMPERATURE_SENSORS, from hwmon or thermal zones like psutil"""
+    sensors: Dict[str, List[int]] = {}
+    for hwmon in sorted(glob.glob("/sys/class/hwmon/hwmon*")):
+      name = _read_once(os.path.join(hwmon, "name"))
+      if name in TEMPERATURE_SENSORS:
+        inputs = sorted(glob.glob(os.path.join(hwmon, "temp*_input")) or glob.glob(os.path.join(hwmon, "device/temp*_input")))
+        sensors.setdefault(name, []).extend(fd for fd in map(_open, inputs) if fd is not None)
+    if not sensors:
+      for zone in sorted(glob.glob("/sys/class/thermal/thermal_zone*")):
+        name = _read_once(os.path.join(zone, "type"))
+        if name in TEMPERATURE_SENSORS:
+          fd = _open(os.path.join(zone, "temp"))
+          if fd is not None:
+            sensors.setdefault(name, []).append(fd)
+    return sensors
+
+  @staticmethod
+  def _find_battery():
+    """Opens the capacity and status of the battery and the online of the AC power supply"""
+    capacity = status = online = None
+    for supply in sorted(glob.glob("/sys/class/power_supply/*")):
+      supply_type = _read_once(os.path.join(supply, "type"))
+      if supply_type == "Battery" and capacity is None:
+        capacity = _open(os.path.join(supply, "capacity"))
+        status = _open(os.path.join(supply, "status"))
+      elif supply_type == "Mains" and online is None:
+        online = _open(os.path.join(supply, "online"))
+    return capacity, status, online
+
+  def cpu_times(self) -> List[CPUTimes]:
+    """Returns the times of each cpu in seconds, like psutil.cpu_times(percpu=True)"""
+    times = []
+    for line in _read(self._stat_fd).split(b"\n")[1:]:
+      if not line.startswith(b"cpu"):
+        break
+      times.append(CPUTimes(*(int(v) / CLOCK_TICKS for v in line.split()[1:8])))
+    return times
+
+  def meminfo(self) -> MemInfo:
+    """Returns the memory stats in bytes, like psutil.virtual_memory()"""
+    data = _read(self._meminfo_fd)
+    total, free, buffers, cached, reclaimable, active, inactive, shared = (_meminfo_field(data, key) for key in (
+      b"MemTotal:", b"MemFree:", b"Buffers:", b"Cached:", b"SReclaimable:", b"Active:", b"Inactive:", b"Shmem:"))
+    available = _meminfo_field(data, b"MemAvailable:", free + cached + reclaimable)
+    return MemInfo(total, free, available, buffers, cached + reclaimable, active, inactive, shared)
+
+  def cpu_percent(self) -> List[float]:
+    """Returns the usage of each cpu since the previous call, like psutil.cpu_percent(percpu=True)"""
+    times = self.cpu_times()
+    last, self._last_cpu_times = self._last_cpu_times, times
+    if last is None or len(last) != len(times):
+      return [0.] * len(times)
+
+    usage = []
+    for t0, t1 in zip(last, times):
+      total = sum(t1) - sum(t0)
+      busy = total - (t1.idle - t0.idle) - (t1.iowait - t0.iowait)
+      usage.append(round(100. * busy / total, 1) if total > 0 else 0.)
+    return usage
+
+  def temperatures(self) -> Dict[str, List[float]]:
+    """Returns the temperatures of the TEMPERATURE_SENSORS in °C"""
+    temps = {}
+    for name, fds in (self._temperature_fds or {}).items():
+      temps[name] = []
+      for fd in fds:
+        try:
+          temps[name].append(int(_read(fd)) / 1000.)
+        except (OSError, ValueError):
+          pass
+    return temps
+
+  def battery(self):
+    """Returns the battery percent and whether the device is plugged in, None for both without a battery"""
+    capacity_fd, status_fd, online_fd = self._battery_fds
+    if capacity_fd is None:
+      return None, None
+    try:
+      percent = int(_read(capacity_fd))
+      if online_fd is not None:
+        plugged = int(_read(online_fd)) == 1
+      else:
+        plugged = status_fd is not None and _read(status_fd).strip() != b"Discharging"
+    except (OSError, ValueError):
+      return None, None
+    return percent, plugged
+
+  def sample_device(self) -> DeviceSample:
+    if self._temperature_fds is None:
+      self._temperature_fds = self._find_temperature_sensors()
+      self._battery_fds = self._find_battery()
+    battery_percent, power_plugged = self.battery()
+    mem = self.meminfo()
+    memory_percent = 100. * (mem.total - mem.available) / mem.total if mem.total else 0.
+    return DeviceSample(self.cpu_percent(), memory_percent, self.temperatures(), battery_percent, power_plugged)
+
+  # *** processes ***
+
+  def sample_process(self, pid: int) -> Optional[ProcessSample]:
+    """Returns the vitals of pid, cpu_percent is the usage since its previous sample, None if it's gone"""
+    proc = self._procs.get(pid)
+    try:
+      if proc is None:
+        proc = self._procs[pid] = _Process(pid)
+      stat = _read(proc.stat_fd)
+    except OSError:
+      self.forget(pid)
+      return None
+
+    # the name is in parentheses and can contain spaces
+    name_end = stat.rindex(b")")
+    name = stat[stat.index(b"(") + 1:name_end].decode(errors="replace")
+    fields = stat[name_end + 2:].split()
+    # fields[0] is field 3 of proc(5)
+    utime, stime = int(fields[11]) / CLOCK_TICKS, int(fields[12]) / CLOCK_TICKS
+    rss = int(fields[21]) * PAGE_SIZE
+
+    now = time.monotonic()
+    cpu = utime + stime
+    cpu_percent = 0.
+    if proc.last_cpu is not None and now > proc.last_time:
+      cpu_percent = 100. * (cpu - proc.last_cpu) / (now - proc.last_time)
+    proc.last_cpu, proc.last_time = cpu, now
+
+    try:
+      affinity = sorted(os.sched_getaffinity(pid))
+    except OSError:
+      affinity = []
+
+    return ProcessSample(
+      pid=pid,
+      name=name,
+      status=PROC_STATUS.get(fields[0].decode(), fields[0].decode()),
+      ppid=int(fields[1]),
+      priority=int(fields[15]),
+      nice=int(fields[16]),
+      num_threads=int(fields[17]),
+      create_time=self.boot_time + int(fields[19]) / CLOCK_TICKS,
+      cpu_user=utime,
+      cpu_system=stime,
+      cpu_percent=cpu_percent,
+      memory_vms=int(fields[20]),
+      memory_rss=rss,
+      memory_percent=100. * rss / self.mem_total if self.mem_total else 0.,
+      processor=int(fields[36]),
+      cpu_affinity=affinity,
+      cmdline=proc.cmdline,
+      exe=proc.exe,
+    )
+
+  def sample_processes(self, pids) -> Dict[int, ProcessSample]:
+    """Samples pids in one pass, processes that are gone are left out and forgotten"""
+    pids = set(pids)
+    for pid in list(self._procs):
+      if pid not in pids:
+        self.forget(pid)
+    samples = {}
+    for pid in pids:
+      sample = self.sample_process(pid)
+      if sample is not None:
+        samples[pid] = sample
+    return samples
+
+  def forget(self, pid: int):
+    proc = self._procs.pop(pid, None)
+    if proc is not None:
+      proc.close()
+
+  def close(self):
+    for pid in list(self._procs):
+      self.forget(pid)
+    fds = [self._stat_fd, self._meminfo_fd, *self._battery_fds]
+    fds += [fd for sensor_fds in (self._temperature_fds or {}).values() for fd in sensor_fds]
+    for fd in fds:
+      if fd is not None:
+        os.close(fd)
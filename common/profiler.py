@@ -1,46 +1,170 @@
 # hard-forked from https://github.com/commaai/openpilot/tree/05b37552f3a38f914af41f44ccc7c633ad152a15/selfdrive/common/profiler.py
 import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set
+
+# latency histogram buckets, 10us to ~10s, each 25% wider than the previous one
+BUCKET_BOUNDS: List[float] = [1e-5 * 1.25 ** i for i in range(63)]
+# spans are exported to statsd this often
+EXPORT_INTERVAL = 10.
+PERCENTILES = (0.5, 0.99)
+
+
+class Histogram:
+  """Latency histogram with fixed buckets. Adding a value is a bisect and an increment,
+  percentiles are the upper bound of their bucket so they are at most 25% high."""
+  __slots__ = ("counts", "count", "total", "max")
+
+  def __init__(self):
+    self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+    self.reset()
+
+  def reset(self):
+    for i in range(len(self.counts)):
+      self.counts[i] = 0
+    self.count = 0
+    self.total = 0.
+    self.max = 0.
+
+  def add(self, dt: float):
+    self.counts[bisect_left(BUCKET_BOUNDS, dt)] += 1
+    self.count += 1
+    self.total += dt
+    if dt > self.max:
+      self.max = dt
+
+  def percentile(self, p: float) -> float:
+    if self.count == 0:
+      return 0.
+    rank = p * self.count
+    seen = 0
+    for i, n in enumerate(self.counts):
+      seen += n
+      if seen >= rank and n > 0:
+        return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+    return self.max
+
+  @property
+  def mean(self) -> float:
+    return self.total / self.count if self.count else 0.
+
+
+class Span:
+  """Times the code in a with block into the histogram of its name"""
+  __slots__ = ("hist", "start")
+
+  def __init__(self, hist: Histogram):
+    self.hist = hist
+    self.start = 0.
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    self.hist.add(time.perf_counter() - self.start)
+
+
+class _NoSpan:
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    pass
+
+
+_NO_SPAN = _NoSpan()
+
 
 class Profiler():
-  def __init__(self, enabled=False):
+  """Latency histograms of named spans of a loop, exported to statsd every export_interval seconds.
+
+  Spans are timed with `with prof.span(name):` or between two checkpoint() calls. tick() is called
+  once per loop iteration, it records the sum of the checkpoints that aren't ignored as the "total"
+  span and exports the p50, p99, max, mean and count of every span since the previous export as
+  gauges named <name>.<span>.<stat>. Cheap enough to be left enabled in a 100 Hz loop.
+  """
+  def __init__(self, enabled=False, name="profiler", export_interval: Optional[float] = EXPORT_INTERVAL):
     self.enabled = enabled
-    self.cp = {}
-    self.cp_ignored = []
-    self.iter = 0
-    self.start_time = time.time()
-    self.last_time = self.start_time
-    self.tot = 0.
+    self.name = name
+    self.export_interval = export_interval
+    self.spans: Dict[str, Histogram] = {}
+    self._spans: Dict[str, Span] = {}
+    self.reset(enabled)
 
   def reset(self, enabled=False):
     self.enabled = enabled
-    self.cp = {}
-    self.cp_ignored = []
+    for hist in self.spans.values():
+      hist.reset()
+    self.cp_ignored: Set[str] = set()
     self.iter = 0
-    self.start_time = time.time()
-    self.last_time = self.start_time
+    self.last_time = time.perf_counter()
+    self.cycle_time = 0.
+    self.last_export = time.monotonic()
+
+  def histogram(self, name: str) -> Histogram:
+    hist = self.spans.get(name)
+    if hist is None:
+      hist = self.spans[name] = Histogram()
+    return hist
+
+  def span(self, name: str):
+    if not self.enabled:
+      return _NO_SPAN
+    span = self._spans.get(name)
+    if span is None:
+      span = self._spans[name] = Span(self.histogram(name))
+    return span
 
   def checkpoint(self, name, ignore=False):
     # ignore flag needed when benchmarking threads with ratekeeper
     if not self.enabled:
       return
-    tt = time.time()
-    if name not in self.cp:
-      self.cp[name] = 0.
+    tt = time.perf_counter()
+    hist = self.spans.get(name)
+    if hist is None:
+      hist = self.histogram(name)
       if ignore:
-        self.cp_ignored.append(name)
-    self.cp[name] += tt - self.last_time
-    if not ignore:
-      self.tot += tt - self.last_time
+        self.cp_ignored.add(name)
+    hist.add(tt - self.last_time)
+    if name not in self.cp_ignored:
+      self.cycle_time += tt - self.last_time
     self.last_time = tt
 
-  def display(self):
+  def tick(self):
+    """Ends a loop iteration"""
     if not self.enabled:
       return
     self.iter += 1
+    if self.cycle_time > 0.:
+      self.histogram("total").add(self.cycle_time)
+      self.cycle_time = 0.
+
+    if self.export_interval is not None and time.monotonic() - self.last_export > self.export_interval:
+      self.export()
+
+  def export(self):
+    """Sends the stats of the spans since the last export to statsd and starts new histograms"""
+    from selfdrive.statsd import statlog
+    for span, hist in self.spans.items():
+      if hist.count == 0:
+        continue
+      prefix = f"{self.name}.{span}"
+      for p in PERCENTILES:
+        statlog.gauge(f"{prefix}.p{int(p * 100)}_ms", hist.percentile(p) * 1000.)
+      statlog.gauge(f"{prefix}.max_ms", hist.max * 1000.)
+      statlog.gauge(f"{prefix}.mean_ms", hist.mean * 1000.)
+      statlog.gauge(f"{prefix}.count", hist.count)
+      hist.reset()
+    self.last_export = time.monotonic()
+
+  def display(self):
+    if not self.enabled:
+      return
     print("******* Profiling %d *******" % self.iter)
-    for n, ms in sorted(self.cp.items(), key=lambda x: -x[1]):
-      if n in self.cp_ignored:
-        print("%30s: %9.2f  avg: %7.2f  percent: %3.0f   IGNORED" % (n, ms*1000.0, ms*1000.0/self.iter, ms/self.tot*100))
-      else:
-        print("%30s: %9.2f  avg: %7.2f  percent: %3.0f" % (n, ms*1000.0, ms*1000.0/self.iter, ms/self.tot*100))
-    print(f"Iter clock: {self.tot / self.iter:2.6f}   TOTAL: {self.tot:2.2f}")
+    for n, hist in sorted(self.spans.items(), key=lambda x: -x[1].total):
+      line = "%30s: p50: %7.2f  p99: %7.2f  max: %7.2f  avg: %7.2f" % (n, hist.percentile(0.5)*1000.0, hist.percentile(0.99)*1000.0,
+                                                                         hist.max*1000.0, hist.mean*1000.0)
+      print(line + ("   IGNORED" if n in self.cp_ignored else ""))
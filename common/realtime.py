@@ -3,9 +3,11 @@
 import gc
 import os
 import time
+import ctypes
 import multiprocessing
 from typing import Optional, List
 from common.clock import sec_since_boot
+from common.profiler import Profiler, EXPORT_INTERVAL
 from collections import deque
 from selfdrive.swaglog import cloudlog
 
@@ -16,6 +18,22 @@ DT_MDL = 0.05  # model
 DT_TRML = 0.5  # thermald and manager
 DT_DMON = 0.1
 
+# number of frames the average cycle time of lagging is over
+LAG_WINDOW = 100
+
+# linux/timerfd.h
+CLOCK_MONOTONIC = 1
+TFD_CLOEXEC = os.O_CLOEXEC
+TFD_TIMER_ABSTIME = 1
+
+
+class _TimeSpec(ctypes.Structure):
+  _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+class _ITimerSpec(ctypes.Structure):
+  _fields_ = [("it_interval", _TimeSpec), ("it_value", _TimeSpec)]
+
 
 class Priority:
   # CORE 2
@@ -50,17 +68,53 @@ def config_realtime_process(core: int, priority: int) -> None:
   set_core_affinity([core])
 
 
+class _TimerFD:
+  """Sleeps until absolute CLOCK_MONOTONIC deadlines with a timerfd, which doesn't oversleep like time.sleep"""
+  def __init__(self):
+    libc = ctypes.CDLL(None, use_errno=True)
+    self._settime = libc.timerfd_settime
+    self._spec = _ITimerSpec()
+    self.fd = libc.timerfd_create(CLOCK_MONOTONIC, TFD_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "timerfd_create failed")
+
+  def sleep_until(self, deadline: float) -> None:
+    sec = int(deadline)
+    self._spec.it_value.tv_sec = sec
+    self._spec.it_value.tv_nsec = int((deadline - sec) * 1e9)
+    if self._settime(self.fd, TFD_TIMER_ABSTIME, ctypes.byref(self._spec), None) < 0:
+      raise OSError(ctypes.get_errno(), "timerfd_settime failed")
+    os.read(self.fd, 8)
+
+
 class Ratekeeper:
-  def __init__(self, rate: float, print_delay_threshold: Optional[float] = 0.0) -> None:
-    """Rate in Hz for ratekeeping. print_delay_threshold must be nonnegative."""
+  def __init__(self, rate: float, print_delay_threshold: Optional[float] = 0.0, name: Optional[str] = None,
+               timerfd: bool = False) -> None:
+    """Rate in Hz for ratekeeping. print_delay_threshold must be nonnegative.
+
+    The cycle times and how late the missed deadlines were are recorded in histograms, which are exported
+    to statsd as <name>.ratekeeper.cycle.* and <name>.ratekeeper.late.* when a name is given.
+    With timerfd keep_time sleeps until the deadline of the frame with a timerfd instead of time.sleep."""
     self._interval = 1. / rate
     self._next_frame_time = sec_since_boot() + self._interval
     self._print_delay_threshold = print_delay_threshold
     self._frame = 0
     self._remaining = 0.0
     self._process_name =  multiprocessing.current_process().name
-    self._dts = deque([self._interval], maxlen=100)
+    self._dts = deque([self._interval], maxlen=LAG_WINDOW)
+    self._dts_sum = self._interval
+    self._lagging_dt = self._interval * (1 / 0.9)
     self._last_monitor_time = sec_since_boot()
+    self.stats = Profiler(True, f"{name}.ratekeeper", export_interval=EXPORT_INTERVAL if name is not None else None)
+    self._cycle_times = self.stats.histogram("cycle")
+    self._late = self.stats.histogram("late")
+
+    self._timer: Optional[_TimerFD] = None
+    if timerfd:
+      try:
+        self._timer = _TimerFD()
+      except (OSError, AttributeError) as e:
+        cloudlog.warning(f"can't create timerfd, sleeping with time.sleep instead: {e}")
 
   @property
   def frame(self) -> int:
@@ -72,29 +126,42 @@ class Ratekeeper:
 
   @property
   def lagging(self) -> bool:
-    avg_dt = sum(self._dts) / len(self._dts)
-    expected_dt = self._interval * (1 / 0.9)
-    return avg_dt > expected_dt
+    return self._dts_sum / len(self._dts) > self._lagging_dt
 
   # Maintain loop rate by calling this at the end of each loop
   def keep_time(self) -> bool:
     lagged = self.monitor_time()
     if self._remaining > 0:
-      time.sleep(self._remaining)
+      if self._timer is not None:
+        # monitor_time already moved on to the next frame
+        self._timer.sleep_until(self._next_frame_time - self._interval)
+      else:
+        time.sleep(self._remaining)
     return lagged
 
   # this only monitor the cumulative lag, but does not enforce a rate
   def monitor_time(self) -> bool:
     prev = self._last_monitor_time
     self._last_monitor_time = sec_since_boot()
-    self._dts.append(self._last_monitor_time - prev)
+    dt = self._last_monitor_time - prev
+    if len(self._dts) == LAG_WINDOW:
+      self._dts_sum -= self._dts[0]
+    self._dts.append(dt)
+    self._dts_sum += dt
+    if self._frame % LAG_WINDOW == 0:
+      # keeps the rounding errors of the running sum from adding up
+      self._dts_sum = sum(self._dts)
+    self._cycle_times.add(dt)
 
     lagged = False
     remaining = self._next_frame_time - sec_since_boot()
     self._next_frame_time += self._interval
+    if remaining < 0:
+      self._late.add(-remaining)
     if self._print_delay_threshold is not None and remaining < -self._print_delay_threshold:
       print(f"{self._process_name} lagging by {-remaining * 1000:.2f} ms")
       lagged = True
     self._frame += 1
     self._remaining = remaining
+    self.stats.tick()
     return lagged
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Time per call of interp and Interpolator on breakpoint tables like the ones looked up every control cycle"""
+import timeit
+
+import numpy as np
+
+from common.numpy_fast import interp, Interpolator
+
+N_CALLS = 20000
+
+
+def linear_interp(x, xp, fp):
+  # interp before it bisected
+  N = len(xp)
+
+  def get_interp(xv):
+    hi = 0
+    while hi < N and xv > xp[hi]:
+      hi += 1
+    low = hi - 1
+    return fp[-1] if hi == N and xv > xp[low] else (
+      fp[0] if hi == 0 else
+      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
+
+  return [get_interp(v) for v in x] if hasattr(x, '__iter__') else get_interp(x)
+
+
+def bench(name, f):
+  t = min(timeit.repeat(f, number=N_CALLS, repeat=5)) / N_CALLS
+  print(f"  {name:<28}{t * 1e6:8.2f} us")
+  return t
+
+
+if __name__ == "__main__":
+  for n in (2, 4, 17, 33):
+    xp = [float(i) for i in range(n)]
+    fp = [float(i * i) for i in range(n)]
+    f = Interpolator(xp, fp)
+    x = n * 0.75
+    print(f"{n} breakpoints, scalar")
+    base = bench("linear scan", lambda: linear_interp(x, xp, fp))
+    bench("interp (bisect)", lambda: interp(x, xp, fp))
+    t = bench("Interpolator", lambda: f(x))
+    print(f"  {'speedup':<28}{base / t:8.1f}x")
+
+    xs = list(np.linspace(-1, n, 100))
+    xs_arr = np.array(xs)
+    print(f"{n} breakpoints, 100 values")
+    base = bench("linear scan", lambda: linear_interp(xs, xp, fp))
+    bench("interp (bisect)", lambda: interp(xs, xp, fp))
+    t = bench("Interpolator.batch", lambda: f.batch(xs_arr))
+    print(f"  {'speedup':<28}{base / t:8.1f}x")
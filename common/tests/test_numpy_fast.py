@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+import numpy as np
+
+from common.numpy_fast import interp, Interpolator
+
+
+def linear_interp(x, xp, fp):
+  # the linear scan interp used to do
+  N = len(xp)
+  hi = 0
+  while hi < N and x > xp[hi]:
+    hi += 1
+  low = hi - 1
+  return fp[-1] if hi == N and x > xp[low] else (
+    fp[0] if hi == 0 else
+    (x - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
+
+
+class TestInterp(unittest.TestCase):
+  def test_interp(self):
+    random.seed(0)
+    for _ in range(500):
+      n = random.randint(1, 20)
+      xp = sorted(random.uniform(-10, 10) for _ in range(n))
+      fp = [random.uniform(-5, 5) for _ in range(n)]
+      f = Interpolator(xp, fp)
+      xs = [random.uniform(-12, 12) for _ in range(20)] + xp
+      for x in xs:
+        self.assertEqual(interp(x, xp, fp), linear_interp(x, xp, fp))
+        self.assertAlmostEqual(f(x), linear_interp(x, xp, fp), places=9)
+      self.assertEqual(interp(xs, xp, fp), [linear_interp(x, xp, fp) for x in xs])
+      np.testing.assert_allclose(f.batch(np.array(xs)), [linear_interp(x, xp, fp) for x in xs], atol=1e-9)
+
+  def test_interpolator_edges(self):
+    f = Interpolator([0., 10., 20.], [1., 2., 0.])
+    self.assertEqual(f(-1.), 1.)
+    self.assertEqual(f(0.), 1.)
+    self.assertEqual(f(5.), 1.5)
+    self.assertEqual(f(30.), 0.)
+    self.assertEqual(list(f([-1., 15., 30.])), [1., 1., 0.])
+    self.assertEqual(Interpolator([1.], [3.])(5.), 3.)
+    with self.assertRaises(ValueError):
+      Interpolator([], [])
+
+
+if __name__ == "__main__":
+  unittest.main()
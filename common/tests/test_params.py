@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from common.params import CachedParams, Params, UnknownKeyName
+
+
+def use_temp_params(test):
+  """Points Params to an empty store for the duration of test, the real one is never written"""
+  tmp = tempfile.TemporaryDirectory()
+  test.addCleanup(tmp.cleanup)
+  patcher = mock.patch.dict(os.environ, {"PARAMS_PATH": tmp.name})
+  patcher.start()
+  test.addCleanup(patcher.stop)
+  test.assertEqual(Params().get_param_path(), tmp.name)
+
+
+class TestParams(unittest.TestCase):
+  def setUp(self):
+    use_temp_params(self)
+
+  def test_many(self):
+    params = Params()
+    params.put_many({"DongleId": "many", "IsMetric": b"1"})
+    self.assertEqual(params.get("DongleId"), b"many")
+    self.assertEqual(params.get_many(["DongleId", "IsMetric"], encoding="utf8"), {"DongleId": "many", "IsMetric": "1"})
+
+    params.delete_many(["DongleId", "IsMetric"])
+    self.assertEqual(params.get_many(["DongleId", "IsMetric"]), {"DongleId": None, "IsMetric": None})
+
+  def test_many_unknown_key(self):
+    params = Params()
+    params.put("DongleId", "unchanged")
+    with self.assertRaises(UnknownKeyName):
+      params.put_many({"DongleId": "changed", "NotAParam": "1"})
+    with self.assertRaises(UnknownKeyName):
+      params.get_many(["DongleId", "NotAParam"])
+    self.assertEqual(params.get("DongleId"), b"unchanged")
+
+
+class TestCachedParams(unittest.TestCase):
+  def setUp(self):
+    use_temp_params(self)
+    self.params = Params()
+    self.params.put("DongleId", "cached")
+    self.cached = CachedParams()
+
+  def test_cached(self):
+    self.assertEqual(self.cached.get("DongleId", encoding="utf8"), "cached")
+    with mock.patch.object(self.cached.params, "get", side_effect=AssertionError("not cached")):
+      self.assertEqual(self.cached.get("DongleId"), b"cached")
+
+  def test_invalidated_by_other_writers(self):
+    self.assertEqual(self.cached.get("DongleId"), b"cached")
+    self.params.put("DongleId", "changed")
+    self.assertEqual(self.cached.get("DongleId"), b"changed")
+
+    self.params.delete("DongleId")
+    self.assertIsNone(self.cached.get("DongleId"))
+
+    Params().put("DongleId", "other")
+    self.assertEqual(self.cached.get("DongleId"), b"other")
+
+  def test_own_writes(self):
+    self.cached.put_bool("IsMetric", True)
+    self.assertTrue(self.cached.get_bool("IsMetric"))
+    self.cached.put_bool("IsMetric", False)
+    self.assertFalse(self.cached.get_bool("IsMetric"))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import os
+import time
+import unittest
+
+import psutil
+
+from common.proc_sampler import ProcSampler
+
+
+class TestProcSampler(unittest.TestCase):
+  def setUp(self):
+    self.sampler = ProcSampler()
+
+  def tearDown(self):
+    self.sampler.close()
+
+  def test_process(self):
+    p = psutil.Process(os.getpid())
+    p.cpu_percent()
+    self.sampler.sample_process(os.getpid())
+    t = time.monotonic()
+    while time.monotonic() - t < 0.2:
+      pass
+    sample = self.sampler.sample_process(os.getpid())
+
+    self.assertEqual(sample.status, p.status())
+    self.assertEqual(sample.ppid, p.ppid())
+    self.assertEqual(sample.nice, p.nice())
+    self.assertEqual(sample.num_threads, p.num_threads())
+    self.assertEqual(sample.cmdline, p.cmdline())
+    self.assertEqual(sample.exe, p.exe())
+    self.assertEqual(sample.cpu_affinity, p.cpu_affinity())
+    self.assertAlmostEqual(sample.create_time, p.create_time(), delta=0.1)
+    self.assertAlmostEqual(sample.memory_percent, p.memory_percent(), delta=1.)
+    # busy looping
+    self.assertAlmostEqual(sample.cpu_percent, p.cpu_percent(), delta=30.)
+    self.assertGreater(sample.cpu_percent, 50.)
+
+  def test_gone(self):
+    p = psutil.Popen(["true"])
+    self.assertIsNotNone(self.sampler.sample_process(p.pid))
+    p.wait()
+    self.assertIsNone(self.sampler.sample_process(p.pid))
+    self.assertEqual(self.sampler.sample_processes([os.getpid(), p.pid]).keys(), {os.getpid()})
+
+  def test_device(self):
+    psutil.cpu_percent(percpu=True)
+    self.sampler.sample_device()
+    time.sleep(0.1)
+    device = self.sampler.sample_device()
+    self.assertEqual(len(device.cpu_percent), len(psutil.cpu_percent(percpu=True)))
+    self.assertAlmostEqual(device.memory_percent, psutil.virtual_memory().percent, delta=2.)
+    self.assertEqual(len(self.sampler.cpu_times()), psutil.cpu_count())
+    for name, temps in device.temperatures.items():
+      self.assertEqual(len(temps), len(psutil.sensors_temperatures().get(name, [])))
+
+
+if __name__ == "__main__":
+  unittest.main()
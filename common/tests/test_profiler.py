@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import unittest
+
+from common.profiler import Histogram, Profiler
+
+
+class TestProfiler(unittest.TestCase):
+  def test_histogram(self):
+    hist = Histogram()
+    for _ in range(98):
+      hist.add(0.001)
+    hist.add(0.01)
+    hist.add(0.1)
+    self.assertEqual(hist.count, 100)
+    self.assertEqual(hist.max, 0.1)
+    # percentiles are within a bucket, 25% wide
+    self.assertTrue(0.001 <= hist.percentile(0.5) <= 0.00125)
+    self.assertTrue(0.01 <= hist.percentile(0.99) <= 0.0125)
+    self.assertEqual(hist.percentile(1.), 0.1)
+    hist.reset()
+    self.assertEqual(hist.percentile(0.5), 0.)
+
+  def test_spans(self):
+    prof = Profiler(True, "test", export_interval=None)
+    for _ in range(10):
+      prof.checkpoint("wait", ignore=True)
+      with prof.span("work"):
+        pass
+      prof.checkpoint("step")
+      prof.tick()
+    self.assertEqual({name: hist.count for name, hist in prof.spans.items()}, {"wait": 10, "work": 10, "step": 10, "total": 10})
+
+  def test_disabled(self):
+    prof = Profiler(False)
+    prof.checkpoint("step")
+    with prof.span("work"):
+      pass
+    prof.tick()
+    self.assertEqual(prof.spans, {})
+
+
+if __name__ == "__main__":
+  unittest.main()
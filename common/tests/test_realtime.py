@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+from common.realtime import LAG_WINDOW, Ratekeeper, sec_since_boot
+
+
+class TestRatekeeper(unittest.TestCase):
+  def _run(self, rk, dts):
+    t = rk._last_monitor_time
+    for dt in dts:
+      t += dt
+      with mock.patch("common.realtime.sec_since_boot", return_value=t):
+        rk.monitor_time()
+
+  def test_lagging(self):
+    rk = Ratekeeper(100, print_delay_threshold=None)
+    self._run(rk, [0.01] * LAG_WINDOW)
+    self.assertFalse(rk.lagging)
+    self._run(rk, [0.02] * (LAG_WINDOW // 4))
+    self.assertTrue(rk.lagging)
+    # the slow frames leave the window again
+    self._run(rk, [0.01] * LAG_WINDOW)
+    self.assertFalse(rk.lagging)
+    self.assertAlmostEqual(rk._dts_sum, sum(rk._dts))
+
+  def test_histograms(self):
+    rk = Ratekeeper(100, print_delay_threshold=None)
+    self._run(rk, [0.01] * 9 + [0.05])
+    cycle, late = rk.stats.spans["cycle"], rk.stats.spans["late"]
+    self.assertEqual(cycle.count, 10)
+    self.assertAlmostEqual(cycle.max, 0.05)
+    self.assertGreater(late.count, 0)
+
+  def test_timerfd(self):
+    rk = Ratekeeper(50, print_delay_threshold=None, timerfd=True)
+    self.assertIsNotNone(rk._timer)
+    first_deadline = rk._next_frame_time
+    armed = []
+
+    def sleep_until(deadline, sleep_until=rk._timer.sleep_until):
+      armed.append((rk.frame, deadline))
+      sleep_until(deadline)
+      # never wakes up before the deadline it armed
+      self.assertGreaterEqual(sec_since_boot(), deadline)
+
+    with mock.patch.object(rk._timer, "sleep_until", side_effect=sleep_until):
+      for _ in range(10):
+        rk.keep_time()
+
+    # the deadlines are absolute, the time spent between frames doesn't add up. Late frames don't sleep
+    self.assertGreater(len(armed), 0)
+    for frame, deadline in armed:
+      self.assertAlmostEqual(deadline, first_deadline + (frame - 1) * rk._interval, delta=1e-9)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Time to convert arrays of points with the batched transformations and with the numpy_wrap
+loops over the _single functions they replaced"""
+import timeit
+
+import numpy as np
+
+import common.transformations.coordinates as coord
+import common.transformations.orientation as orient
+from common.transformations import transformations as t
+from common.transformations.orientation import numpy_wrap
+
+SIZES = (1, 100, 100000)
+
+
+def bench(name, f, n):
+  number = max(1, 100000 // n)
+  return min(timeit.repeat(f, number=number, repeat=3)) / number
+
+
+if __name__ == "__main__":
+  np.random.seed(0)
+  n_max = max(SIZES)
+  eulers = np.random.uniform(-np.pi, np.pi, (n_max, 3))
+  geodetics = np.column_stack([np.random.uniform(-89, 89, n_max), np.random.uniform(-179, 179, n_max), np.zeros(n_max)])
+  ecefs = coord.geodetic2ecef(geodetics)
+  lc = coord.LocalCoord.from_geodetic(geodetics[0])
+
+  cases = [
+    ("euler2rot", numpy_wrap(t.euler2rot_single, (3,), (3, 3)), orient.euler2rot, eulers),
+    ("quat2euler", numpy_wrap(t.quat2euler_single, (4,), (3,)), orient.quat2euler, orient.euler2quat(eulers)),
+    ("rot2quat", numpy_wrap(t.rot2quat_single, (3, 3), (4,)), orient.rot2quat, orient.euler2rot(eulers)),
+    ("ecef2geodetic", numpy_wrap(t.ecef2geodetic_single, (3,), (3,)), coord.ecef2geodetic, ecefs),
+    ("LocalCoord.ecef2ned", lambda x: numpy_wrap(t.LocalCoord.ecef2ned_single, (3,), (3,))(lc, x), lc.ecef2ned, ecefs),
+  ]
+
+  print(f"{'':<22}{'points':>8}{'numpy_wrap':>14}{'batched':>14}{'speedup':>10}")
+  for name, wrapped, batched, inputs in cases:
+    for n in SIZES:
+      x = inputs[:n]
+      t_wrapped = bench(name, lambda: wrapped(x), n)
+      t_batched = bench(name, lambda: batched(x), n)
+      print(f"{name:<22}{n:>8}{t_wrapped * 1e6:>11.1f} us{t_batched * 1e6:>11.1f} us{t_wrapped / t_batched:>9.1f}x")
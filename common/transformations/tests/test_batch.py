@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import numpy as np
+import unittest
+
+import common.transformations.coordinates as coord
+import common.transformations.orientation as orient
+from common.transformations.orientation import numpy_wrap
+from common.transformations import transformations as t
+
+np.random.seed(0)
+EULERS = np.random.uniform(-np.pi, np.pi, (100, 3))
+QUATS = orient.euler2quat(EULERS)
+ROTS = orient.euler2rot(EULERS)
+GEODETICS = np.column_stack([np.random.uniform(-89, 89, 100), np.random.uniform(-179, 179, 100), np.random.uniform(-100, 3000, 100)])
+ECEFS = coord.geodetic2ecef(GEODETICS)
+NEDS = np.random.uniform(-1000, 1000, (100, 3))
+
+
+class TestBatch(unittest.TestCase):
+  def test_orientation(self):
+    for name, single, inputs in [("euler2quat", t.euler2quat_single, EULERS),
+                                 ("quat2euler", t.quat2euler_single, QUATS),
+                                 ("quat2rot", t.quat2rot_single, QUATS),
+                                 ("rot2quat", t.rot2quat_single, ROTS),
+                                 ("euler2rot", t.euler2rot_single, EULERS),
+                                 ("rot2euler", t.rot2euler_single, ROTS)]:
+      batched = getattr(orient, name)
+      expected = np.asarray([single(i) for i in inputs])
+      np.testing.assert_allclose(batched(inputs), expected, rtol=1e-12, atol=1e-12, err_msg=name)
+      np.testing.assert_allclose(batched(inputs[0]), expected[0], rtol=1e-12, atol=1e-12, err_msg=name)
+      np.testing.assert_allclose(batched(inputs[0].tolist()), expected[0], rtol=1e-12, atol=1e-12, err_msg=name)
+
+  def test_euler_ned(self):
+    for name, single in [("ned_euler_from_ecef", t.ned_euler_from_ecef_single),
+                         ("ecef_euler_from_ned", t.ecef_euler_from_ned_single)]:
+      expected = numpy_wrap(single, (3,), (3,))(ECEFS[0], EULERS)
+      np.testing.assert_allclose(getattr(orient, name)(ECEFS[0], EULERS), expected, rtol=1e-12, atol=1e-12, err_msg=name)
+
+  def test_coordinates(self):
+    np.testing.assert_allclose(coord.ecef2geodetic(ECEFS), numpy_wrap(t.ecef2geodetic_single, (3,), (3,))(ECEFS), rtol=1e-12)
+    np.testing.assert_allclose(coord.geodetic2ecef(GEODETICS), numpy_wrap(t.geodetic2ecef_single, (3,), (3,))(GEODETICS), rtol=1e-12)
+
+    lc = coord.LocalCoord.from_geodetic(GEODETICS[0])
+    for name, inputs in [("ecef2ned", ECEFS), ("ned2ecef", NEDS), ("geodetic2ned", GEODETICS), ("ned2geodetic", NEDS)]:
+      expected = numpy_wrap(getattr(t.LocalCoord, name + "_single"), (3,), (3,))(lc, inputs)
+      np.testing.assert_allclose(getattr(lc, name)(inputs), expected, rtol=1e-12, atol=1e-9, err_msg=name)
+
+  def test_shapes(self):
+    self.assertEqual(orient.euler2rot(EULERS.reshape(10, 10, 3)).shape, (10, 10, 3, 3))
+    self.assertEqual(orient.rot2quat(ROTS[:0]).shape, (0, 4))
+    # non contiguous and integer inputs are converted
+    np.testing.assert_allclose(coord.ecef2geodetic(ECEFS[::2]), coord.ecef2geodetic(ECEFS)[::2])
+    np.testing.assert_allclose(orient.euler2quat([0, 0, 0]), [1, 0, 0, 0])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -112,6 +112,146 @@ def ecef2geodetic_single(ecef):
     return [g.lat, g.lon, g.alt]
 
 
+# Batched forms of the functions above, they take the inputs as a C contiguous (N, ...) array of doubles
+# and loop over them without going back to python.
+
+cdef inline void store_vector3(double[:, ::1] out, Py_ssize_t i, Vector3 v):
+    out[i, 0] = v(0)
+    out[i, 1] = v(1)
+    out[i, 2] = v(2)
+
+cdef inline void store_quat(double[:, ::1] out, Py_ssize_t i, Quaternion q):
+    out[i, 0] = q.w()
+    out[i, 1] = q.x()
+    out[i, 2] = q.y()
+    out[i, 3] = q.z()
+
+cdef inline void store_matrix3(double[:, :, ::1] out, Py_ssize_t i, Matrix3 m):
+    cdef int r, c
+    for r in range(3):
+        for c in range(3):
+            out[i, r, c] = m(r, c)
+
+cdef inline Matrix3 load_matrix3(double[:, :, ::1] rot, Py_ssize_t i):
+    # Matrix3 takes its data in column major order
+    cdef double data[9]
+    cdef int r, c
+    for r in range(3):
+        for c in range(3):
+            data[c * 3 + r] = rot[i, r, c]
+    return Matrix3(data)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def euler2quat_batch(double[:, ::1] euler):
+    cdef Py_ssize_t i
+    out = np.empty((euler.shape[0], 4))
+    cdef double[:, ::1] o = out
+    for i in range(euler.shape[0]):
+        store_quat(o, i, euler2quat_c(Vector3(euler[i, 0], euler[i, 1], euler[i, 2])))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def quat2euler_batch(double[:, ::1] quat):
+    cdef Py_ssize_t i
+    out = np.empty((quat.shape[0], 3))
+    cdef double[:, ::1] o = out
+    for i in range(quat.shape[0]):
+        store_vector3(o, i, quat2euler_c(Quaternion(quat[i, 0], quat[i, 1], quat[i, 2], quat[i, 3])))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def quat2rot_batch(double[:, ::1] quat):
+    cdef Py_ssize_t i
+    out = np.empty((quat.shape[0], 3, 3))
+    cdef double[:, :, ::1] o = out
+    for i in range(quat.shape[0]):
+        store_matrix3(o, i, quat2rot_c(Quaternion(quat[i, 0], quat[i, 1], quat[i, 2], quat[i, 3])))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def rot2quat_batch(double[:, :, ::1] rot):
+    cdef Py_ssize_t i
+    out = np.empty((rot.shape[0], 4))
+    cdef double[:, ::1] o = out
+    for i in range(rot.shape[0]):
+        store_quat(o, i, rot2quat_c(load_matrix3(rot, i)))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def euler2rot_batch(double[:, ::1] euler):
+    cdef Py_ssize_t i
+    out = np.empty((euler.shape[0], 3, 3))
+    cdef double[:, :, ::1] o = out
+    for i in range(euler.shape[0]):
+        store_matrix3(o, i, euler2rot_c(Vector3(euler[i, 0], euler[i, 1], euler[i, 2])))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def rot2euler_batch(double[:, :, ::1] rot):
+    cdef Py_ssize_t i
+    out = np.empty((rot.shape[0], 3))
+    cdef double[:, ::1] o = out
+    for i in range(rot.shape[0]):
+        store_vector3(o, i, rot2euler_c(load_matrix3(rot, i)))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ecef_euler_from_ned_batch(ecef_init, double[:, ::1] ned_pose):
+    cdef ECEF init = list2ecef(ecef_init)
+    cdef Py_ssize_t i
+    out = np.empty((ned_pose.shape[0], 3))
+    cdef double[:, ::1] o = out
+    for i in range(ned_pose.shape[0]):
+        store_vector3(o, i, ecef_euler_from_ned_c(init, Vector3(ned_pose[i, 0], ned_pose[i, 1], ned_pose[i, 2])))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ned_euler_from_ecef_batch(ecef_init, double[:, ::1] ecef_pose):
+    cdef ECEF init = list2ecef(ecef_init)
+    cdef Py_ssize_t i
+    out = np.empty((ecef_pose.shape[0], 3))
+    cdef double[:, ::1] o = out
+    for i in range(ecef_pose.shape[0]):
+        store_vector3(o, i, ned_euler_from_ecef_c(init, Vector3(ecef_pose[i, 0], ecef_pose[i, 1], ecef_pose[i, 2])))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def geodetic2ecef_batch(double[:, ::1] geodetic):
+    cdef Geodetic g
+    cdef ECEF e
+    cdef Py_ssize_t i
+    out = np.empty((geodetic.shape[0], 3))
+    cdef double[:, ::1] o = out
+    for i in range(geodetic.shape[0]):
+        g.lat, g.lon, g.alt = geodetic[i, 0], geodetic[i, 1], geodetic[i, 2]
+        e = geodetic2ecef_c(g)
+        o[i, 0], o[i, 1], o[i, 2] = e.x, e.y, e.z
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ecef2geodetic_batch(double[:, ::1] ecef):
+    cdef ECEF e
+    cdef Geodetic g
+    cdef Py_ssize_t i
+    out = np.empty((ecef.shape[0], 3))
+    cdef double[:, ::1] o = out
+    for i in range(ecef.shape[0]):
+        e.x, e.y, e.z = ecef[i, 0], ecef[i, 1], ecef[i, 2]
+        g = ecef2geodetic_c(e)
+        o[i, 0], o[i, 1], o[i, 2] = g.lat, g.lon, g.alt
+    return out
+
+
 cdef class LocalCoord:
     cdef LocalCoord_c * lc
 
@@ -170,5 +310,65 @@ cdef class LocalCoord:
         cdef Geodetic g = self.lc.ned2geodetic(n)
         return [g.lat, g.lon, g.alt]
 
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ecef2ned_batch(self, double[:, ::1] ecef):
+        assert self.lc
+        cdef ECEF e
+        cdef NED n
+        cdef Py_ssize_t i
+        out = np.empty((ecef.shape[0], 3))
+        cdef double[:, ::1] o = out
+        for i in range(ecef.shape[0]):
+            e.x, e.y, e.z = ecef[i, 0], ecef[i, 1], ecef[i, 2]
+            n = self.lc.ecef2ned(e)
+            o[i, 0], o[i, 1], o[i, 2] = n.n, n.e, n.d
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ned2ecef_batch(self, double[:, ::1] ned):
+        assert self.lc
+        cdef NED n
+        cdef ECEF e
+        cdef Py_ssize_t i
+        out = np.empty((ned.shape[0], 3))
+        cdef double[:, ::1] o = out
+        for i in range(ned.shape[0]):
+            n.n, n.e, n.d = ned[i, 0], ned[i, 1], ned[i, 2]
+            e = self.lc.ned2ecef(n)
+            o[i, 0], o[i, 1], o[i, 2] = e.x, e.y, e.z
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def geodetic2ned_batch(self, double[:, ::1] geodetic):
+        assert self.lc
+        cdef Geodetic g
+        cdef NED n
+        cdef Py_ssize_t i
+        out = np.empty((geodetic.shape[0], 3))
+        cdef double[:, ::1] o = out
+        for i in range(geodetic.shape[0]):
+            g.lat, g.lon, g.alt = geodetic[i, 0], geodetic[i, 1], geodetic[i, 2]
+            n = self.lc.geodetic2ned(g)
+            o[i, 0], o[i, 1], o[i, 2] = n.n, n.e, n.d
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ned2geodetic_batch(self, double[:, ::1] ned):
+        assert self.lc
+        cdef NED n
+        cdef Geodetic g
+        cdef Py_ssize_t i
+        out = np.empty((ned.shape[0], 3))
+        cdef double[:, ::1] o = out
+        for i in range(ned.shape[0]):
+            n.n, n.e, n.d = ned[i, 0], ned[i, 1], ned[i, 2]
+            g = self.lc.ned2geodetic(n)
+            o[i, 0], o[i, 1], o[i, 2] = g.lat, g.lon, g.alt
+        return out
+
     def __dealloc__(self):
         del self.lc
@@ -2,7 +2,7 @@
 import cereal.messaging as messaging
 from cereal import log
 from common.realtime import set_realtime_priority
-from common.params import Params
+from common.params import CachedParams
 from common.conversions import Conversions as CV
 from common.transformations.camera import get_view_frame_from_road_frame
 from common.transformations.orientation import rot_from_euler, euler_from_rot
@@ -44,7 +44,7 @@ class Calibrator:
         self.idx = 0
         self.block_idx = 0
         self.v_ego = 0.0
-        self.params = Params()
+        self.params = CachedParams()
 
         self.rpy = None
         self.rpys = None
@@ -5,6 +5,7 @@ from common.basedir import BASEDIR
 from selfdrive.car.fingerprints import eliminate_incompatible_cars, all_legacy_fingerprint_cars
 from selfdrive.car.vin import get_vin, VIN_UNKNOWN
 from selfdrive.car.fw_versions import get_fw_versions, match_fw_to_car
+from selfdrive.car.manifest import get_brand, get_interface_names
 import cereal.messaging as messaging
 from selfdrive.car import gen_empty_fingerprint
 from selfdrive.swaglog import cloudlog
@@ -53,26 +54,20 @@ def load_interfaces(brand_names):
   return ret
 
 
-def _get_interface_names():
-  # read all the folders in selfdrive/car and return a dict where:
-  # - keys are all the car names that which we have an interface for
-  # - values are lists of spefic car models for a given car
-  brand_names = {}
-  for car_folder in [x[0] for x in os.walk(BASEDIR + '/selfdrive/car')]:
-    try:
-      brand_name = car_folder.split('/')[-1]
-      model_names = __import__(f'selfdrive.car.{brand_name}.values', fromlist=['CAR']).CAR
-      model_names = [getattr(model_names, c) for c in model_names.__dict__.keys() if not c.startswith("__")]
-      brand_names[brand_name] = model_names
-    except (ImportError, OSError):
-      pass
+class LazyInterfaces(dict):
+  """The (CarInterface, CarController, CarState) of each model. The modules of a brand are
+  only imported once one of its models is looked up."""
+  def __missing__(self, model):
+    brand = get_brand(model)
+    if brand is None:
+      raise KeyError(model)
+    self.update(load_interfaces({brand: interface_names[brand]}))
+    return self[model]
 
-  return brand_names
 
-
-# imports from directory selfdrive/car/<name>/
-interface_names = _get_interface_names()
-interfaces = load_interfaces(interface_names)
+# models of each brand in selfdrive/car/<name>/, from the prebuilt manifest
+interface_names = get_interface_names()
+interfaces = LazyInterfaces()
 
 
 # **** for use live only ****
@@ -1,6 +1,7 @@
 # hard-forked from https://github.com/commaai/openpilot/tree/05b37552f3a38f914af41f44ccc7c633ad152a15/selfdrive/car/fingerprints.py
 import os
 from common.basedir import BASEDIR
+from selfdrive.car.manifest import get_fingerprints, get_fw_versions
 
 
 def get_attr_from_cars(attr, result=dict, combine_brands=True):
@@ -35,8 +36,18 @@ def get_attr_from_cars(attr, result=dict, combine_brands=True):
   return result
 
 
-FW_VERSIONS = get_attr_from_cars('FW_VERSIONS')
-_FINGERPRINTS = get_attr_from_cars('FINGERPRINTS')
+def load_fw_versions():
+  # read from the manifest, matching FW versions doesn't import the values of any brand
+  return get_fw_versions()
+
+
+def __getattr__(name):
+  if name == 'FW_VERSIONS':
+    return load_fw_versions()
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_FINGERPRINTS = get_fingerprints()
 
 _DEBUG_ADDRESS = {1880: 8}   # reserved for debug purposes
 
@@ -73,7 +84,7 @@ def eliminate_incompatible_cars(msg, candidate_cars):
 
 def all_known_cars():
   """Returns a list of all known car strings."""
-  return list({*FW_VERSIONS.keys(), *_FINGERPRINTS.keys()})
+  return list({*load_fw_versions().keys(), *_FINGERPRINTS.keys()})
 
 
 def all_legacy_fingerprint_cars():
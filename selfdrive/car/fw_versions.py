@@ -8,7 +8,8 @@ from tqdm import tqdm
 
 import panda.python.uds as uds
 from cereal import car
-from selfdrive.car.fingerprints import FW_VERSIONS, get_attr_from_cars
+from selfdrive.car.fingerprints import load_fw_versions
+from selfdrive.car.manifest import get_fw_ecus
 from selfdrive.car.isotp_parallel_query import IsoTpParallelQuery
 from selfdrive.car.toyota.values import CAR as TOYOTA
 from selfdrive.swaglog import cloudlog
@@ -207,7 +208,7 @@ def match_fw_to_car_fuzzy(fw_versions_dict, log=True, exclude=None):
 
   # Build lookup table from (addr, subaddr, fw) to list of candidate cars
   all_fw_versions = defaultdict(list)
-  for candidate, fw_by_addr in FW_VERSIONS.items():
+  for candidate, fw_by_addr in load_fw_versions().items():
     if candidate == exclude:
       continue
 
@@ -245,7 +246,7 @@ def match_fw_to_car_exact(fw_versions_dict):
   essential the FW version can be missing to get a fingerprint, but if it's present it
   needs to match the database."""
   invalid = []
-  candidates = FW_VERSIONS
+  candidates = load_fw_versions()
 
   for candidate, fws in candidates.items():
     for ecu, expected_versions in fws.items():
@@ -294,23 +295,22 @@ def get_fw_versions(logcan, sendcan, bus, extra=None, timeout=0.1, debug=False,
   addrs = []
   parallel_addrs = []
 
-  versions = get_attr_from_cars('FW_VERSIONS', combine_brands=False)
+  ecus = get_fw_ecus()
   if extra is not None:
-    versions.update(extra)
-
-  for brand, brand_versions in versions.items():
-    for c in brand_versions.values():
-      for ecu_type, addr, sub_addr in c.keys():
-        a = (brand, addr, sub_addr)
-        if a not in ecu_types:
-          ecu_types[(addr, sub_addr)] = ecu_type
-
-        if sub_addr is None:
-          if a not in parallel_addrs:
-            parallel_addrs.append(a)
-        else:
-          if [a] not in addrs:
-            addrs.append([a])
+    ecus.update({brand: [ecu for c in brand_versions.values() for ecu in c.keys()] for brand, brand_versions in extra.items()})
+
+  for brand, brand_ecus in ecus.items():
+    for ecu_type, addr, sub_addr in brand_ecus:
+      a = (brand, addr, sub_addr)
+      if a not in ecu_types:
+        ecu_types[(addr, sub_addr)] = ecu_type
+
+      if sub_addr is None:
+        if a not in parallel_addrs:
+          parallel_addrs.append(a)
+      else:
+        if [a] not in addrs:
+          addrs.append([a])
 
   addrs.insert(0, parallel_addrs)
 
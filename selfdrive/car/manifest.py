@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Prebuilt manifest of the supported cars, so fingerprinting doesn't import the modules of every brand.
+
+It holds the models of each brand, their CAN fingerprints, their FW versions and the addresses of the
+ECUs queried for FW versions. Regenerate it with `python -m selfdrive.car.manifest` after changing a values.py.
+"""
+import os
+import json
+import importlib
+from functools import lru_cache
+
+from cereal import car
+from common.basedir import BASEDIR
+
+Ecu = car.CarParams.Ecu
+
+MANIFEST_PATH = os.path.join(BASEDIR, 'selfdrive/car/manifest.json')
+
+
+def get_brand_names():
+  """Returns the folders in selfdrive/car that have a values.py"""
+  car_dir = os.path.join(BASEDIR, 'selfdrive/car')
+  return sorted(d for d in os.listdir(car_dir) if os.path.isfile(os.path.join(car_dir, d, 'values.py')))
+
+
+def build_manifest():
+  """Builds the manifest from the values.py of every brand"""
+  ecu_names = {v: k for k, v in Ecu.schema.enumerants.items()}
+  manifest = {'brands': {}, 'fingerprints': {}, 'fw_ecus': {}, 'fw_versions': {}}
+
+  for brand in get_brand_names():
+    values = importlib.import_module(f'selfdrive.car.{brand}.values')
+    if not hasattr(values, 'CAR'):
+      continue
+    manifest['brands'][brand] = [getattr(values.CAR, c) for c in values.CAR.__dict__.keys() if not c.startswith("__")]
+
+    for model, fingerprints in getattr(values, 'FINGERPRINTS', {}).items():
+      # json keys are strings
+      manifest['fingerprints'][model] = [{str(addr): size for addr, size in sorted(f.items())} for f in fingerprints]
+
+    ecus = []
+    for model, fw_versions in getattr(values, 'FW_VERSIONS', {}).items():
+      manifest['fw_versions'][model] = []
+      for (ecu_type, addr, sub_addr), versions in fw_versions.items():
+        ecu = [ecu_names[ecu_type], addr, sub_addr]
+        if ecu not in ecus:
+          ecus.append(ecu)
+        # latin-1 maps every byte to one character, so the versions survive the round trip through json
+        manifest['fw_versions'][model].append(ecu + [[v.decode('latin-1') for v in versions]])
+    if len(ecus):
+      manifest['fw_ecus'][brand] = ecus
+
+  return manifest
+
+
+def write_manifest(path=MANIFEST_PATH):
+  manifest = build_manifest()
+  with open(path, 'w') as f:
+    json.dump(manifest, f, indent=1)
+    f.write('\n')
+
+
+@lru_cache(maxsize=None)
+def get_manifest():
+  with open(MANIFEST_PATH) as f:
+    return json.load(f)
+
+
+def get_interface_names():
+  """Returns the models of each brand"""
+  return {brand: list(models) for brand, models in get_manifest()['brands'].items()}
+
+
+@lru_cache(maxsize=None)
+def _model_brands():
+  return {model: brand for brand, models in get_manifest()['brands'].items() for model in models}
+
+
+def get_brand(model):
+  """Returns the brand of a model, None if it's unknown"""
+  return _model_brands().get(model)
+
+
+def get_fingerprints():
+  """Returns the CAN fingerprints of each model as in FINGERPRINTS of the values.py"""
+  return {model: [{int(addr): size for addr, size in f.items()} for f in fingerprints]
+          for model, fingerprints in get_manifest()['fingerprints'].items()}
+
+
+def get_fw_ecus():
+  """Returns the (ecu type, address, sub address) of the ECUs with FW versions of each brand"""
+  return {brand: [(getattr(Ecu, ecu_type), addr, sub_addr) for ecu_type, addr, sub_addr in ecus]
+          for brand, ecus in get_manifest()['fw_ecus'].items()}
+
+
+
+@lru_cache(maxsize=None)
+def get_fw_versions():
+  """Returns the FW versions of each model as in FW_VERSIONS of the values.py"""
+  return {model: {(getattr(Ecu, ecu_type), addr, sub_addr): [v.encode('latin-1') for v in versions]
+                  for ecu_type, addr, sub_addr, versions in fw_versions}
+          for model, fw_versions in get_manifest()['fw_versions'].items()}
+
+
+if __name__ == "__main__":
+  write_manifest()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import subprocess
+import sys
+import unittest
+
+from common.basedir import BASEDIR
+from selfdrive.car.fingerprints import get_attr_from_cars, load_fw_versions
+from selfdrive.car.manifest import build_manifest, get_manifest
+
+
+class TestManifest(unittest.TestCase):
+  def test_up_to_date(self):
+    self.assertEqual(get_manifest(), build_manifest(), "run python -m selfdrive.car.manifest to update the manifest")
+
+  def test_lazy_interfaces(self):
+    # only the brand of the looked up model is imported
+    code = "import sys; from selfdrive.car.car_helpers import interfaces; interfaces['mock']; " \
+           "print(','.join(sorted(m.split('.')[2] for m in sys.modules if m.endswith('.interface') and m.startswith('selfdrive.car.'))))"
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=BASEDIR, encoding='utf-8')
+    self.assertEqual(out.strip(), "mock")
+
+  def test_fw_versions(self):
+    self.assertEqual(load_fw_versions(), get_attr_from_cars('FW_VERSIONS'))
+
+    # matching FW versions reads them from the manifest, the toyota values are only imported for the
+    # models the matcher handles specially
+    code = "import sys; from selfdrive.car.fw_versions import match_fw_to_car; match_fw_to_car([]); " \
+           "print(','.join(sorted(m.split('.')[2] for m in sys.modules if m.endswith('.values') and m.startswith('selfdrive.car.'))))"
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=BASEDIR, encoding='utf-8')
+    self.assertEqual(out.strip(), "toyota")
+
+  def test_unknown_model(self):
+    from selfdrive.car.car_helpers import interfaces
+    with self.assertRaises(KeyError):
+      interfaces["NOT A CAR"]
+
+
+if __name__ == "__main__":
+  unittest.main()
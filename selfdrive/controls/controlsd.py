@@ -124,8 +124,7 @@ class Controls:
 
     # Write CarParams for radard
     cp_bytes = self.CP.to_bytes()
-    params.put("CarParams", cp_bytes)
-    params.put("CarParamsCache", cp_bytes)
+    params.put_many({"CarParams": cp_bytes, "CarParamsCache": cp_bytes})
 
     self.CC = car.CarControl.new_message()
     self.CS_prev = car.CarState.new_message()
@@ -187,8 +186,9 @@ class Controls:
       self.startup_event = None
 
     # controlsd is driven by can recv, expected at 100Hz
-    self.rk = Ratekeeper(100, print_delay_threshold=None)
-    self.prof = Profiler(False)  # off by default
+    self.rk = Ratekeeper(100, print_delay_threshold=None, name="controlsd")
+    # latency histograms of the steps of the loop, exported to statsd
+    self.prof = Profiler(True, "controlsd")
 
   def update_events(self, CS):
     """Compute carEvents from carState"""
@@ -807,7 +807,7 @@ class Controls:
     while True:
       self.step()
       self.rk.monitor_time()
-      self.prof.display()
+      self.prof.tick()
 
       # TODO: remove this after testing
       if self.i % 500 == 0:
@@ -2,7 +2,7 @@
 import numpy as np
 from cereal import log
 from common.filter_simple import FirstOrderFilter
-from common.numpy_fast import interp
+from common.numpy_fast import Interpolator
 from common.realtime import DT_MDL
 from selfdrive.swaglog import cloudlog
 
@@ -14,6 +14,12 @@ TRAJECTORY_SIZE = 33
 PATH_OFFSET = 0.00
 CAMERA_OFFSET = -0.06 # TODO: Make this user adjustable.
 
+# times the lane width is checked at
+WIDTH_CHECK_T = np.array([0.0, 1.5, 3.0])
+WIDTH_PROB = Interpolator([4.0, 5.0], [1.0, 0.0])
+STD_PROB = Interpolator([.15, .3], [1.0, 0.0])
+SPEED_LANE_WIDTH = Interpolator([0., 31.], [2.8, 3.5])
+
 
 class LanePlanner:
   def __init__(self, wide_camera=False):
@@ -62,17 +68,14 @@ class LanePlanner:
     path_xyz[:, 1] += self.path_offset
     l_prob, r_prob = self.lll_prob, self.rll_prob
     width_pts = self.rll_y - self.lll_y
-    prob_mods = []
-    for t_check in (0.0, 1.5, 3.0):
-      width_at_t = interp(t_check * (v_ego + 7), self.ll_x, width_pts)
-      prob_mods.append(interp(width_at_t, [4.0, 5.0], [1.0, 0.0]))
-    mod = min(prob_mods)
+    width_at_t = np.interp(WIDTH_CHECK_T * (v_ego + 7), self.ll_x, width_pts)
+    mod = float(WIDTH_PROB.batch(width_at_t).min())
     l_prob *= mod
     r_prob *= mod
 
     # Reduce reliance on uncertain lanelines
-    l_std_mod = interp(self.lll_std, [.15, .3], [1.0, 0.0])
-    r_std_mod = interp(self.rll_std, [.15, .3], [1.0, 0.0])
+    l_std_mod = STD_PROB(self.lll_std)
+    r_std_mod = STD_PROB(self.rll_std)
     l_prob *= l_std_mod
     r_prob *= r_std_mod
 
@@ -80,7 +83,7 @@ class LanePlanner:
     self.lane_width_certainty.update(l_prob * r_prob)
     current_lane_width = abs(self.rll_y[0] - self.lll_y[0])
     self.lane_width_estimate.update(current_lane_width)
-    speed_lane_width = interp(v_ego, [0., 31.], [2.8, 3.5])
+    speed_lane_width = SPEED_LANE_WIDTH(v_ego)
     self.lane_width = self.lane_width_certainty.x * self.lane_width_estimate.x + \
                       (1 - self.lane_width_certainty.x) * speed_lane_width
 
@@ -4,7 +4,7 @@ import numpy as np
 
 from cereal import log
 from common.filter_simple import FirstOrderFilter
-from common.numpy_fast import clip, interp
+from common.numpy_fast import clip, Interpolator
 from common.realtime import DT_CTRL
 from selfdrive.controls.lib.latcontrol import LatControl, MIN_STEER_SPEED
 
@@ -35,29 +35,29 @@ class LatControlINDI(LatControl):
     self.A_K = A - np.dot(K, C)
     self.x = np.array([[0.], [0.], [0.]])
 
-    self._RC = (CP.lateralTuning.indi.timeConstantBP, CP.lateralTuning.indi.timeConstantV)
-    self._G = (CP.lateralTuning.indi.actuatorEffectivenessBP, CP.lateralTuning.indi.actuatorEffectivenessV)
-    self._outer_loop_gain = (CP.lateralTuning.indi.outerLoopGainBP, CP.lateralTuning.indi.outerLoopGainV)
-    self._inner_loop_gain = (CP.lateralTuning.indi.innerLoopGainBP, CP.lateralTuning.indi.innerLoopGainV)
+    self._RC = Interpolator(CP.lateralTuning.indi.timeConstantBP, CP.lateralTuning.indi.timeConstantV)
+    self._G = Interpolator(CP.lateralTuning.indi.actuatorEffectivenessBP, CP.lateralTuning.indi.actuatorEffectivenessV)
+    self._outer_loop_gain = Interpolator(CP.lateralTuning.indi.outerLoopGainBP, CP.lateralTuning.indi.outerLoopGainV)
+    self._inner_loop_gain = Interpolator(CP.lateralTuning.indi.innerLoopGainBP, CP.lateralTuning.indi.innerLoopGainV)
 
     self.steer_filter = FirstOrderFilter(0., self.RC, DT_CTRL)
     self.reset()
 
   @property
   def RC(self):
-    return interp(self.speed, self._RC[0], self._RC[1])
+    return self._RC(self.speed)
 
   @property
   def G(self):
-    return interp(self.speed, self._G[0], self._G[1])
+    return self._G(self.speed)
 
   @property
   def outer_loop_gain(self):
-    return interp(self.speed, self._outer_loop_gain[0], self._outer_loop_gain[1])
+    return self._outer_loop_gain(self.speed)
 
   @property
   def inner_loop_gain(self):
-    return interp(self.speed, self._inner_loop_gain[0], self._inner_loop_gain[1])
+    return self._inner_loop_gain(self.speed)
 
   def reset(self):
     super().reset()
@@ -1,6 +1,6 @@
 # hard-forked from https://github.com/commaai/openpilot/tree/05b37552f3a38f914af41f44ccc7c633ad152a15/selfdrive/controls/lib/longcontrol.py
 from cereal import car
-from common.numpy_fast import clip, interp
+from common.numpy_fast import clip, interp, Interpolator
 from common.realtime import DT_CTRL
 from selfdrive.controls.lib.pid import PIDController
 from selfdrive.controls.lib.drive_helpers import CONTROL_N
@@ -58,6 +58,7 @@ class LongControl():
     self.pid = PIDController((CP.longitudinalTuning.kpBP, CP.longitudinalTuning.kpV),
                              (CP.longitudinalTuning.kiBP, CP.longitudinalTuning.kiV),
                              k_f = CP.longitudinalTuning.kf, rate=1 / DT_CTRL)
+    self.deadzone = Interpolator(CP.longitudinalTuning.deadzoneBP, CP.longitudinalTuning.deadzoneV)
     self.v_pid = 0.0
     self.last_output_accel = 0.0
 
@@ -71,13 +72,13 @@ class LongControl():
     # Interp control trajectory
     speeds = long_plan.speeds
     if len(speeds) == CONTROL_N:
-      v_target = interp(t_since_plan, T_IDXS[:CONTROL_N], speeds)
+      v_target, v_target_lower, v_target_upper = interp([t_since_plan,
+                                                         self.CP.longitudinalActuatorDelayLowerBound + t_since_plan,
+                                                         self.CP.longitudinalActuatorDelayUpperBound + t_since_plan],
+                                                        T_IDXS[:CONTROL_N], speeds)
       a_target = interp(t_since_plan, T_IDXS[:CONTROL_N], long_plan.accels)
 
-      v_target_lower = interp(self.CP.longitudinalActuatorDelayLowerBound + t_since_plan, T_IDXS[:CONTROL_N], speeds)
       a_target_lower = 2 * (v_target_lower - v_target) / self.CP.longitudinalActuatorDelayLowerBound - a_target
-
-      v_target_upper = interp(self.CP.longitudinalActuatorDelayUpperBound + t_since_plan, T_IDXS[:CONTROL_N], speeds)
       a_target_upper = 2 * (v_target_upper - v_target) / self.CP.longitudinalActuatorDelayUpperBound - a_target
       a_target = min(a_target_lower, a_target_upper)
 
@@ -110,7 +111,7 @@ class LongControl():
       # Toyota starts braking more when it thinks you want to stop
       # Freeze the integrator so we don't accelerate to compensate, and don't allow positive acceleration
       prevent_overshoot = not self.CP.stoppingControl and CS.vEgo < 1.5 and v_target_future < 0.7 and v_target_future < self.v_pid
-      deadzone = interp(CS.vEgo, self.CP.longitudinalTuning.deadzoneBP, self.CP.longitudinalTuning.deadzoneV)
+      deadzone = self.deadzone(CS.vEgo)
       freeze_integrator = prevent_overshoot
       
       error = self.v_pid - CS.vEgo
@@ -2,7 +2,7 @@
 import numpy as np
 from numbers import Number
 
-from common.numpy_fast import clip, interp
+from common.numpy_fast import clip, Interpolator
 
 
 class PIDController():
@@ -17,6 +17,9 @@ class PIDController():
       self._k_i = [[0], [self._k_i]]
     if isinstance(self._k_d, Number):
       self._k_d = [[0], [self._k_d]]
+    self._k_p = Interpolator(*self._k_p)
+    self._k_i = Interpolator(*self._k_i)
+    self._k_d = Interpolator(*self._k_d)
 
     self.pos_limit = pos_limit
     self.neg_limit = neg_limit
@@ -29,15 +32,15 @@ class PIDController():
 
   @property
   def k_p(self):
-    return interp(self.speed, self._k_p[0], self._k_p[1])
+    return self._k_p(self.speed)
 
   @property
   def k_i(self):
-    return interp(self.speed, self._k_i[0], self._k_i[1])
+    return self._k_i(self.speed)
 
   @property
   def k_d(self):
-    return interp(self.speed, self._k_d[0], self._k_d[1])
+    return self._k_d(self.speed)
 
   @property
   def error_integral(self):
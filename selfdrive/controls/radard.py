@@ -199,7 +199,7 @@ def radard_thread(sm=None, pm=None, can_sock=None):
 
   RI = RadarInterface(CP)
 
-  rk = Ratekeeper(1.0 / CP.radarTimeStep, print_delay_threshold=None)
+  rk = Ratekeeper(1.0 / CP.radarTimeStep, print_delay_threshold=None, name="radard")
   RD = RadarD(CP.radarTimeStep, RI.delay)
 
   while 1:
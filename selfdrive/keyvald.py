@@ -1,72 +1,241 @@
-import zmq  
+#!/usr/bin/env python3
+"""Serves the params to the UI app over zmq.
+
+The get, put and delete sockets of the single key protocol take [key], [key, value] and [key] from REQ
+clients and reply with the value, empty if it's missing, or b"1". The batch socket takes [op, *args]:
+[b"get", *keys] replies with the values of the keys, [b"put", key, value, ...] and [b"del", *keys]
+write in a single transaction and reply b"1", or b"0" if a key is unknown.
+
+The changes socket publishes [key, value] for every change of a subscribed key, by any process. The value
+is empty once deleted. Topics are matched by prefix like any zmq subscription, so a subscriber to CarParams
+also gets CarParamsCache and has to check the key of each message. The current value is sent when a
+subscription is made, to all the subscribers whose topics match it, so it isn't necessarily a change.
+
+Requests of all sockets are handed by a ROUTER broker to a pool of workers, so a slow write doesn't
+hold up the reads of the other clients.
+"""
+import os
+import zmq
 import threading
+from typing import Dict, List, Optional
+
 from cereal.messaging.utils import get_zmq_socket_path
-from common.params import Params
+from common.params import Params, UnknownKeyName
+from selfdrive.swaglog import cloudlog
+
+GET_PORT = "6001"
+PUT_PORT = "6002"
+DEL_PORT = "6003"
+BATCH_PORT = "6005"
+CHANGES_PORT = "6006"
+
+WORKERS = int(os.getenv("KEYVALD_WORKERS", "4"))
+WORKERS_ADDR = "inproc://keyvald-workers"
+# how often the subscribed keys are checked for changes by other processes, in ms
+CHANGES_POLL_INTERVAL = 100
+# how often the threads check whether they should exit, in ms
+EXIT_POLL_INTERVAL = 200
+
+READY = b"READY"
+OK = b"1"
+ERROR = b"0"
+
+
+class Op:
+    GET = b"get"
+    PUT = b"put"
+    DEL = b"del"
+
+
+def get_values(params, keys: List[bytes]) -> List[bytes]:
+    try:
+        values = params.get_many(keys)
+    except UnknownKeyName:
+        # unknown keys read as missing instead of failing the others
+        values = {}
+        for key in keys:
+            try:
+                values[key] = params.get(key)
+            except UnknownKeyName:
+                values[key] = None
+    return [values[key] or b"" for key in keys]
 
 
-ctx = zmq.Context()
-sock_get = ctx.socket(zmq.REP)
-sock_get.bind(get_zmq_socket_path("6001")) # get socket
-sock_put = ctx.socket(zmq.REP)
-sock_put.bind(get_zmq_socket_path("6002")) # put socket
-sock_del = ctx.socket(zmq.REP)
-sock_del.bind(get_zmq_socket_path("6003")) # del socket
+def handle_request(params, request: List[bytes]) -> List[bytes]:
+    """Runs an [op, *args] request, returns the frames of its reply"""
+    if not len(request):
+        return [ERROR]
+    op, args = request[0], request[1:]
+    try:
+        if op == Op.GET:
+            return get_values(params, args)
+        elif op == Op.PUT and len(args) % 2 == 0:
+            params.put_many(dict(zip(args[::2], args[1::2])))
+            return [OK]
+        elif op == Op.DEL:
+            params.delete_many(args)
+            return [OK]
+    except UnknownKeyName as e:
+        cloudlog.warning(f"keyvald: unknown key {e}")
+        return [ERROR]
+    cloudlog.warning(f"keyvald: invalid request {op!r} with {len(args)} args")
+    return [ERROR]
 
-params = Params()
 
 class ParamsServer:
-    exit_event = threading.Event()
-    threads = []
-
-    @staticmethod
-    def put_thread(exit_event):
-        while not exit_event.is_set():
-            key, val = sock_put.recv_multipart()
-            params.put(key, val)
-            sock_put.send(b"1")
-        
-    @staticmethod
-    def get_thread(exit_event):
-        while not exit_event.is_set():
-            key = sock_get.recv()
-            data = params.get(key)
-            sock_get.send(data if data is not None else b"")
-
-    @staticmethod
-    def delete_thread(exit_event):
-        while not exit_event.is_set():
-            key = sock_del.recv()
-            params.delete(key)
-            sock_del.send(b"1")
-    
-    @staticmethod 
-    def start():
-        ParamsServer.exit_event.clear()
-        if ParamsServer.threads:
+    def __init__(self, workers: int = WORKERS):
+        self.ctx = zmq.Context()
+        self.exit_event = threading.Event()
+        self.params = Params()
+        self.threads: List[threading.Thread] = []
+        self.num_workers = workers
+
+        # the op of the single key sockets, None for the batch socket whose requests start with their op
+        self.frontends = []
+        for port, op in ((GET_PORT, Op.GET), (PUT_PORT, Op.PUT), (DEL_PORT, Op.DEL), (BATCH_PORT, None)):
+            sock = self.ctx.socket(zmq.ROUTER)
+            sock.bind(get_zmq_socket_path(port))
+            self.frontends.append((sock, op))
+
+        self.backend = self.ctx.socket(zmq.ROUTER)
+        self.backend.bind(WORKERS_ADDR)
+        self.idle_workers: List[bytes] = []
+
+        self.changes = self.ctx.socket(zmq.XPUB)
+        # every subscription is passed on, so each new subscriber gets the current value
+        self.changes.setsockopt(zmq.XPUB_VERBOSE, 1)
+        self.changes.bind(get_zmq_socket_path(CHANGES_PORT))
+        self.subscribed: Dict[bytes, Optional[bytes]] = {}
+        self.change_counter = None
+
+        self.poller = zmq.Poller()
+        self.poller.register(self.backend, zmq.POLLIN)
+        self.poller.register(self.changes, zmq.POLLIN)
+
+    def worker(self):
+        params = Params()
+        sock = self.ctx.socket(zmq.REQ)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(WORKERS_ADDR)
+        sock.send(READY)
+        while not self.exit_event.is_set():
+            if not sock.poll(EXIT_POLL_INTERVAL):
+                continue
+            frontend, client, empty, *request = sock.recv_multipart()
+            try:
+                reply = handle_request(params, request)
+            except Exception:
+                cloudlog.exception("keyvald: request failed")
+                reply = [ERROR]
+            sock.send_multipart([frontend, client, empty] + reply)
+        sock.close()
+
+    def set_accepting(self, accepting: bool):
+        for sock, _ in self.frontends:
+            if accepting:
+                self.poller.register(sock, zmq.POLLIN)
+            else:
+                self.poller.unregister(sock)
+
+    def dispatch(self, idx: int):
+        sock, op = self.frontends[idx]
+        msg = sock.recv_multipart()
+        # requests of REQ clients are [client, b"", *request]
+        if len(msg) < 2 or msg[1] != b"":
             return
-        ParamsServer.threads.append(threading.Thread(target=ParamsServer.put_thread, args=(ParamsServer.exit_event,), daemon=True))
-        ParamsServer.threads.append(threading.Thread(target=ParamsServer.get_thread, args=(ParamsServer.exit_event,), daemon=True))
-        ParamsServer.threads.append(threading.Thread(target=ParamsServer.delete_thread, args=(ParamsServer.exit_event,), daemon=True))
-        
-        for thread in ParamsServer.threads:
+        request = msg[2:] if op is None else [op] + msg[2:]
+        worker = self.idle_workers.pop()
+        self.backend.send_multipart([worker, b"", bytes([idx]), msg[0], b""] + request)
+        if not len(self.idle_workers):
+            self.set_accepting(False)
+
+    def reply(self):
+        worker, _, *msg = self.backend.recv_multipart()
+        if not len(self.idle_workers):
+            self.set_accepting(True)
+        self.idle_workers.append(worker)
+        if msg[0] != READY:
+            frontend, client, empty, *reply = msg
+            self.frontends[frontend[0]][0].send_multipart([client, empty] + reply)
+
+    def subscription(self):
+        """Sends the current value of a newly subscribed key. XPUB can't address a single subscriber, so
+        the ones already subscribed to a matching topic get it again too"""
+        msg = self.changes.recv()
+        if not len(msg):
+            return
+        key = msg[1:]
+        if msg[0] == 0:
+            self.subscribed.pop(key, None)
+            return
+        try:
+            value = self.params.get(key)
+        except UnknownKeyName:
+            return
+        self.subscribed[key] = value
+        self.changes.send_multipart([key, value or b""])
+
+    def publish_changes(self):
+        counter = self.params.change_counter()
+        if counter == self.change_counter:
+            return
+        self.change_counter = counter
+        if not len(self.subscribed):
+            return
+        for key, value in self.params.get_many(list(self.subscribed)).items():
+            if value != self.subscribed[key]:
+                self.subscribed[key] = value
+                self.changes.send_multipart([key, value or b""])
+
+    def broker(self):
+        while not self.exit_event.is_set():
+            events = dict(self.poller.poll(CHANGES_POLL_INTERVAL))
+            if self.backend in events:
+                self.reply()
+            if self.changes in events:
+                self.subscription()
+            for idx, (sock, _) in enumerate(self.frontends):
+                if sock in events and len(self.idle_workers):
+                    self.dispatch(idx)
+            self.publish_changes()
+
+    def start(self):
+        self.exit_event.clear()
+        if self.threads:
+            return
+        self.threads.append(threading.Thread(target=self.broker, daemon=True))
+        for _ in range(self.num_workers):
+            self.threads.append(threading.Thread(target=self.worker, daemon=True))
+
+        for thread in self.threads:
             thread.start()
-            
-    @staticmethod 
-    def stop():
-        ParamsServer.exit_event.set()
-        ParamsServer.threads.clear()
-    
-    @staticmethod
-    def wait():
-        for thread in ParamsServer.threads:
+
+    def stop(self):
+        self.exit_event.set()
+        self.wait()
+        self.threads.clear()
+
+    def wait(self):
+        for thread in self.threads:
             thread.join()
-        
+
+    def close(self):
+        for sock, _ in self.frontends:
+            sock.close(linger=0)
+        self.backend.close(linger=0)
+        self.changes.close(linger=0)
+        self.ctx.term()
+
+
 def main():
+    server = ParamsServer()
     try:
-        ParamsServer.start()
-        ParamsServer.wait()
+        server.start()
+        server.wait()
     except KeyboardInterrupt:
-        ParamsServer.stop()
-          
+        server.stop()
+        server.close()
+
+
 if __name__ == "__main__":
     main()
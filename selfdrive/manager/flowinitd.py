@@ -7,16 +7,20 @@ import subprocess
 import os
 
 import psutil
-from common.params import Params, ParamKeyType
+from common.params import CachedParams, ParamKeyType
 from common.basedir import BASEDIR
 from common import system
 from common.path import external_android_storage
 import cereal.messaging as messaging
+from cereal import car
 
 from selfdrive.manager.daemon import Daemon, DaemonSig
 from selfdrive.manager.filelock import FileLock
-from selfdrive.manager.process import ensure_running
+from selfdrive.manager.process import ensure_running, PROFILE_STARTUP
 from selfdrive.manager.process_config import managed_processes
+from selfdrive.manager.startup_profile import StartupReport
+from selfdrive.manager.supervisor import Supervisor
+from selfdrive.manager.zygote import Zygote, ZYGOTE_PRELOAD, car_preload
 
 from selfdrive.version import is_dirty, get_commit, get_version, get_origin, get_short_branch, \
                               terms_version, training_version
@@ -35,7 +39,7 @@ ENV_VARS = ["USE_GPU", "ZMQ_MESSAGING_PROTOCOL", "ZMQ_MESSAGING_ADDRESS",
             "SIMULATION", "FINGERPRINT", "MSGQ", "PASSIVE"]
 UNREGISTERED_DONGLE_ID = "UnregisteredDevice"
 
-params = Params()
+params = CachedParams()
 
 def flowpilot_running():
     ret = False
@@ -85,18 +89,18 @@ def main():
                         ("WideCameraOnly", "1"),
                          ]
 
-        if params.get_bool("RecordFrontLock"):
-            params.put_bool("RecordFront", True)
+        startup_params = params.get_many(["RecordFrontLock", "DisableRadar_Allow"] + [k for k, _ in default_params])
+        to_put = {k: v for k, v in default_params if startup_params[k] is None}
 
-        if not params.get_bool("DisableRadar_Allow"):
+        if startup_params["RecordFrontLock"] == b"1":
+            to_put["RecordFront"] = "1"
+
+        if startup_params["DisableRadar_Allow"] != b"1":
             params.delete("DisableRadar")
         
         # android specififc
         if system.is_android():
-            if os.environ.get("USE_SNPE", None) == "1":
-                params.put_bool("UseSNPE", True)
-            else:
-                params.put_bool("UseSNPE", False)
+            to_put["UseSNPE"] = "1" if os.environ.get("USE_SNPE", None) == "1" else "0"
             
             # android app cannot access internal termux files, need to copy them over 
             # to external storage. rsync is used to copy only modified files.
@@ -105,25 +109,24 @@ def main():
             Path(external_android_flowpilot_assets_dir).mkdir(parents=True, exist_ok=True)
             subprocess.check_output(["rsync", "-r", "-u", internal_assets_dir, external_android_flowpilot_assets_dir])
 
-        for k, v in default_params:
-            if params.get(k) is None:
-                params.put(k, v)
-        
         # is this dashcam?
         if os.getenv("PASSIVE") is not None:
-            params.put_bool("Passive", bool(int(os.getenv("PASSIVE", "0"))))
+            to_put["Passive"] = "1" if int(os.getenv("PASSIVE", "0")) else "0"
+
+        # set version params
+        to_put.update({
+            "Version": get_version(),
+            "TermsVersion": terms_version,
+            "TrainingVersion": training_version,
+            "GitCommit": get_commit(default=""),
+            "GitBranch": get_short_branch(default=""),
+            "GitRemote": get_origin(default=""),
+        })
+        params.put_many(to_put)
 
         if params.get("Passive") is None:
             raise Exception("Passive must be set to continue")
 
-        # set version params
-        params.put("Version", get_version())
-        params.put("TermsVersion", terms_version)
-        params.put("TrainingVersion", training_version)
-        params.put("GitCommit", get_commit(default=""))
-        params.put("GitBranch", get_short_branch(default=""))
-        params.put("GitRemote", get_origin(default=""))
-
         if not is_dirty():
             os.environ['CLEAN'] = '1'
         
@@ -142,61 +145,137 @@ def main():
         sm = messaging.SubMaster(['deviceState', 'carParams'], poll=['deviceState'])
         pm = messaging.PubMaster(['managerState'])
 
-        ensure_running(managed_processes.values(), False, params=params, CP=sm['carParams'], not_run=ignore)
+        # python daemons are forked from a zygote that already imported the modules they share, including
+        # the brand of the last car since it is only known after fingerprinting
+        zygote = None
+        if os.getenv("USE_ZYGOTE") == "1":
+            try:
+                cached_cp = params.get("CarParamsCache")
+                car_name = car.CarParams.from_bytes(cached_cp).carName if cached_cp is not None else None
+                zygote = Zygote(ZYGOTE_PRELOAD + car_preload(car_name))
+            except OSError as e:
+                cloudlog.warning(f"zygote not available, starting processes normally: {e}")
+
+        # startup report of the processes, written once they are all ready and published
+        startup_report = StartupReport() if PROFILE_STARTUP else None
+
+        ensure_running(managed_processes.values(), False, params=params, CP=sm['carParams'], not_run=ignore, zygote=zygote)
         
+        supervisor = Supervisor(params.get_param_path())
+        # managerState is sent and deviceState checked this often, process exits and params are handled right away
+        state_interval = 2.
+        # readiness probes are checked this often while processes wait for others, or during startup,
+        # backing off up to max_ready_poll_interval while no process becomes ready
+        min_ready_poll_interval = 0.05
+        max_ready_poll_interval = 1.
+        ready_poll_interval = min_ready_poll_interval
+        startup_poll_time = 60.
+        last_ready_count = 0
+        # time from starting the onroad or offroad processes until all of them are ready
+        startup_time = time.monotonic()
+        last_started = False
+        all_ready = False
+        time_to_ready = None
+        next_state_time = 0.
+        params_changed = True
+        last_status = None
         try:
             while True:
-                sm.update()
+                sm.update(0)
+
+                for service in supervisor.reap(managed_processes.values()):
+                    stderr = service.handle_exit()
+                    cloudlog.warning(f"{service.name} exited with {service.exitcode}")
+                    if stderr is not None:
+                        stderr = stderr.decode("utf-8")
+                        print("%s%s\u001b[0m" % ("\u001b[31m", f"[{service.name}] " + stderr))
+                        if "KeyboardInterrupt" not in stderr:
+                            capture_error(stderr, level="error")
 
                 started = sm['deviceState'].started
-                ensure_running(managed_processes.values(), started, params=params, CP=sm['carParams'], not_run=ignore)
-
-                running_daemons = []
-                for service in managed_processes.values():
-                    if service.phandler is None:
-                        continue
-                    is_running = service.is_alive()
-                    if is_running:
-                        running_daemons.append("%s%s\u001b[0m" % ("\u001b[32m", service.name))
-                    else:
-                        running_daemons.append("%s%s\u001b[0m" % ("\u001b[31m", service.name))
-                        if service.communicated:
+                if zygote is not None:
+                    zygote.reap_orphans(p.proc.pid for p in managed_processes.values() if p.proc is not None)
+
+                running = ensure_running(managed_processes.values(), started, params=params, CP=sm['carParams'],
+                                         not_run=ignore, zygote=zygote)
+
+                if started != last_started:
+                    last_started = started
+                    startup_time = time.monotonic()
+                    ready_poll_interval = min_ready_poll_interval
+                    all_ready = False
+                    time_to_ready = None
+                    if startup_report is not None:
+                        startup_report.done = False
+                if not all_ready and all([p.is_ready(params) for p in running]):
+                    all_ready = True
+                    time_to_ready = time.monotonic() - startup_time
+                    cloudlog.event("processes ready", started=started, time_to_ready=time_to_ready)
+                    if zygote is not None:
+                        memory = zygote.memory_report(running)
+                        cloudlog.event("zygote memory", processes=memory,
+                                       shared=sum(m["rss"] - m["uss"] for m in memory.values()))
+                if startup_report is not None and not startup_report.done and \
+                   (startup_report.complete(running) or time.monotonic() - startup_time > startup_poll_time):
+                    startup_report.write(running, started, time_to_ready)
+
+                now = time.monotonic()
+                if now >= next_state_time:
+                    next_state_time = now + state_interval
+
+                    running_daemons = []
+                    for service in managed_processes.values():
+                        if service.phandler is None and service.exitcode is None:
                             continue
-                        stderr = service.communicate()
-                        if stderr is not None:
-                            stderr = stderr.decode("utf-8")
-                            print("%s%s\u001b[0m" % ("\u001b[31m", f"[{service.name}] " + stderr))
-                            if "KeyboardInterrupt" not in stderr:
-                                capture_error(stderr, level="error")
-                running_daemons.append("%s%s\u001b[0m" % ("\u001b[32m", "flowinitd"))
-                if flowpilot_running():
-                    running_daemons.append("%s%s\u001b[0m" % ("\u001b[32m", "modeld camerad sensord ui soundd"))
-
-                print(" ".join(running_daemons))
-                cloudlog.debug(running_daemons)
-
-                # send managerState
-                manager_state_msg = messaging.new_message('managerState')
-                manager_state_msg.managerState.processes = [p.get_process_state_msg() for p in managed_processes.values()]
-                pm.send('managerState', manager_state_msg)
+                        color = "\u001b[32m" if service.phandler is not None and service.is_alive() else "\u001b[31m"
+                        running_daemons.append("%s%s\u001b[0m" % (color, service.name))
+                    running_daemons.append("%s%s\u001b[0m" % ("\u001b[32m", "flowinitd"))
+                    if flowpilot_running():
+                        running_daemons.append("%s%s\u001b[0m" % ("\u001b[32m", "modeld camerad sensord ui soundd"))
+
+                    if running_daemons != last_status:
+                        last_status = running_daemons
+                        print(" ".join(running_daemons))
+                        cloudlog.debug(running_daemons)
+
+                    # send managerState
+                    manager_state_msg = messaging.new_message('managerState')
+                    manager_state_msg.managerState.processes = [p.get_process_state_msg() for p in managed_processes.values()]
+                    pm.send('managerState', manager_state_msg)
 
                 # Exit main loop when uninstall/shutdown/reboot is needed
-                shutdown = False
-                for param in ("DoUninstall", "DoShutdown", "DoReboot"):
-                    if params.get_bool(param):
-                        shutdown = True
-                        params.put("LastManagerExitReason", param)
-                        cloudlog.warning(f"Shutting down manager - {param} set")
-
-                if shutdown:
-                    break
-
-                time.sleep(2)
-                   
+                if params_changed:
+                    shutdown = False
+                    for param in ("DoUninstall", "DoShutdown", "DoReboot"):
+                        if params.get_bool(param):
+                            shutdown = True
+                            params.put("LastManagerExitReason", param)
+                            cloudlog.warning(f"Shutting down manager - {param} set")
+
+                    if shutdown:
+                        break
+
+                timeout = next_state_time - time.monotonic()
+                next_restart = supervisor.next_restart(managed_processes.values())
+                if next_restart is not None:
+                    timeout = min(timeout, next_restart - time.monotonic())
+                if any(p.waiting for p in running) or \
+                   (not all_ready and time.monotonic() - startup_time < startup_poll_time):
+                    ready_count = sum(p.ready_time is not None for p in running)
+                    if ready_count != last_ready_count:
+                        last_ready_count = ready_count
+                        ready_poll_interval = min_ready_poll_interval
+                    timeout = min(timeout, ready_poll_interval)
+                    ready_poll_interval = min(ready_poll_interval * 2, max_ready_poll_interval)
+                params_changed = supervisor.wait(timeout)
+
         except Exception as e:
             print(traceback.format_exc())
         finally:
             cloudlog.info("cleaning up..")
             params.put_bool("FlowinitReady", False)
             manager_cleanup()
+            supervisor.close()
+            if zygote is not None:
+                zygote.close()
             
\ No newline at end of file
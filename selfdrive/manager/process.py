@@ -1,18 +1,70 @@
 import os
+import time
 import subprocess
 import psutil
-from typing import Optional, List, ValuesView
+from typing import Callable, Optional, List, ValuesView
 
+from common.proc_sampler import ProcSampler
 from selfdrive.swaglog import cloudlog
 from cereal import log, car
+from cereal.messaging.utils import get_zmq_socket_path
+from selfdrive.manager.startup_profile import LAUNCH_TIME_ENV, profiled_command
 
 LOGPATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "logfiles")
 LOG_TO_FILES = os.getenv("LOG_TO_FILES")
+# python daemons are run under selfdrive.manager.startup_profile
+PROFILE_STARTUP = os.getenv("PROFILE_STARTUP") == "1"
+
+# a crashed process is restarted right away, and after RESTART_BACKOFF * 2^n seconds if it keeps crashing
+RESTART_BACKOFF = 0.5
+MAX_RESTART_BACKOFF = 30.
+# a process that ran for this long before crashing isn't considered to be crash looping
+STABLE_RUNTIME = 60.
+# processes that crashed this many times in a row stay stopped until they are stopped by ensure_running
+CRASH_LOOP_LIMIT = 8
+# processes that waited this long for their deps are started anyway
+DEPS_TIMEOUT = 30.
+
+
+_sampler: Optional[ProcSampler] = None
+
+
+def _proc_sampler() -> ProcSampler:
+    global _sampler
+    if _sampler is None:
+        _sampler = ProcSampler()
+    return _sampler
+
+
+def param_set(key: str) -> Callable:
+    """Readiness probe of a process that is ready once it wrote key to params"""
+    def probe(params) -> bool:
+        return params is not None and params.get(key) is not None
+    return probe
+
+
+def socket_bound(port: str) -> Callable:
+    """Readiness probe of a process that is ready once it bound the zmq ipc socket of port.
+    Other transports are considered ready as soon as the process runs"""
+    def probe(params) -> bool:
+        addr = get_zmq_socket_path(port)
+        if not addr.startswith("ipc://"):
+            return True
+        path = addr[len("ipc://"):]
+        try:
+            with open("/proc/net/unix") as f:
+                # the last column is the path, abstract sockets start with @
+                return any(line.split()[-1] == path for line in f if len(line.split()) == 8)
+        except OSError:
+            return True
+    return probe
+
 
 class ManagerProcess:
     def __init__(
         self, name: str, command: str, args: List[str]=[], enabled=True, onroad=True, offroad=False, 
-        callback=None, unkillable=False, platform=["android", "desktop"], rename=False, pipe_std=True):
+        callback=None, unkillable=False, platform=["android", "desktop"], rename=False, pipe_std=True,
+        deps: List[str]=[], ready: Optional[Callable]=None):
 
         self.name: str = name
         self.command: str = command
@@ -25,12 +77,29 @@ class ManagerProcess:
         self.platform = platform
         self.shell = rename
         self.pipe_std = pipe_std
+        # names of the processes that have to be ready before this one starts, and the probe
+        # called with params that tells when this one is ready. Without one it's ready once started
+        self.deps = deps
+        self.ready = ready
 
         self.phandler = None
         self.proc = None
+        self.pid = None
         self.exitcode = None
         self.communicated = False
 
+        # restart policy, see handle_exit
+        self.crashes = 0
+        self.start_time = 0.
+        self.restart_time = 0.
+        self.keep_stopped = False
+
+        self.ready_time = None
+        self.waiting = False
+        self.waiting_since = None
+        self.launch_time = None
+        self.profiled = False
+
         if rename:
           self.command = "LD_PRELOAD=libprocname.so " + self.command
     
@@ -51,10 +120,43 @@ class ManagerProcess:
             return stderr
         return None
  
-    def start(self):
-        """Starts the service"""
+    def handle_exit(self):
+        """Collects a service that exited on its own and returns its stderr. Crashed services are restarted
+        by the next start(), with an exponential backoff if they keep crashing"""
+        stderr = self.communicate()
+        self.exitcode = self.proc.returncode
+        self.phandler = None
+        self.proc = None
+        self.ready_time = None
+
+        if self.exitcode == 0:
+            # exited cleanly, stays stopped
+            self.keep_stopped = True
+            return stderr
+
+        now = time.monotonic()
+        if now - self.start_time > STABLE_RUNTIME:
+            self.crashes = 0
+        self.crashes += 1
+        backoff = RESTART_BACKOFF * 2 ** (self.crashes - 2) if self.crashes > 1 else 0.
+        self.restart_time = now + min(backoff, MAX_RESTART_BACKOFF)
+        if self.crashes >= CRASH_LOOP_LIMIT:
+            cloudlog.error(f"{self.name} crashed {self.crashes} times in a row, not restarting it")
+            self.keep_stopped = True
+        return stderr
+
+    def pending_restart(self):
+        """Returns the time a crashed service is restarted at, or None"""
+        if self.phandler is None and self.crashes > 0 and not self.keep_stopped:
+            return self.restart_time
+        return None
+
+    def start(self, zygote=None):
+        """Starts the service, forked from the zygote if there's one and the service is a python daemon"""
         if self.phandler is not None or not self.enabled:
             return
+        if self.keep_stopped or time.monotonic() < self.restart_time:
+            return
         cloudlog.info("Starting " + self.name)
 
         # pipe only stderr for sentry
@@ -69,14 +171,44 @@ class ManagerProcess:
             ) as stderr:
                 stdout, stderr = stdout, stderr
 
-        self.proc = subprocess.Popen(
-                    [self.command] + self.args, stdout=stdout, stderr=stderr, shell=self.shell
-                )
+        t = time.monotonic()
+        # profiled daemons aren't forked from the zygote, it would hide their imports
+        cmd = profiled_command(self.name, self.command, self.args) if PROFILE_STARTUP and not self.shell else None
+        self.profiled = cmd is not None
+        target = zygote.target(self.command) if zygote is not None and not self.shell and not self.profiled else None
+        if target is not None:
+            self.proc = zygote.spawn(self.name, target, self.args, stdout=stdout, stderr=stderr)
+        elif self.profiled:
+            env = dict(os.environ, **{LAUNCH_TIME_ENV: str(t)})
+            self.proc = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, env=env)
+        else:
+            self.proc = subprocess.Popen(
+                        [self.command] + self.args, stdout=stdout, stderr=stderr, shell=self.shell
+                    )
+        self.launch_time = time.monotonic() - t
+        cloudlog.event("process started", name=self.name, zygote=target is not None, profiled=self.profiled,
+                       launch_time=self.launch_time)
         self.pid = self.proc.pid
         self.phandler = psutil.Process(self.pid)
+        self.start_time = time.monotonic()
+        self.ready_time = None
+        self.communicated = False
+
+    def is_ready(self, params=None):
+        """True once the service runs and passed its readiness probe"""
+        if self.phandler is None:
+            return False
+        if self.ready_time is None and (self.ready is None or self.ready(params)):
+            self.ready_time = time.monotonic()
+            cloudlog.event("process ready", name=self.name, time_to_ready=self.ready_time - self.start_time)
+        return self.ready_time is not None
 
     def stop(self):
         """Handles how the service ends"""
+        # a stopped service gets a fresh restart policy the next time it should run
+        self.crashes = 0
+        self.restart_time = 0.
+        self.keep_stopped = False
         if self.phandler is None or self.unkillable:
           return
         if self.is_alive():
@@ -85,33 +217,42 @@ class ManagerProcess:
             self.proc.wait()
         self.phandler = None
         self.proc = None
+        self.ready_time = None
 
-    def get_proc_msg(self):
-        """Packages a Capn'Proto message for proc logs"""
+    def get_proc_msg(self, sampler: Optional[ProcSampler] = None):
+        """Packages a Capn'Proto message for proc logs. With a sampler shared by all the processes,
+        their vitals are read from /proc in one pass instead of with a psutil call each"""
         proc_msg = log.ProcLog.Process.new_message()
         if self.is_alive():
+            sample = (sampler if sampler is not None else _proc_sampler()).sample_process(self.pid)
+            if sample is None:
+                return proc_msg
             proc_msg.pid=self.pid
             proc_msg.name=self.name
-            proc_msg.state=self.phandler.status()
-            proc_msg.nice=self.phandler.nice()
-            proc_msg.numThreads=self.phandler.num_threads()
-            proc_msg.startTime=self.phandler.create_time()
-            proc_msg.processor=self.phandler.cpu_affinity()
-            proc_msg.cpuPercent=self.phandler.cpu_percent()
-            proc_msg.cpuTimes=self.phandler.cpu_times().user
-            proc_msg.memoryUsage=self.phandler.memory_percent()
-            proc_msg.cmdline=self.phandler.cmdline()
-            proc_msg.exe=self.phandler.exe()
+            proc_msg.state=sample.status
+            proc_msg.nice=sample.nice
+            proc_msg.numThreads=sample.num_threads
+            proc_msg.startTime=sample.create_time
+            proc_msg.processor=sample.cpu_affinity
+            proc_msg.cpuPercent=sample.cpu_percent
+            proc_msg.cpuTimes=sample.cpu_user
+            proc_msg.memoryUsage=sample.memory_percent
+            proc_msg.cmdline=sample.cmdline
+            proc_msg.exe=sample.exe
         return proc_msg
 
     def get_process_state_msg(self):
         state = log.ManagerState.ProcessState.new_message()
         state.name = self.name
-        if self.phandler:
+        state.pid = self.pid or 0
+        state.exitCode = self.exitcode or 0
+        if self.phandler is not None:
             state.running = self.is_alive()
-            state.shouldBeRunning = self.phandler is not None
-            state.pid = self.pid or 0
-            state.exitCode = self.exitcode or 0
+            state.shouldBeRunning = True
+        else:
+            # a crashed service should still run, while it waits for its restart and once it was
+            # kept stopped for crash looping. stop() resets crashes, a clean exit leaves exitcode 0
+            state.shouldBeRunning = self.crashes > 0 and self.exitcode != 0
         return state
 
 def manager_cleanup(services: List[ManagerProcess]):
@@ -121,10 +262,11 @@ def manager_cleanup(services: List[ManagerProcess]):
         service.stop()
 
 def ensure_running(procs: ValuesView[ManagerProcess], started: bool, params=None, CP: car.CarParams=None,
-                   not_run: Optional[List[str]]=None) -> List[ManagerProcess]:
+                   not_run: Optional[List[str]]=None, zygote=None) -> List[ManagerProcess]:
   if not_run is None:
     not_run = []
 
+  procs = list(procs)
   running = []
   for p in procs:
     # Conditions that make a process run
@@ -142,9 +284,27 @@ def ensure_running(procs: ValuesView[ManagerProcess], started: bool, params=None
     ))
 
     if run:
-      p.start()
       running.append(p)
     else:
+      p.waiting = False
+      p.waiting_since = None
       p.stop()
 
+  # processes start once the ones they depend on are ready, dependencies that won't run are ignored
+  by_name = {p.name: p for p in running}
+  now = time.monotonic()
+  for p in running:
+    if p.phandler is not None or all(by_name[d].is_ready(params) for d in p.deps if d in by_name):
+      p.waiting_since = None
+    elif p.waiting_since is None:
+      p.waiting_since = now
+    elif now - p.waiting_since > DEPS_TIMEOUT:
+      cloudlog.warning(f"{p.name} waited {DEPS_TIMEOUT}s for {p.deps} to be ready, starting it anyway")
+      p.waiting_since = None
+    p.waiting = p.waiting_since is not None
+
+  for p in running:
+    if p.phandler is None and not p.waiting:
+      p.start(zygote)
+
   return running
@@ -1,6 +1,6 @@
 from cereal import car
 from common.params import Params
-from selfdrive.manager.process import ManagerProcess
+from selfdrive.manager.process import ManagerProcess, param_set, socket_bound
 from common.system import is_android
 
 def driverview(started: bool, params: Params, CP: car.CarParams) -> bool:
@@ -23,7 +23,8 @@ def is_f3():
   #   platforms: ["android"]
 
 procs = [
-  ManagerProcess("controlsd", "controlsd"),
+  ManagerProcess("controlsd", "controlsd", ready=param_set("CarParams")),
+  # plannerd and radard read CarParams themselves, they load their modules while controlsd fingerprints
   ManagerProcess("plannerd", "plannerd"),
   ManagerProcess("radard", "radard"),
   ManagerProcess("calibrationd", "calibrationd"),
@@ -32,8 +33,9 @@ procs = [
   ManagerProcess("logmessaged", "logmessaged", offroad=True),
   ManagerProcess("thermald_", "thermald_", offroad=True),
   ManagerProcess("statsd", "statsd", offroad=True),
-  ManagerProcess("keyvald", "keyvald", offroad=True),
-  ManagerProcess("flowpilot", "./gradlew", args=["desktop:run"], rename=False, offroad=True, platform=["desktop"], pipe_std=False),
+  ManagerProcess("keyvald", "keyvald", offroad=True, ready=socket_bound("6001")),
+  ManagerProcess("flowpilot", "./gradlew", args=["desktop:run"], rename=False, offroad=True, platform=["desktop"], pipe_std=False,
+                 deps=["keyvald"]),
   ManagerProcess("pandad", "pandad", offroad=True),
   ManagerProcess("loggerd", "./selfdrive/loggerd/loggerd", enabled=True, onroad=False, callback=logging),
   ManagerProcess("uploader", "uploader", enabled=is_android(), offroad=True),
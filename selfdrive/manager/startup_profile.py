@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""Startup profiling of the managed processes, enabled with PROFILE_STARTUP=1 for the manager.
+
+The python daemons are then launched as `python -m selfdrive.manager.startup_profile run <name> <target> ...`,
+which times the import of every module and the first message the daemon publishes with a PubMaster, and
+writes them to <name>.json in STARTUP_PROFILE_DIR. The manager merges them with the time to ready of all
+processes into startup_report.json and a "startup report" event. Reports of two releases are compared with
+`python -m selfdrive.manager.startup_profile diff old.json new.json`.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import threading
+import importlib.abc
+from typing import Dict, List, Optional
+
+from common.file_helpers import atomic_write_in_dir, mkdirs_exists_ok
+
+STARTUP_PROFILE_DIR = os.getenv("STARTUP_PROFILE_DIR",
+                                os.path.join(os.path.dirname(os.path.realpath(__file__)), "startup_profile"))
+REPORT_NAME = "startup_report.json"
+# monotonic time the manager launched the process at
+LAUNCH_TIME_ENV = "STARTUP_PROFILE_LAUNCH_TIME"
+# daemons that didn't publish anything by then are reported without a time to first publish
+PUBLISH_TIMEOUT = 30.
+TOP_MODULES = 30
+
+
+class TimedLoader:
+    """Loader that times create_module and exec_module of the loader it wraps. Extension modules
+    are loaded and initialized in create_module, python modules run in exec_module"""
+
+    def __init__(self, loader, name: str, timer: "ImportTimer"):
+        self._loader = loader
+        self._name = name
+        self._timer = timer
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def _timed(self, func, arg):
+        self._timer.stack.append(0.)
+        t = time.perf_counter()
+        try:
+            return func(arg)
+        finally:
+            cumulative = time.perf_counter() - t
+            children = self._timer.stack.pop()
+            if len(self._timer.stack):
+                self._timer.stack[-1] += cumulative
+            else:
+                self._timer.total += cumulative
+            t_self, t_cumulative = self._timer.modules.get(self._name, (0., 0.))
+            self._timer.modules[self._name] = (t_self + cumulative - children, t_cumulative + cumulative)
+
+    def create_module(self, spec):
+        return self._timed(self._loader.create_module, spec)
+
+    def exec_module(self, module):
+        self._timed(self._loader.exec_module, module)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """Records the time spent importing each module, without and with the modules it imports"""
+
+    def __init__(self):
+        self.modules: Dict[str, tuple] = {}
+        self.stack: List[float] = []
+        self.total = 0.
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        # imports from other threads aren't timed, the stack is for the main thread
+        if threading.current_thread() is not threading.main_thread():
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = TimedLoader(spec.loader, fullname, self)
+                return spec
+        return None
+
+    def top(self, n: int = TOP_MODULES) -> List[list]:
+        """Returns the n modules that took the longest to import, as [name, self time, cumulative time]"""
+        modules = sorted(self.modules.items(), key=lambda m: -m[1][0])[:n]
+        return [[name, round(t_self, 6), round(t_cumulative, 6)] for name, (t_self, t_cumulative) in modules]
+
+
+class DaemonProfile:
+    """Profile of the daemon this process runs, written once it first publishes or after PUBLISH_TIMEOUT"""
+
+    def __init__(self, name: str, out_dir: str):
+        self.name = name
+        self.out_dir = out_dir
+        self.launch_time = float(os.getenv(LAUNCH_TIME_ENV, time.monotonic()))
+        self.wrapper_start = time.monotonic() - self.launch_time
+        self.timer = ImportTimer()
+        self.main_time = None
+        self._written = False
+        self._lock = threading.Lock()
+
+    def hook_publish(self):
+        """Records the first message sent with a PubMaster"""
+        import cereal.messaging as messaging
+        send = messaging.PubMaster.send
+
+        def first_send(pm, s, dat):
+            messaging.PubMaster.send = send
+            self.write(time.monotonic() - self.launch_time, s)
+            return send(pm, s, dat)
+        messaging.PubMaster.send = first_send
+
+        timeout = threading.Timer(PUBLISH_TIMEOUT, self.write)
+        timeout.daemon = True
+        timeout.start()
+
+    def write(self, time_to_first_publish: Optional[float] = None, service: Optional[str] = None):
+        with self._lock:
+            if self._written:
+                return
+            self._written = True
+
+        profile = {
+            "wrapper_start": self.wrapper_start,
+            "time_to_main": self.main_time,
+            "import_time": self.timer.total,
+            "imported_modules": len(self.timer.modules),
+            "time_to_first_publish": time_to_first_publish,
+            "first_service": service,
+            "modules": self.timer.top(),
+        }
+        mkdirs_exists_ok(self.out_dir)
+        with atomic_write_in_dir(os.path.join(self.out_dir, f"{self.name}.json"), overwrite=True) as f:
+            json.dump(profile, f)
+
+    def run(self, target: str, args: List[str]):
+        sys.argv = [self.name] + args
+        self.timer.install()
+        self.hook_publish()
+
+        module, func = target.split(":")
+        main = getattr(importlib.import_module(module), func)
+        self.main_time = time.monotonic() - self.launch_time
+        return main()
+
+
+def profiled_command(name: str, command: str, args: List[str]) -> Optional[List[str]]:
+    """Returns the command that runs the console script command under the profiler, None if it isn't one"""
+    from selfdrive.manager.zygote import console_scripts
+    target = console_scripts().get(command)
+    if target is None:
+        return None
+    return [sys.executable, "-m", "selfdrive.manager.startup_profile", "run", name, target] + args
+
+
+class StartupReport:
+    """Manager side, merges the profiles of the daemons with the launch and ready times of all processes"""
+
+    def __init__(self, out_dir: str = STARTUP_PROFILE_DIR):
+        self.out_dir = out_dir
+        self.done = False
+        mkdirs_exists_ok(out_dir)
+        for fn in os.listdir(out_dir):
+            if fn.endswith(".json") and fn != REPORT_NAME:
+                os.remove(os.path.join(out_dir, fn))
+
+    def _profile(self, name: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.out_dir, f"{name}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def complete(self, procs) -> bool:
+        """True once every running process is ready and every profiled one wrote its profile"""
+        return all(p.ready_time is not None and (not p.profiled or self._profile(p.name) is not None) for p in procs)
+
+    def write(self, procs, started: bool, time_to_ready: Optional[float]) -> dict:
+        from selfdrive.swaglog import cloudlog
+        from selfdrive.version import get_version, get_commit
+
+        processes = {}
+        for p in procs:
+            processes[p.name] = {
+                "launch_time": p.launch_time,
+                "time_to_ready": p.ready_time - p.start_time if p.ready_time is not None else None,
+                "python": self._profile(p.name) if p.profiled else None,
+            }
+        report = {
+            "version": get_version(),
+            "commit": get_commit(default=""),
+            "started": started,
+            "time_to_ready": time_to_ready,
+            "processes": processes,
+        }
+        with atomic_write_in_dir(os.path.join(self.out_dir, REPORT_NAME), overwrite=True) as f:
+            json.dump(report, f, indent=2)
+
+        summary = {}
+        for name, proc in processes.items():
+            summary[name] = {k: proc[k] for k in ("launch_time", "time_to_ready")}
+            if proc["python"] is not None:
+                summary[name].update({k: proc["python"][k] for k in ("import_time", "time_to_first_publish")})
+                summary[name]["top_modules"] = proc["python"]["modules"][:5]
+        cloudlog.event("startup report", started=started, time_to_ready=time_to_ready, processes=summary)
+        self.done = True
+        return report
+
+
+def _ms(t: Optional[float]) -> str:
+    return "-" if t is None else f"{t * 1000:.0f}"
+
+
+def _delta(a: Optional[float], b: Optional[float]) -> str:
+    return "" if a is None or b is None else f"{(b - a) * 1000:+.0f}"
+
+
+def diff_reports(old: dict, new: dict, threshold: float = 0.005) -> List[str]:
+    """Returns the lines comparing two startup reports, in ms. Modules whose self import time
+    changed by less than threshold seconds are left out"""
+    lines = [f"{old.get('version')} ({old.get('commit', '')[:8]}) -> {new.get('version')} ({new.get('commit', '')[:8]})",
+             f"time to ready: {_ms(old.get('time_to_ready'))} -> {_ms(new.get('time_to_ready'))} ms"]
+    fields = [("time_to_ready", None), ("import_time", "python"), ("time_to_first_publish", "python")]
+    lines.append(f"{'process':<16}" + "".join(f"{f:>34}" for f, _ in fields))
+    for name in sorted(set(old["processes"]) | set(new["processes"])):
+        o, n = old["processes"].get(name) or {}, new["processes"].get(name) or {}
+        line = f"{name:<16}"
+        for field, section in fields:
+            a = (o.get(section) or {}).get(field) if section else o.get(field)
+            b = (n.get(section) or {}).get(field) if section else n.get(field)
+            line += f"{_ms(a) + ' -> ' + _ms(b) + ' ' + _delta(a, b):>34}"
+        lines.append(line)
+
+        old_modules = {m[0]: m[1] for m in (o.get("python") or {}).get("modules", [])}
+        new_modules = {m[0]: m[1] for m in (n.get("python") or {}).get("modules", [])}
+        for module in sorted(set(old_modules) | set(new_modules)):
+            a, b = old_modules.get(module, 0.), new_modules.get(module, 0.)
+            if abs(b - a) >= threshold:
+                lines.append(f"    {module:<44}{_ms(a):>8} -> {_ms(b):>8} {_delta(a, b)}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup profiling of the managed processes")
+    subparsers = parser.add_subparsers(dest="cmd", required=True)
+    run = subparsers.add_parser("run", help="run a daemon under the profiler, used by the manager")
+    run.add_argument("name")
+    run.add_argument("target", help="module:function")
+    run.add_argument("args", nargs=argparse.REMAINDER)
+    diff = subparsers.add_parser("diff", help="compare two startup reports")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--threshold", type=float, default=5., help="smallest module import time change shown, in ms")
+    args = parser.parse_args()
+
+    if args.cmd == "run":
+        return DaemonProfile(args.name, STARTUP_PROFILE_DIR).run(args.target, args.args)
+
+    with open(args.old) as f_old, open(args.new) as f_new:
+        print("\n".join(diff_reports(json.load(f_old), json.load(f_new), args.threshold / 1000)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import os
+import ctypes
+import signal
+import selectors
+from typing import List, Optional, Iterable
+
+from selfdrive.manager.process import ManagerProcess
+from selfdrive.swaglog import cloudlog
+
+# inotify events of a file written, created or renamed into the watched directory
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+
+
+class DirWatcher:
+    """Watches a directory for changed files with inotify. fd is None where inotify isn't available."""
+
+    def __init__(self, path: str):
+        self.fd = None
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            if libc.inotify_add_watch(fd, path.encode(), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {path}")
+            self.fd = fd
+        except (OSError, AttributeError, TypeError) as e:
+            cloudlog.warning(f"can't watch {path}, polling it instead: {e}")
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class Supervisor:
+    """Sleeps until a child process exits or a file in watch_dir changes, instead of polling them.
+
+    Child exits are noticed through SIGCHLD, which is written to a pipe with signal.set_wakeup_fd,
+    so an exit between two waits still wakes the next one. Must be created in the main thread.
+    """
+
+    def __init__(self, watch_dir: Optional[str] = None):
+        self.selector = selectors.DefaultSelector()
+
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._old_wakeup_fd = signal.set_wakeup_fd(self._wakeup_w)
+        self._old_sigchld = signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+        self.watcher = DirWatcher(watch_dir) if watch_dir is not None else None
+        if self.watcher is not None and self.watcher.fd is not None:
+            self.selector.register(self.watcher.fd, selectors.EVENT_READ)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """Waits up to timeout seconds for a child to exit or watch_dir to change.
+        Returns True if watch_dir may have changed, which is always the case if it can't be watched."""
+        changed = self.watcher is not None and self.watcher.fd is None
+        for key, _ in self.selector.select(max(timeout, 0.) if timeout is not None else None):
+            if key.fileobj == self._wakeup_r:
+                try:
+                    while os.read(self._wakeup_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            else:
+                self.watcher.drain()
+                changed = True
+        return changed
+
+    @staticmethod
+    def reap(procs: Iterable[ManagerProcess]) -> List[ManagerProcess]:
+        """Returns the processes that exited since they were started. Only waitpid is used, no psutil."""
+        return [p for p in procs if p.proc is not None and p.proc.poll() is not None]
+
+    @staticmethod
+    def next_restart(procs: Iterable[ManagerProcess]) -> Optional[float]:
+        """Returns the monotonic time of the earliest pending restart of a crashed process."""
+        return min((t for t in (p.pending_restart() for p in procs) if t is not None), default=None)
+
+    def close(self):
+        signal.signal(signal.SIGCHLD, self._old_sigchld)
+        signal.set_wakeup_fd(self._old_wakeup_fd)
+        if self.watcher is not None:
+            self.watcher.close()
+        self.selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import time
+import unittest
+from unittest import mock
+
+import selfdrive.manager.process as process
+from selfdrive.manager.process import ManagerProcess, ensure_running, param_set
+
+
+def fake_start(self, zygote=None):
+  self.proc = mock.Mock(**{"poll.return_value": None})
+  self.phandler = mock.Mock()
+  self.start_time = time.monotonic()
+  self.ready_time = None
+
+
+class FakeParams(dict):
+  def get(self, key, *args, **kwargs):
+    return super().get(key)
+
+
+class TestEnsureRunning(unittest.TestCase):
+  def setUp(self):
+    patcher = mock.patch.object(ManagerProcess, "start", autospec=True, side_effect=fake_start)
+    self.start = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.params = FakeParams()
+
+    self.controlsd = ManagerProcess("controlsd", "controlsd", ready=param_set("CarParams"))
+    self.plannerd = ManagerProcess("plannerd", "plannerd", deps=["controlsd"])
+    self.radard = ManagerProcess("radard", "radard")
+    self.procs = [self.plannerd, self.controlsd, self.radard]
+
+  def _started(self):
+    return {call.args[0].name for call in self.start.call_args_list}
+
+  def test_waits_for_deps(self):
+    ensure_running(self.procs, True, params=self.params)
+    # processes without deps aren't held back by the others
+    self.assertEqual(self._started(), {"controlsd", "radard"})
+    self.assertTrue(self.plannerd.waiting)
+
+    ensure_running(self.procs, True, params=self.params)
+    self.assertEqual(self.start.call_count, 2)
+
+    self.params["CarParams"] = b"1"
+    running = ensure_running(self.procs, True, params=self.params)
+    self.assertEqual(self._started(), {"controlsd", "radard", "plannerd"})
+    self.assertFalse(self.plannerd.waiting)
+    self.assertIsNotNone(self.controlsd.ready_time)
+    self.assertEqual(running, self.procs)
+
+  def test_ready(self):
+    ensure_running(self.procs, True, params=self.params)
+    # without a probe a process is ready once it runs
+    self.assertTrue(self.radard.is_ready(self.params))
+    self.assertFalse(self.controlsd.is_ready(self.params))
+    self.assertFalse(self.controlsd.is_ready(None))
+    self.params["CarParams"] = b"1"
+    self.assertTrue(self.controlsd.is_ready(self.params))
+    ready_time = self.controlsd.ready_time
+    # the first time it's seen ready is kept
+    self.assertTrue(self.controlsd.is_ready(self.params))
+    self.assertEqual(self.controlsd.ready_time, ready_time)
+
+    self.controlsd.stop()
+    self.assertFalse(self.controlsd.is_ready(self.params))
+
+  def test_deps_not_running(self):
+    ensure_running(self.procs, True, params=self.params, not_run=["controlsd"])
+    self.assertEqual(self._started(), {"plannerd", "radard"})
+
+    self.controlsd.enabled = False
+    self.plannerd.stop()
+    self.start.reset_mock()
+    ensure_running(self.procs, True, params=self.params)
+    self.assertIn("plannerd", self._started())
+
+  def test_deps_timeout(self):
+    with mock.patch.object(process, "DEPS_TIMEOUT", 0.):
+      ensure_running(self.procs, True, params=self.params)
+      self.assertTrue(self.plannerd.waiting)
+      time.sleep(0.01)
+      ensure_running(self.procs, True, params=self.params)
+    self.assertIn("plannerd", self._started())
+    self.assertFalse(self.plannerd.waiting)
+
+  def test_stopped_processes_dont_wait(self):
+    ensure_running(self.procs, True, params=self.params)
+    self.assertTrue(self.plannerd.waiting)
+    running = ensure_running(self.procs, False, params=self.params)
+    self.assertEqual(running, [])
+    self.assertFalse(self.plannerd.waiting)
+    self.assertIsNone(self.plannerd.waiting_since)
+
+
+if __name__ == "__main__":
+  unittest.main()
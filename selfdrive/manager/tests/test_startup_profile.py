@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+import time
+import threading
+import unittest
+import importlib
+
+from selfdrive.manager.startup_profile import ImportTimer, TimedLoader, diff_reports
+
+MODULES = {
+  "profiled_parent": "import time\nimport profiled_child\ntime.sleep(0.02)\n",
+  "profiled_child": "import time\nimport profiled_leaf\ntime.sleep(0.05)\n",
+  "profiled_leaf": "x = 1\n",
+  "profiled_thread": "x = 1\n",
+}
+
+
+def report(version, commit, time_to_ready, processes):
+  return {"version": version, "commit": commit, "started": True, "time_to_ready": time_to_ready, "processes": processes}
+
+
+def python_profile(import_time, modules):
+  return {"import_time": import_time, "time_to_first_publish": import_time + 0.1, "modules": modules}
+
+
+class TestImportTimer(unittest.TestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    for name, code in MODULES.items():
+      with open(os.path.join(tmp.name, f"{name}.py"), "w") as f:
+        f.write(code)
+    sys.path.insert(0, tmp.name)
+    self.addCleanup(sys.path.remove, tmp.name)
+    for name in MODULES:
+      self.addCleanup(sys.modules.pop, name, None)
+
+    self.timer = ImportTimer()
+    self.timer.install()
+    self.addCleanup(self.timer.uninstall)
+
+  def test_tree(self):
+    importlib.import_module("profiled_parent")
+    self.timer.uninstall()
+    self.assertNotIn(self.timer, sys.meta_path)
+
+    parent_self, parent_cumulative = self.timer.modules["profiled_parent"]
+    child_self, child_cumulative = self.timer.modules["profiled_child"]
+    leaf_self, leaf_cumulative = self.timer.modules["profiled_leaf"]
+    # the time of the imported modules only counts for the cumulative time of their importer
+    self.assertGreaterEqual(parent_self, 0.02)
+    self.assertLess(parent_self, parent_cumulative - 0.05)
+    self.assertGreaterEqual(child_self, 0.05)
+    self.assertAlmostEqual(parent_cumulative, parent_self + child_cumulative, delta=1e-6)
+    self.assertAlmostEqual(child_cumulative, child_self + leaf_cumulative, delta=1e-6)
+    self.assertEqual(leaf_self, leaf_cumulative)
+    # only the top level import adds to the total
+    self.assertEqual(self.timer.total, parent_cumulative)
+    self.assertEqual(self.timer.stack, [])
+
+    top = self.timer.top(2)
+    self.assertEqual([m[0] for m in top], ["profiled_child", "profiled_parent"])
+    self.assertEqual(top[0], ["profiled_child", round(child_self, 6), round(child_cumulative, 6)])
+
+  def test_extension_module(self):
+    class ExtensionLoader:
+      """Loads like an extension module, whose init can import other modules"""
+      def create_module(self, spec):
+        time.sleep(0.03)
+        importlib.import_module("profiled_leaf")
+
+      def exec_module(self, module):
+        time.sleep(0.01)
+
+    loader = TimedLoader(ExtensionLoader(), "profiled_ext", self.timer)
+    loader.create_module(None)
+    loader.exec_module(None)
+
+    # both steps add up in the node of the module
+    ext_self, ext_cumulative = self.timer.modules["profiled_ext"]
+    _, leaf_cumulative = self.timer.modules["profiled_leaf"]
+    self.assertGreaterEqual(ext_self, 0.04)
+    self.assertAlmostEqual(ext_cumulative, ext_self + leaf_cumulative, delta=1e-6)
+    self.assertAlmostEqual(self.timer.total, ext_cumulative, delta=1e-6)
+    self.assertEqual(self.timer.stack, [])
+
+  def test_wrapped_loader(self):
+    spec = self.timer.find_spec("profiled_leaf", None)
+    self.assertIsInstance(spec.loader, TimedLoader)
+    # everything but exec_module is passed on to the wrapped loader
+    self.assertEqual(spec.loader.get_filename("profiled_leaf"), spec.origin)
+    self.assertIsNone(self.timer.find_spec("not_a_module_anywhere", None))
+
+  def test_other_threads(self):
+    thread = threading.Thread(target=importlib.import_module, args=("profiled_thread",))
+    thread.start()
+    thread.join()
+    self.assertIn("profiled_thread", sys.modules)
+    self.assertEqual(self.timer.modules, {})
+    self.assertEqual(self.timer.total, 0.)
+
+
+class TestDiffReports(unittest.TestCase):
+  def test_diff(self):
+    old = report("0.1", "abcdef0123456789", 2.0, {
+      "controlsd": {"launch_time": 0.01, "time_to_ready": 1.5,
+                    "python": python_profile(1.0, [["numpy", 0.2, 0.3], ["capnp", 0.1, 0.1], ["json", 0.01, 0.01]])},
+      "loggerd": {"launch_time": 0.01, "time_to_ready": 0.1, "python": None},
+    })
+    new = report("0.2", "0123456789abcdef", 1.5, {
+      "controlsd": {"launch_time": 0.01, "time_to_ready": 1.25,
+                    "python": python_profile(0.75, [["numpy", 0.05, 0.15], ["capnp", 0.102, 0.102], ["scipy", 0.3, 0.3]])},
+      "plannerd": {"launch_time": 0.02, "time_to_ready": 0.5, "python": None},
+    })
+    lines = diff_reports(old, new, threshold=0.005)
+
+    self.assertEqual(lines[0], "0.1 (abcdef01) -> 0.2 (01234567)")
+    self.assertEqual(lines[1], "time to ready: 2000 -> 1500 ms")
+    self.assertIn("time_to_ready", lines[2])
+
+    body = "\n".join(lines[3:])
+    rows = {line.split()[0]: line for line in lines[3:] if not line.startswith(" ")}
+    self.assertEqual(sorted(rows), ["controlsd", "loggerd", "plannerd"])
+    self.assertIn("1500 -> 1250 -250", rows["controlsd"])
+    self.assertIn("1000 -> 750 -250", rows["controlsd"])
+    self.assertIn("1100 -> 850 -250", rows["controlsd"])
+    # processes only in one of the reports
+    self.assertIn("100 -> -", rows["loggerd"])
+    self.assertIn("- -> 500", rows["plannerd"])
+
+    # modules are shown under their process when their self time changed by more than the threshold
+    modules = [line.split() for line in lines[3:] if line.startswith(" ")]
+    self.assertEqual(modules, [["json", "10", "->", "0", "-10"], ["numpy", "200", "->", "50", "-150"],
+                               ["scipy", "0", "->", "300", "+300"]])
+    self.assertNotIn("capnp", body)
+    self.assertEqual(len(diff_reports(old, new, threshold=0.1)), len(lines) - 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
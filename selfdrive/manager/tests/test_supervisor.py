@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import selfdrive.manager.process as process
+from selfdrive.manager.process import ManagerProcess
+from selfdrive.manager.supervisor import DirWatcher, Supervisor
+
+
+def crashed(p, returncode=1):
+  """Marks p as running a process that exited with returncode, and collects it"""
+  p.proc = mock.Mock(returncode=returncode, **{"communicate.return_value": (None, b"")})
+  p.phandler = mock.Mock()
+  return p.handle_exit()
+
+
+class TestSupervisor(unittest.TestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.watch_dir = tmp.name
+    self.supervisor = Supervisor(self.watch_dir)
+    self.addCleanup(self.supervisor.close)
+
+  def _start(self, *args):
+    p = ManagerProcess("sh", "sh", ["-c", *args], pipe_std=False)
+    p.start()
+    self.addCleanup(p.stop)
+    return p
+
+  def test_wakes_on_child_exit(self):
+    p = self._start("sleep 0.2; exit 3")
+    t = time.monotonic()
+    while not self.supervisor.reap([p]):
+      self.assertLess(time.monotonic() - t, 5)
+      self.assertFalse(self.supervisor.wait(10))
+    # woken by SIGCHLD, not by the timeout
+    self.assertLess(time.monotonic() - t, 5)
+    crashes = p.crashes
+    p.handle_exit()
+    self.assertEqual(p.exitcode, 3)
+    self.assertEqual(p.crashes, crashes + 1)
+
+  def test_exit_between_waits(self):
+    p = self._start("exit 0")
+    p.proc.wait()
+    # the SIGCHLD that arrived before waiting still wakes it up
+    t = time.monotonic()
+    self.supervisor.wait(10)
+    self.assertLess(time.monotonic() - t, 5)
+    self.assertEqual(self.supervisor.reap([p]), [p])
+    self.assertEqual(self.supervisor.reap([ManagerProcess("idle", "true")]), [])
+
+  def test_watch_dir(self):
+    self.assertFalse(self.supervisor.wait(0))
+    with open(os.path.join(self.watch_dir, "IsOnroad"), "w") as f:
+      f.write("1")
+    t = time.monotonic()
+    self.assertTrue(self.supervisor.wait(10))
+    self.assertLess(time.monotonic() - t, 5)
+    # the events are drained
+    self.assertFalse(self.supervisor.wait(0))
+
+  def test_unwatchable_dir(self):
+    watcher = DirWatcher(os.path.join(self.watch_dir, "missing"))
+    self.assertIsNone(watcher.fd)
+    supervisor = Supervisor(os.path.join(self.watch_dir, "missing"))
+    try:
+      # without inotify the caller has to poll the dir on every wakeup
+      self.assertTrue(supervisor.wait(0))
+    finally:
+      supervisor.close()
+
+
+class TestRestartPolicy(unittest.TestCase):
+  def test_backoff(self):
+    p = ManagerProcess("crasher", "false")
+    delays = []
+    for _ in range(5):
+      p.start_time = time.monotonic()
+      crashed(p)
+      delays.append(p.pending_restart() - time.monotonic())
+    for delay, expected in zip(delays, [0., 0.5, 1., 2., 4.]):
+      self.assertAlmostEqual(delay, expected, delta=0.1)
+
+    # not restarted before its backoff
+    with mock.patch("subprocess.Popen") as popen:
+      p.start()
+      popen.assert_not_called()
+
+  def test_backoff_capped(self):
+    p = ManagerProcess("crasher", "false")
+    with mock.patch.object(process, "CRASH_LOOP_LIMIT", 100):
+      for _ in range(20):
+        p.start_time = time.monotonic()
+        crashed(p)
+    self.assertLessEqual(p.pending_restart() - time.monotonic(), process.MAX_RESTART_BACKOFF)
+
+  def test_crash_loop_limit(self):
+    p = ManagerProcess("crasher", "false")
+    for _ in range(process.CRASH_LOOP_LIMIT - 1):
+      p.start_time = time.monotonic()
+      crashed(p)
+      self.assertIsNotNone(p.pending_restart())
+    p.start_time = time.monotonic()
+    crashed(p)
+    self.assertTrue(p.keep_stopped)
+    self.assertIsNone(p.pending_restart())
+    self.assertIsNone(Supervisor.next_restart([p]))
+
+    # stopping it resets the policy
+    p.stop()
+    self.assertFalse(p.keep_stopped)
+    self.assertEqual(p.crashes, 0)
+
+  def test_stable_runtime(self):
+    p = ManagerProcess("crasher", "false")
+    for _ in range(3):
+      p.start_time = time.monotonic()
+      crashed(p)
+    # a crash after running for a while starts a new series
+    p.start_time = time.monotonic() - process.STABLE_RUNTIME - 1
+    crashed(p)
+    self.assertEqual(p.crashes, 1)
+    self.assertAlmostEqual(p.pending_restart(), time.monotonic(), delta=0.1)
+
+  def test_clean_exit(self):
+    p = ManagerProcess("oneshot", "true")
+    crashed(p, returncode=0)
+    self.assertTrue(p.keep_stopped)
+    self.assertIsNone(p.pending_restart())
+
+  def test_process_state(self):
+    p = ManagerProcess("crasher", "false")
+    state = p.get_process_state_msg()
+    self.assertFalse(state.shouldBeRunning)
+
+    p.start_time = time.monotonic()
+    crashed(p, returncode=-11)
+    # still reported while it waits for its restart
+    state = p.get_process_state_msg()
+    self.assertFalse(state.running)
+    self.assertTrue(state.shouldBeRunning)
+    self.assertEqual(state.exitCode, -11)
+
+    for _ in range(process.CRASH_LOOP_LIMIT):
+      p.start_time = time.monotonic()
+      crashed(p)
+    # and once it's kept stopped for crash looping
+    self.assertTrue(p.keep_stopped)
+    state = p.get_process_state_msg()
+    self.assertTrue(state.shouldBeRunning)
+    self.assertEqual(state.exitCode, 1)
+
+    p.stop()
+    self.assertFalse(p.get_process_state_msg().shouldBeRunning)
+
+    oneshot = ManagerProcess("oneshot", "true")
+    crashed(oneshot, returncode=0)
+    state = oneshot.get_process_state_msg()
+    self.assertFalse(state.shouldBeRunning)
+    self.assertEqual(state.exitCode, 0)
+
+  def test_next_restart(self):
+    procs = [ManagerProcess(f"crasher{i}", "false") for i in range(3)]
+    self.assertIsNone(Supervisor.next_restart(procs))
+    for p in procs[:2]:
+      for _ in range(2):
+        p.start_time = time.monotonic()
+        crashed(p)
+    procs[1].restart_time -= 0.2
+    self.assertEqual(Supervisor.next_restart(procs), procs[1].restart_time)
+
+
+if __name__ == "__main__":
+  unittest.main()
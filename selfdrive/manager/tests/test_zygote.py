@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import os
+import struct
+import subprocess
+import sys
+import time
+import unittest
+
+import psutil
+
+from selfdrive.manager.zygote import Zygote, ZygoteProcess, car_preload
+
+TARGET = "selfdrive.manager.tests.test_zygote"
+
+
+def exit_with_arg():
+  """Daemon run by the zygote, prints its argv and exits with its first argument"""
+  print(" ".join(sys.argv), file=sys.stderr)
+  return int(sys.argv[1])
+
+
+def sleep_forever():
+  while True:
+    time.sleep(1)
+
+
+def wait_for_exit(pid, timeout=5.):
+  t = time.monotonic()
+  while psutil.Process(pid).status() != psutil.STATUS_ZOMBIE:
+    if time.monotonic() - t > timeout:
+      raise TimeoutError(f"{pid} still running")
+    time.sleep(0.01)
+
+
+def make_orphan():
+  """Returns the pid of an exited grandchild, reparented to this process"""
+  r, w = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    grandchild = os.fork()
+    if grandchild == 0:
+      os._exit(0)
+    os.write(w, struct.pack("<i", grandchild))
+    os._exit(0)
+  os.close(w)
+  with os.fdopen(r, "rb") as f:
+    grandchild = struct.unpack("<i", f.read(4))[0]
+  os.waitpid(pid, 0)
+  wait_for_exit(grandchild)
+  return grandchild
+
+
+def reaped(pid):
+  try:
+    return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+  except psutil.NoSuchProcess:
+    return True
+
+
+class TestZygote(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.zygote = Zygote(preload=["json"])
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.zygote.close()
+
+  def test_spawn(self):
+    proc = self.zygote.spawn("exiter", f"{TARGET}:exit_with_arg", ["3", "arg"], stderr=subprocess.PIPE)
+    self.assertIsInstance(proc, ZygoteProcess)
+    # forked twice, so it's a child of this process and not of the zygote
+    self.assertEqual(psutil.Process(proc.pid).ppid(), os.getpid())
+    _, stderr = proc.communicate()
+    self.assertEqual(stderr, b"exiter 3 arg\n")
+    self.assertEqual(proc.returncode, 3)
+    self.assertEqual(proc.poll(), 3)
+
+  def test_exit_status(self):
+    proc = self.zygote.spawn("exiter", f"{TARGET}:exit_with_arg", ["0"], stderr=subprocess.PIPE)
+    proc.communicate()
+    self.assertEqual(proc.returncode, 0)
+
+    proc = self.zygote.spawn("sleeper", f"{TARGET}:sleep_forever", [])
+    self.assertIsNone(proc.poll())
+    proc.terminate()
+    self.assertEqual(proc.wait(), -15)
+
+    # a missing target exits with an error instead of taking down the zygote
+    proc = self.zygote.spawn("missing", f"{TARGET}:missing", [], stderr=subprocess.PIPE)
+    _, stderr = proc.communicate()
+    self.assertEqual(proc.returncode, 1)
+    self.assertIn(b"AttributeError", stderr)
+
+  def test_reap_orphans(self):
+    orphans = [make_orphan() for _ in range(2)]
+    known = subprocess.Popen(["true"])
+    wait_for_exit(known.pid)
+    orphans.append(make_orphan())
+
+    self.zygote.reap_orphans([known.pid])
+    for pid in orphans:
+      self.assertTrue(reaped(pid), pid)
+    # the exit status of known processes is left for their owner
+    self.assertFalse(reaped(known.pid))
+    self.assertEqual(known.wait(), 0)
+
+    # nothing to reap
+    self.zygote.reap_orphans([])
+
+  def test_target(self):
+    self.assertIsNone(self.zygote.target("./selfdrive/loggerd/loggerd"))
+
+  def test_car_preload(self):
+    self.assertEqual(car_preload("toyota"), [f"selfdrive.car.toyota.{m}" for m in
+                                             ("values", "interface", "carstate", "carcontroller", "radar_interface")])
+    for car_name in (None, "", "mock", "unknown"):
+      self.assertEqual(car_preload(car_name), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
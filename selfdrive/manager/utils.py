@@ -1,14 +1,14 @@
-import psutil
 from cereal import log
+from common.proc_sampler import ProcSampler
 
-def get_cpu_times():
+def get_cpu_times(sampler: ProcSampler):
     """system-wide vitals on CPU"""
     ret = []
-    cpu_time_msg = log.ProcLog.CPUTimes.new_message()
 
-    cpu_times = psutil.cpu_times(percpu=True)
+    cpu_times = sampler.cpu_times()
 
     for i in range(len(cpu_times)):
+        cpu_time_msg = log.ProcLog.CPUTimes.new_message()
         cpu_time_msg.cpuNum = i
         cpu_time_msg.user = cpu_times[i].user
         cpu_time_msg.system = cpu_times[i].system
@@ -22,11 +22,11 @@ def get_cpu_times():
     return ret
 
 
-def get_memory_logs():
+def get_memory_logs(sampler: ProcSampler):
     """system-wide vitals on Memory"""
 
     mem_msg = log.ProcLog.Mem.new_message()
-    svmem = psutil.virtual_memory()
+    svmem = sampler.meminfo()
 
     mem_msg.total = svmem.total
     mem_msg.free = svmem.free
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Forks python daemons from a process that already imported their heavy shared modules.
+
+The zygote preloads ZYGOTE_PRELOAD and forks a daemon for every spawn request of the manager, so the
+daemons skip those imports and share their pages copy-on-write. Daemons are forked twice and the manager
+is a child subreaper, so they end up as children of the manager, which waits for them like for any other.
+"""
+import os
+import sys
+import json
+import time
+import ctypes
+import signal
+import socket
+import struct
+import importlib
+import threading
+import traceback
+import subprocess
+import importlib.metadata
+from typing import Dict, List, Optional
+
+import psutil
+
+from common.basedir import BASEDIR
+
+# imported once by the zygote, missing ones are skipped. They must not open sockets or start threads when imported
+ZYGOTE_PRELOAD = [
+    "numpy",
+    "capnp",
+    "cereal",
+    "cereal.messaging",
+    "common.params",
+    "common.realtime",
+    "common.numpy_fast",
+    "selfdrive.swaglog",
+    "selfdrive.car.car_helpers",
+    "selfdrive.controls.lib.drive_helpers",
+    "selfdrive.controls.lib.events",
+    "selfdrive.controls.lib.vehicle_model",
+    "selfdrive.controls.lib.longitudinal_planner",
+    "selfdrive.controls.lib.lateral_planner",
+]
+
+# modules of a car brand imported by controlsd and radard. Brands are only imported once the car is known,
+# so they're preloaded for the car of the last drive
+CAR_PRELOAD = ["values", "interface", "carstate", "carcontroller", "radar_interface"]
+
+PR_SET_NAME = 15
+PR_SET_CHILD_SUBREAPER = 36
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+def _prctl(option, arg):
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(option, arg, 0, 0, 0) != 0:
+        raise OSError(ctypes.get_errno(), f"prctl {option} failed")
+
+
+def car_preload(car_name: Optional[str]) -> List[str]:
+    """Returns the modules of the brand car_name that exist, none for a mock or unknown car"""
+    if not car_name or car_name == "mock":
+        return []
+    return [f"selfdrive.car.{car_name}.{m}" for m in CAR_PRELOAD
+            if os.path.exists(os.path.join(BASEDIR, "selfdrive", "car", car_name, f"{m}.py"))]
+
+
+def console_scripts() -> Dict[str, str]:
+    """Returns the module:function of the installed console scripts by name"""
+    eps = importlib.metadata.entry_points()
+    scripts = eps.select(group="console_scripts") if hasattr(eps, "select") else eps.get("console_scripts", [])
+    return {ep.name: ep.value for ep in scripts}
+
+
+class ZygoteProcess:
+    """Popen like handle of a daemon forked by the zygote"""
+
+    def __init__(self, pid: int, stderr=None):
+        self.pid = pid
+        self.returncode = None
+        self.stdout = None
+        self.stderr = stderr
+
+    def _wait(self, options):
+        if self.returncode is not None:
+            return self.returncode
+        try:
+            pid, status = os.waitpid(self.pid, options)
+        except ChildProcessError:
+            # reaped elsewhere
+            self.returncode = -1
+            return self.returncode
+        if pid != 0:
+            self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def poll(self):
+        return self._wait(os.WNOHANG)
+
+    def wait(self):
+        return self._wait(0)
+
+    def terminate(self):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def communicate(self):
+        stderr = None
+        if self.stderr is not None:
+            stderr = self.stderr.read()
+            self.stderr.close()
+        self.wait()
+        return None, stderr
+
+
+class Zygote:
+    """Manager side of the zygote. Must be created before the daemons it spawns, since it makes
+    this process a child subreaper"""
+
+    def __init__(self, preload: Optional[List[str]] = None):
+        _prctl(PR_SET_CHILD_SUBREAPER, 1)
+        self.scripts = console_scripts()
+        self.lock = threading.Lock()
+
+        self.sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        cmd = [sys.executable, "-m", "selfdrive.manager.zygote", str(child_sock.fileno())]
+        if preload is not None:
+            cmd.append(",".join(preload))
+        self.proc = subprocess.Popen(cmd, pass_fds=[child_sock.fileno()])
+        child_sock.close()
+
+    def target(self, command: str) -> Optional[str]:
+        """Returns the module:function the zygote runs for command, None if it isn't a python daemon"""
+        return self.scripts.get(command)
+
+    def spawn(self, name: str, target: str, args: List[str], stdout=None, stderr=None) -> ZygoteProcess:
+        """Forks a daemon running target. stdout and stderr are None to inherit them or a file,
+        stderr can also be subprocess.PIPE"""
+        fds, close_fds, request = [], [], {"name": name, "target": target, "args": args}
+        stderr_pipe = None
+        for stream, f in (("stdout", stdout), ("stderr", stderr)):
+            if stream == "stderr" and f is subprocess.PIPE:
+                r, w = os.pipe()
+                stderr_pipe = os.fdopen(r, "rb")
+                close_fds.append(w)
+                f = w
+            elif f is not None:
+                f = f.fileno()
+            if f is not None:
+                request[stream] = len(fds)
+                fds.append(f)
+
+        try:
+            with self.lock:
+                socket.send_fds(self.sock, [json.dumps(request).encode()], fds)
+                reply = json.loads(self.sock.recv(MAX_REQUEST_SIZE))
+        finally:
+            for fd in close_fds:
+                os.close(fd)
+
+        if "error" in reply:
+            raise OSError(f"zygote failed to spawn {name}: {reply['error']}")
+        return ZygoteProcess(reply["pid"], stderr_pipe)
+
+    def reap_orphans(self, known_pids):
+        """Reaps exited processes that were reparented to this subreaper, leaving the ones in known_pids"""
+        try:
+            # cheap check for any exited child before listing them
+            if os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+                return
+        except ChildProcessError:
+            return
+
+        known_pids = set(known_pids) | {self.proc.pid}
+        for child in psutil.Process().children():
+            if child.pid in known_pids:
+                continue
+            try:
+                os.waitpid(child.pid, os.WNOHANG)
+            except ChildProcessError:
+                pass
+
+    @staticmethod
+    def memory_report(procs) -> Dict[str, Dict[str, int]]:
+        """Returns the rss and unique set size of the running processes. rss - uss is mostly
+        the memory shared with the zygote and its other children"""
+        report = {}
+        for p in procs:
+            if isinstance(p.proc, ZygoteProcess) and p.proc.returncode is None:
+                try:
+                    mem = psutil.Process(p.proc.pid).memory_full_info()
+                except psutil.Error:
+                    continue
+                report[p.name] = {"rss": mem.rss, "uss": mem.uss}
+        return report
+
+    def close(self):
+        self.sock.close()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def _run_daemon(request, fds):
+    """Runs in the forked daemon, never returns"""
+    code = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        for stream, target_fd in (("stdout", 1), ("stderr", 2)):
+            if stream in request:
+                os.dup2(fds[request[stream]], target_fd)
+        for fd in fds:
+            os.close(fd)
+
+        _prctl(PR_SET_NAME, request["name"].encode()[:15])
+        sys.argv = [request["name"]] + request["args"]
+        if "numpy" in sys.modules:
+            # forked children would share the random state of the zygote
+            sys.modules["numpy"].random.seed()
+
+        module, func = request["target"].split(":")
+        code = getattr(importlib.import_module(module), func)()
+    except SystemExit as e:
+        code = e.code
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        for f in (sys.stdout, sys.stderr):
+            try:
+                f.flush()
+            except Exception:
+                pass
+        os._exit(code if isinstance(code, int) else (0 if code is None else 1))
+
+
+def main(fd: int, preload: List[str]):
+    _prctl(PR_SET_NAME, b"zygote")
+    t = time.monotonic()
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f"zygote: can't preload {module}: {e}", file=sys.stderr)
+    print(f"zygote: preloaded {len(preload)} modules in {time.monotonic() - t:.2f}s", file=sys.stderr)
+
+    sock = socket.socket(fileno=fd)
+    while True:
+        msg, fds, _, _ = socket.recv_fds(sock, MAX_REQUEST_SIZE, 2)
+        if not msg:
+            # the manager closed its end
+            break
+
+        request = json.loads(msg)
+        try:
+            r, w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(r)
+                sock.close()
+                daemon_pid = os.fork()
+                if daemon_pid == 0:
+                    os.close(w)
+                    _run_daemon(request, fds)
+                # exit right away so the daemon is reparented to the manager
+                os.write(w, struct.pack("<i", daemon_pid))
+                os._exit(0)
+
+            os.close(w)
+            with os.fdopen(r, "rb") as f:
+                daemon_pid = struct.unpack("<i", f.read(4))[0]
+            os.waitpid(pid, 0)
+            reply = {"pid": daemon_pid}
+        except Exception as e:
+            reply = {"error": str(e)}
+        finally:
+            for fd in fds:
+                os.close(fd)
+        sock.send(json.dumps(reply).encode())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]), sys.argv[2].split(",") if len(sys.argv) > 2 else ZYGOTE_PRELOAD)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import zmq
+
+from cereal.messaging.utils import get_zmq_socket_path
+from common.params import Params
+from selfdrive.keyvald import BATCH_PORT, CHANGES_PORT, DEL_PORT, ERROR, GET_PORT, OK, PUT_PORT, ParamsServer
+
+TIMEOUT = 5000
+
+
+class TestKeyvald(unittest.TestCase):
+  def setUp(self):
+    # keyvald and the other writers share an empty store, the real params are never touched
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    patcher = mock.patch.dict(os.environ, {"PARAMS_PATH": tmp.name})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.params = Params()
+    self.assertEqual(self.params.get_param_path(), tmp.name)
+
+    self.server = ParamsServer(workers=2)
+    self.server.start()
+    self.addCleanup(self.server.close)
+    self.addCleanup(self.server.stop)
+
+    self.ctx = zmq.Context()
+    self.addCleanup(self.ctx.term)
+    self.socks = {}
+    for port in (GET_PORT, PUT_PORT, DEL_PORT, BATCH_PORT):
+      sock = self.ctx.socket(zmq.REQ)
+      sock.setsockopt(zmq.LINGER, 0)
+      sock.setsockopt(zmq.RCVTIMEO, TIMEOUT)
+      sock.connect(get_zmq_socket_path(port))
+      self.addCleanup(sock.close)
+      self.socks[port] = sock
+
+  def request(self, port, *frames):
+    self.socks[port].send_multipart(list(frames))
+    return self.socks[port].recv_multipart()
+
+  def subscribe(self, key):
+    sock = self.ctx.socket(zmq.SUB)
+    sock.setsockopt(zmq.LINGER, 0)
+    sock.setsockopt(zmq.RCVTIMEO, TIMEOUT)
+    sock.connect(get_zmq_socket_path(CHANGES_PORT))
+    sock.setsockopt(zmq.SUBSCRIBE, key)
+    self.addCleanup(sock.close)
+    return sock
+
+  def test_single_key(self):
+    # the protocol of the existing REQ clients
+    self.assertEqual(self.request(GET_PORT, b"DongleId"), [b""])
+    self.assertEqual(self.request(PUT_PORT, b"DongleId", b"abc"), [OK])
+    self.assertEqual(self.request(GET_PORT, b"DongleId"), [b"abc"])
+    self.assertEqual(self.params.get("DongleId"), b"abc")
+    self.assertEqual(self.request(DEL_PORT, b"DongleId"), [OK])
+    self.assertEqual(self.request(GET_PORT, b"DongleId"), [b""])
+
+  def test_batch(self):
+    self.assertEqual(self.request(BATCH_PORT, b"put", b"DongleId", b"abc", b"IsMetric", b"1"), [OK])
+    self.assertEqual(self.params.get_many(["DongleId", "IsMetric"]), {"DongleId": b"abc", "IsMetric": b"1"})
+    self.assertEqual(self.request(BATCH_PORT, b"get", b"IsMetric", b"Passive", b"DongleId"), [b"1", b"", b"abc"])
+    self.assertEqual(self.request(BATCH_PORT, b"del", b"DongleId", b"IsMetric"), [OK])
+    self.assertEqual(self.request(BATCH_PORT, b"get", b"DongleId", b"IsMetric"), [b"", b""])
+
+  def test_errors(self):
+    self.params.put("DongleId", "unchanged")
+    # a write with an unknown key fails as a whole
+    self.assertEqual(self.request(BATCH_PORT, b"put", b"DongleId", b"changed", b"NotAParam", b"1"), [ERROR])
+    self.assertEqual(self.params.get("DongleId"), b"unchanged")
+    self.assertEqual(self.request(PUT_PORT, b"NotAParam", b"1"), [ERROR])
+    self.assertEqual(self.request(DEL_PORT, b"NotAParam"), [ERROR])
+    # unknown keys read as missing without failing the others
+    self.assertEqual(self.request(GET_PORT, b"NotAParam"), [b""])
+    self.assertEqual(self.request(BATCH_PORT, b"get", b"NotAParam", b"DongleId"), [b"", b"unchanged"])
+
+    # malformed requests
+    self.assertEqual(self.request(BATCH_PORT, b"put", b"DongleId"), [ERROR])
+    self.assertEqual(self.request(BATCH_PORT, b"drop", b"DongleId"), [ERROR])
+    self.assertEqual(self.request(BATCH_PORT, b""), [ERROR])
+    self.assertEqual(self.params.get("DongleId"), b"unchanged")
+
+  def test_changes(self):
+    self.params.put("DongleId", "first")
+    sock = self.subscribe(b"DongleId")
+    # the current value is sent on subscribing
+    self.assertEqual(sock.recv_multipart(), [b"DongleId", b"first"])
+
+    # changes through keyvald and by other processes
+    self.assertEqual(self.request(PUT_PORT, b"DongleId", b"second"), [OK])
+    self.assertEqual(sock.recv_multipart(), [b"DongleId", b"second"])
+    Params().put("IsMetric", "1")
+    Params().put("DongleId", "third")
+    self.assertEqual(sock.recv_multipart(), [b"DongleId", b"third"])
+    self.params.delete("DongleId")
+    self.assertEqual(sock.recv_multipart(), [b"DongleId", b""])
+
+
+class TestPublishChanges(unittest.TestCase):
+  def setUp(self):
+    self.server = ParamsServer(workers=0)
+    self.addCleanup(self.server.close)
+    # restored before closing the server, its sockets have to be closed for the context to terminate
+    for attr, value in (("params", mock.Mock(**{"change_counter.return_value": 1})), ("changes", mock.Mock())):
+      patcher = mock.patch.object(self.server, attr, value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def test_driven_by_change_counter(self):
+    self.server.subscribed = {b"DongleId": b"old", b"IsMetric": b"1"}
+    self.server.params.get_many.return_value = {b"DongleId": b"new", b"IsMetric": b"1"}
+    self.server.publish_changes()
+    # only the changed keys are published
+    self.server.changes.send_multipart.assert_called_once_with([b"DongleId", b"new"])
+
+    # the values aren't read again while the counter doesn't move
+    self.server.publish_changes()
+    self.assertEqual(self.server.params.get_many.call_count, 1)
+    self.assertEqual(self.server.changes.send_multipart.call_count, 1)
+
+    self.server.params.change_counter.return_value = 2
+    self.server.params.get_many.return_value = {b"DongleId": None, b"IsMetric": b"1"}
+    self.server.publish_changes()
+    self.assertEqual(self.server.params.get_many.call_count, 2)
+    self.server.changes.send_multipart.assert_called_with([b"DongleId", b""])
+
+  def test_no_subscribers(self):
+    self.server.publish_changes()
+    self.server.params.get_many.assert_not_called()
+
+
+if __name__ == "__main__":
+  unittest.main()
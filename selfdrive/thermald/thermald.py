@@ -6,13 +6,12 @@ import time
 from collections import OrderedDict, namedtuple
 from typing import Dict, Optional, Tuple
 
-import psutil
-
 import cereal.messaging as messaging
 from cereal import log
 from common.dict_helpers import strip_deprecated_keys
 from common.filter_simple import FirstOrderFilter
-from common.params import Params
+from common.params import CachedParams
+from common.proc_sampler import ProcSampler
 from common.realtime import DT_TRML, sec_since_boot
 from common.system import is_android, is_android_rooted
 from selfdrive.controls.lib.alertmanager import set_offroad_alert
@@ -46,29 +45,27 @@ OFFROAD_DANGER_TEMP = 79.5
 
 prev_offroad_states: Dict[str, Tuple[bool, Optional[str]]] = {}
 
-def get_device_state():
+def get_device_state(sampler: ProcSampler):
   # System utilization
   msg = messaging.new_message("deviceState")
-  
+  device = sampler.sample_device()
+
   msg.deviceState.freeSpacePercent = get_available_percent(default=100.0)
-  msg.deviceState.memoryUsagePercent = int(round(psutil.virtual_memory().percent))
-  msg.deviceState.cpuUsagePercent = [int(round(n)) for n in psutil.cpu_percent(percpu=True)]
+  msg.deviceState.memoryUsagePercent = int(round(device.memory_percent))
+  msg.deviceState.cpuUsagePercent = [int(round(n)) for n in device.cpu_percent]
 
   # Power
   if (not is_android()) or (is_android_rooted()):
-    try: # TODO: causes crash on android when providing power via panda.
-      battery = psutil.sensors_battery()
-      msg.deviceState.batteryPercent = int(battery.percent)
-      msg.deviceState.chargingDisabled = not battery.power_plugged
-    except:
-      pass
+    if device.battery_percent is not None: # TODO: causes crash on android when providing power via panda.
+      msg.deviceState.batteryPercent = int(device.battery_percent)
+      msg.deviceState.chargingDisabled = not device.power_plugged
 
   # Device Thermals
-  temps = psutil.sensors_temperatures()
+  temps = device.temperatures
   if temps.get("coretemp", None) is not None:
-    msg.deviceState.cpuTempC = [cpu.current for cpu in temps['coretemp']]
+    msg.deviceState.cpuTempC = temps['coretemp']
   elif temps.get("battery", None) is not None:
-    msg.deviceState.cpuTempC = [bms.current for bms in temps['battery']]
+    msg.deviceState.cpuTempC = temps['battery']
   else:
     msg.deviceState.cpuTempC = [0.0]*8 # TODO: find a better way to get temps that works across platforms.
   
@@ -112,7 +109,8 @@ def thermald_thread(end_event, hw_queue):
   in_car = False
   engaged_prev = False
 
-  params = Params()
+  params = CachedParams()
+  sampler = ProcSampler()
 
   fan_controller = None
 
@@ -122,7 +120,7 @@ def thermald_thread(end_event, hw_queue):
     pandaStates = sm['pandaStates']
     peripheralState = sm['peripheralState']
 
-    msg = get_device_state()
+    msg = get_device_state(sampler)
 
     if sm.updated['pandaStates'] and len(pandaStates) > 0:
 
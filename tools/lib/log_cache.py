@@ -0,0 +1,103 @@
+import os
+import time
+import mmap
+import fcntl
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+from common.file_helpers import mkdirs_exists_ok
+from tools.lib.url_file import CACHE_DIR
+
+LOG_CACHE_DIR = os.path.join(CACHE_DIR, "logs")
+LOG_CACHE_BYTES = int(os.environ.get("LOG_CACHE_BYTES", 20 * 1024 * 1024 * 1024))
+# temp files of writers that died mid-write are removed after this long
+STALE_TMP_AGE = 60 * 60
+TMP_PREFIX = ".tmp_"
+SUFFIX = ".rlog"
+
+
+def content_key(dat):
+  return hashlib.sha256(dat).hexdigest()
+
+
+class LogCache:
+  """On-disk cache of decompressed logs keyed by the hash of their compressed contents.
+
+     Entries are written to a temp file and renamed into place, and read back as read-only mmaps. Reading an
+     entry bumps its mtime, and the least recently used entries are evicted once the cache exceeds max_bytes.
+     Eviction holds an flock on the cache dir; an entry evicted while mapped stays valid until it's unmapped.
+  """
+  def __init__(self, path=LOG_CACHE_DIR, max_bytes=LOG_CACHE_BYTES):
+    self.path = path
+    self.max_bytes = max_bytes
+    mkdirs_exists_ok(path)
+
+  def _entry_path(self, key):
+    return os.path.join(self.path, key + SUFFIX)
+
+  @contextmanager
+  def _lock(self):
+    fd = os.open(self.path, 0)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      os.close(fd)
+
+  def get(self, key):
+    """Returns the cached data as a read-only mmap, or None on a miss."""
+    try:
+      fd = os.open(self._entry_path(key), os.O_RDONLY)
+    except FileNotFoundError:
+      return None
+
+    try:
+      os.utime(fd)
+      if os.fstat(fd).st_size == 0:
+        return b""
+      return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+      os.close(fd)
+
+  def put(self, key, dat):
+    fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=TMP_PREFIX)
+    try:
+      with os.fdopen(fd, "wb") as f:
+        f.write(dat)
+      os.replace(tmp_path, self._entry_path(key))
+    except Exception:
+      os.remove(tmp_path)
+      raise
+    self.evict()
+
+  def evict(self):
+    with self._lock():
+      entries = []
+      for fn in os.listdir(self.path):
+        path = os.path.join(self.path, fn)
+        try:
+          st = os.stat(path)
+        except FileNotFoundError:
+          continue
+
+        if fn.startswith(TMP_PREFIX):
+          if time.time() - st.st_mtime > STALE_TMP_AGE:
+            os.remove(path)
+        elif fn.endswith(SUFFIX):
+          entries.append((st.st_mtime, st.st_size, path))
+
+      total = sum(size for _, size, _ in entries)
+      for _, size, path in sorted(entries):
+        if total <= self.max_bytes:
+          break
+        os.remove(path)
+        total -= size
+
+  def get_or_put(self, key, fn):
+    """Returns the cached data for key, filling the cache with fn() on a miss."""
+    dat = self.get(key)
+    if dat is None:
+      dat = fn()
+      self.put(key, dat)
+    return dat
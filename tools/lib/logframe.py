@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+from itertools import chain
+
+import capnp
+import numpy as np
+
+from tools.lib.logreader import LogReader, NO_DISCRIMINANT
+from tools.lib.route import Route, SegmentName
+
+# numeric capnp types that become columns, enums are stored as their raw value
+CAPNP_DTYPES = {
+  'bool': np.bool_,
+  'int8': np.int8,
+  'int16': np.int16,
+  'int32': np.int32,
+  'int64': np.int64,
+  'uint8': np.uint8,
+  'uint16': np.uint16,
+  'uint32': np.uint32,
+  'uint64': np.uint64,
+  'float32': np.float32,
+  'float64': np.float64,
+  'enum': np.uint16,
+}
+TIME_COLUMN = 'logMonoTime'
+
+
+def numeric_columns(reader, prefix=()):
+  """Returns (path, capnp type) of every numeric field in a struct reader, recursing into nested structs.
+     Lists and union members are skipped, since they don't map to one value per event."""
+  columns = []
+  for field in reader.schema.node.struct.fields:
+    if field.discriminantValue != NO_DISCRIMINANT:
+      continue
+
+    path = prefix + (field.name,)
+    if field.which() == 'group':
+      columns += numeric_columns(getattr(reader, field.name), path)
+      continue
+
+    kind = field.slot.type.which()
+    if kind in CAPNP_DTYPES:
+      columns.append((path, kind))
+    elif kind == 'struct':
+      columns += numeric_columns(getattr(reader, field.name), path)
+  return columns
+
+
+def _get(reader, path, kind):
+  for name in path:
+    reader = getattr(reader, name)
+  return reader.raw if kind == 'enum' else reader
+
+
+def build_logframe(events, services=None):
+  """Collects events into {service: {column: array}}, with logMonoTime as the index column of every service."""
+  plans = {}
+  values = {}
+  for msg in events:
+    service = msg.which()
+    if services is not None and service not in services:
+      continue
+
+    reader = getattr(msg, service)
+    if service not in plans:
+      # services that are lists, like can, have no scalar fields
+      plans[service] = numeric_columns(reader) if isinstance(reader, capnp.lib.capnp._DynamicStructReader) else []
+      values[service] = [[] for _ in range(len(plans[service]) + 1)]
+
+    cols = values[service]
+    cols[0].append(msg.logMonoTime)
+    for col, (path, kind) in zip(cols[1:], plans[service]):
+      col.append(_get(reader, path, kind))
+
+  frame = {}
+  for service, plan in plans.items():
+    cols = values.pop(service)
+    frame[service] = {TIME_COLUMN: np.array(cols[0], dtype=np.uint64)}
+    for col, (path, kind) in zip(cols[1:], plan):
+      frame[service]['.'.join(path)] = np.array(col, dtype=CAPNP_DTYPES[kind])
+  return frame
+
+
+def write_logframe(events, dest, services=None):
+  """Writes events as one .npy file per column under dest/<service>/, so they can be memory-mapped back."""
+  frame = build_logframe(events, services)
+  for service, columns in frame.items():
+    os.makedirs(os.path.join(dest, service), exist_ok=True)
+    for name, arr in columns.items():
+      np.save(os.path.join(dest, service, name + '.npy'), arr)
+  return frame
+
+
+class LogFrame:
+  """Reads a logframe written by write_logframe, e.g. LogFrame(path)['carState']['vEgo'].
+     Columns are memory-mapped, nothing is read until they are accessed."""
+  def __init__(self, path):
+    self.path = path
+    self._services = {}
+
+  @property
+  def services(self):
+    return sorted(os.listdir(self.path))
+
+  def __contains__(self, service):
+    return os.path.isdir(os.path.join(self.path, service))
+
+  def __getitem__(self, service):
+    if service not in self._services:
+      service_dir = os.path.join(self.path, service)
+      if not os.path.isdir(service_dir):
+        raise KeyError(service)
+      self._services[service] = {fn[:-len('.npy')]: np.load(os.path.join(service_dir, fn), mmap_mode='r')
+                                 for fn in sorted(os.listdir(service_dir)) if fn.endswith('.npy')}
+    return self._services[service]
+
+
+def logframe_events(route_or_segment_name, services=None, qlog=False):
+  """Streams the sorted events of a log file, segment or route without holding whole segments in memory."""
+  if route_or_segment_name.startswith(("http://", "https://", "cd:/")) or os.path.isfile(route_or_segment_name):
+    logs = [route_or_segment_name]
+  else:
+    sn = SegmentName(route_or_segment_name, allow_route_name=True)
+    r = Route(sn.route_name.canonical_name, sn.data_dir)
+    logs = r.qlog_paths() if qlog else r.log_paths()
+    if sn.segment_num >= 0:
+      logs = logs[sn.segment_num:sn.segment_num + 1]
+
+  return chain.from_iterable(LogReader(fn, sort_by_time=True, stream=True, services=services)
+                             for fn in logs if fn is not None)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Converts a log, segment or route into memory-mappable columnar arrays")
+  parser.add_argument("--qlog", action="store_true", help="Use qlogs")
+  parser.add_argument("--services", nargs='+', help="Only convert these services")
+  parser.add_argument("route_or_segment_name", help="The log, route or segment name to convert")
+  parser.add_argument("dest", help="Output directory")
+
+  if len(sys.argv) == 1:
+    parser.print_help()
+    sys.exit()
+  args = parser.parse_args()
+
+  frame = write_logframe(logframe_events(args.route_or_segment_name.strip(), args.services, args.qlog),
+                         args.dest, args.services)
+  for service, columns in sorted(frame.items()):
+    print(f"{service}: {len(columns[TIME_COLUMN])} events, {len(columns) - 1} columns")
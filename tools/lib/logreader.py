@@ -2,34 +2,398 @@
 import os
 import sys
 import bz2
+import bisect
+import heapq
+import mmap
+import struct
 import urllib.parse
 import capnp
 import warnings
+import json
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from itertools import chain
 
 
 from cereal import log as capnp_log
+from common.file_helpers import mkdirs_exists_ok, atomic_write_in_dir
 from tools.lib.filereader import FileReader
+from tools.lib.log_cache import LogCache, content_key
 from tools.lib.route import Route, SegmentName
+from tools.lib.url_file import CACHE_DIR, hash_256
+
+# size of the compressed reads done in streaming mode
+STREAM_CHUNK_SIZE = 1024 * 1024
+# number of events buffered to sort a stream by logMonoTime
+REORDER_WINDOW = 1000
+# decompressed bytes MultiLogIterator may hold in prefetched segments
+PREFETCH_BYTES = 1024 * 1024 * 1024
+# discriminantValue of struct fields that aren't part of a union
+NO_DISCRIMINANT = 0xffff
+# threads decompressing the frames of a seekable log
+DECOMPRESS_THREADS = os.cpu_count() or 1
+
+# index of a seekable log, see read_frame_index
+SEEKABLE_MAGIC = b'SEEKIDX1'
+FRAME_STRUCT = struct.Struct('<QQIQQ')
+TRAILER_STRUCT = struct.Struct('<I8s')
+Frame = namedtuple('Frame', ['offset', 'size', 'count', 'start_time', 'end_time'])
+
+
+def capnp_message_size(dat, offset=0):
+  """Returns the size of the capnp message framed at offset, or None if dat doesn't hold its full header."""
+  if len(dat) - offset < 4:
+    return None
+  segment_count = struct.unpack_from('<I', dat, offset)[0] + 1
+  header_size = (4 + 4 * segment_count + 7) // 8 * 8
+  if len(dat) - offset < header_size:
+    return None
+  segment_sizes = struct.unpack_from(f'<{segment_count}I', dat, offset + 4)
+  return header_size + 8 * sum(segment_sizes)
+
+
+def read_chunks(f, chunk_size=STREAM_CHUNK_SIZE):
+  """Yields fixed size reads from a file object until EOF."""
+  return iter(lambda: f.read(chunk_size), b"")
+
+
+def decompress_stream(chunks):
+  """Yields the contents of an iterable of raw log chunks, bz2 decompressing them on the fly if needed."""
+  chunks = iter(chunks)
+  head = next(chunks, b"")
+  if not head.startswith(b'BZh9'):
+    if head:
+      yield head
+    yield from chunks
+    return
+
+  decompressor = bz2.BZ2Decompressor()
+  after_stream = False
+  for dat in chain([head], chunks):
+    while dat:
+      try:
+        out = decompressor.decompress(dat)
+      except OSError:
+        if after_stream:
+          # trailing data after the last stream, like the index of a seekable log
+          return
+        raise
+      dat = b""
+      after_stream = False
+      if decompressor.eof:
+        # concatenated bz2 streams
+        dat = decompressor.unused_data
+        decompressor = bz2.BZ2Decompressor()
+        after_stream = True
+      if out:
+        yield out
+
+
+@lru_cache(maxsize=None)
+def event_discriminants():
+  """Returns the Event union's discriminant offset in the data section (in 16 bit units) and its values to names."""
+  node = capnp_log.Event.schema.node.struct
+  return node.discriminantOffset, {f.discriminantValue: f.name for f in node.fields if f.discriminantValue != NO_DISCRIMINANT}
+
+
+def message_which(dat, offset=0):
+  """Reads the union field of the Event message framed at offset straight from its bytes, without building a reader.
+     Returns None if the root struct is behind a far pointer and "" if the discriminant is unknown."""
+  discriminant_offset, names = event_discriminants()
+  segment_count = struct.unpack_from('<I', dat, offset)[0] + 1
+  root = offset + (4 + 4 * segment_count + 7) // 8 * 8
+  pointer = struct.unpack_from('<Q', dat, root)[0]
+  if pointer & 3 != 0:
+    return None
+
+  pointer_offset = (pointer >> 2) & 0x3fffffff
+  if pointer_offset >= 1 << 29:
+    pointer_offset -= 1 << 30
+  data_words = (pointer >> 32) & 0xffff
+
+  # fields past the end of the data section are zero, i.e. logs from older schemas
+  discriminant = 0
+  if (discriminant_offset + 1) * 2 <= data_words * 8:
+    discriminant = struct.unpack_from('<H', dat, root + 8 * (1 + pointer_offset) + 2 * discriminant_offset)[0]
+  return names.get(discriminant, "")
+
+
+def stream_events(chunks, services=None, seen=None):
+  """Yields capnp Events from an iterable of raw log chunks, only keeping partial messages in memory.
+     If services is set, other events are skipped based on their raw union discriminant and all services
+     found are added to seen."""
+  buf = b""
+  try:
+    for chunk in chunks:
+      buf = buf + chunk if buf else chunk
+      end = 0
+      spans = []
+      while True:
+        size = capnp_message_size(buf, end)
+        if size is None or end + size > len(buf):
+          break
+
+        if services is not None:
+          which = message_which(buf, end)
+          if seen is not None and which:
+            seen.add(which)
+          if which is None or which in services:
+            if spans and spans[-1][1] == end:
+              spans[-1][1] = end + size
+            else:
+              spans.append([end, end + size])
+        end += size
+
+      if end > 0:
+        # slicing copies, parse in place when the whole buffer is used, e.g. an mmapped log
+        view = buf if end == len(buf) else memoryview(buf)[:end]
+        if services is None:
+          yield from capnp_log.Event.read_multiple_bytes(view)
+        elif spans:
+          dat = view if spans == [[0, end]] else b"".join(memoryview(buf)[s:e] for s, e in spans)
+          for e in capnp_log.Event.read_multiple_bytes(dat):
+            if e.which() in services:
+              yield e
+        buf = buf[end:]
+  except capnp.KjException:
+    warnings.warn("Corrupted events detected", RuntimeWarning)
+    return
+
+  if len(buf):
+    warnings.warn("Corrupted events detected", RuntimeWarning)
+
+
+def _services_cache_path(fn):
+  key = fn
+  if os.path.isfile(fn):
+    st = os.stat(fn)
+    key = f"{os.path.realpath(fn)}:{st.st_size}:{st.st_mtime_ns}"
+  return os.path.join(CACHE_DIR, hash_256(key) + "_services")
+
+
+def get_log_services(fn):
+  """Returns the services present in a log as recorded by a previous filtered read, or None if unknown."""
+  try:
+    with open(_services_cache_path(fn)) as f:
+      return set(json.load(f))
+  except (OSError, ValueError):
+    return None
+
+
+def put_log_services(fn, services):
+  mkdirs_exists_ok(CACHE_DIR)
+  with atomic_write_in_dir(_services_cache_path(fn), mode="w", overwrite=True) as f:
+    json.dump(sorted(services), f)
+
+
+def may_contain(fn, services):
+  """False if the cache says the log has none of services. Always True for unseen logs."""
+  if services is None:
+    return True
+  log_services = get_log_services(fn)
+  return log_services is None or not log_services.isdisjoint(services)
+
+
+def sort_events(events, window=REORDER_WINDOW):
+  """Sorts events by logMonoTime, assuming no event is more than window events out of place."""
+  heap = []
+  for i, e in enumerate(events):
+    heapq.heappush(heap, (e.logMonoTime, i, e))
+    if len(heap) > window:
+      yield heapq.heappop(heap)[2]
+  while heap:
+    yield heapq.heappop(heap)[2]
+
+
+def read_log(fn):
+  """Returns the raw contents of a log. Local files are memory-mapped instead of read, so uncompressed logs are
+     parsed in place and processes reading the same log share its page cache."""
+  if os.path.isfile(fn) and os.path.getsize(fn) > 0:
+    with open(fn, "rb") as f:
+      return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+  with FileReader(fn) as f:
+    return f.read()
+
+
+def _read_at(src, offset, size):
+  if isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)):
+    return src[offset:offset + size]
+  src.seek(offset)
+  return src.read(size)
+
+
+def _source_length(src):
+  if isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)):
+    return len(src)
+  if hasattr(src, 'get_length'):
+    return src.get_length()
+  return os.fstat(src.fileno()).st_size
+
+
+def read_frame_index(src):
+  """Returns the frames of a seekable log, or None if it isn't one. src is the raw log or a file object.
+
+     A seekable log is a series of bz2 streams (frames) of whole events, followed by one FRAME_STRUCT per frame
+     with its position, event count and logMonoTime range, and a TRAILER_STRUCT with the number of frames.
+     bz2 readers ignore the data after the last stream, so it's still a valid bz2 file.
+  """
+  length = _source_length(src)
+  if length < TRAILER_STRUCT.size:
+    return None
+  count, magic = TRAILER_STRUCT.unpack(_read_at(src, length - TRAILER_STRUCT.size, TRAILER_STRUCT.size))
+  if magic != SEEKABLE_MAGIC:
+    return None
+
+  index_size = count * FRAME_STRUCT.size
+  index = _read_at(src, length - TRAILER_STRUCT.size - index_size, index_size)
+  return [Frame(*f) for f in FRAME_STRUCT.iter_unpack(index)]
+
+
+def in_time_range(t, time_range):
+  """time_range is (start, end) in logMonoTime nanoseconds, end exclusive. Either can be None for no bound."""
+  start, end = time_range
+  return (start is None or t >= start) and (end is None or t < end)
+
+
+def frames_in_range(frames, time_range=None):
+  if time_range is None:
+    return frames
+  start, end = time_range
+  return [f for f in frames if (start is None or f.end_time >= start) and (end is None or f.start_time < end)]
+
+
+def read_frames(src, frames):
+  """Yields the compressed frames, reading each run of adjacent frames at once."""
+  i = 0
+  while i < len(frames):
+    j = i + 1
+    while j < len(frames) and frames[j].offset == frames[j - 1].offset + frames[j - 1].size:
+      j += 1
+    begin = frames[i].offset
+    run = memoryview(_read_at(src, begin, frames[j - 1].offset + frames[j - 1].size - begin))
+    for f in frames[i:j]:
+      yield run[f.offset - begin:f.offset - begin + f.size]
+    i = j
+
+
+def decompress_frames(src, frames, threads=DECOMPRESS_THREADS):
+  """Decompresses frames of a seekable log, in parallel since bz2 releases the GIL."""
+  if len(frames) <= 1 or threads <= 1:
+    return b"".join(map(bz2.decompress, read_frames(src, frames)))
+  with ThreadPoolExecutor(max_workers=threads) as pool:
+    return b"".join(pool.map(bz2.decompress, read_frames(src, frames)))
+
+
+def decompress_log(dat, cache=None, time_range=None):
+  """bz2 decompresses a whole log. With cache, the result is kept in the LogCache and returned as an mmap.
+     Seekable logs are decompressed frame by frame in parallel, only the frames overlapping time_range if set."""
+  if cache is None:
+    cache = bool(int(os.environ.get("LOGREADER_CACHE", "0")))
+  frames = read_frame_index(dat)
+  if frames is not None and (time_range is not None or not cache):
+    return decompress_frames(dat, frames_in_range(frames, time_range))
+  if not cache:
+    return bz2.decompress(dat)
+  return LogCache().get_or_put(content_key(dat), lambda: bz2.decompress(dat))
+
+
+def fetch_log(fn):
+  """Downloads and decompresses a log, runs in the prefetch worker processes."""
+  with FileReader(fn) as f:
+    dat = f.read()
+  if dat.startswith(b'BZh9'):
+    dat = decompress_log(dat)
+  # mmaps of cached logs can't be sent back to the parent
+  return dat[:] if isinstance(dat, mmap.mmap) else dat
+
 
 # this is an iterator itself, and uses private variables from LogReader
 class MultiLogIterator:
-  def __init__(self, log_paths, sort_by_time=False):
-    self._log_paths = log_paths
+  def __init__(self, log_paths, sort_by_time=False, prefetch=0, prefetch_bytes=PREFETCH_BYTES, services=None):
+    # segments known not to contain any of the services are treated as missing
+    self._log_paths = [p if p is not None and may_contain(p, services) else None for p in log_paths]
     self.sort_by_time = sort_by_time
+    self._services = services
+
+    # up to prefetch segments after the current one are fetched and decompressed in a process pool.
+    # no new ones are started while the unconsumed ones hold more than prefetch_bytes, counting the
+    # ones still in flight as large as the largest segment seen so far
+    self._prefetch = prefetch
+    self._prefetch_bytes = prefetch_bytes
+    self._pool = ProcessPoolExecutor(max_workers=prefetch) if prefetch > 0 else None
+    self._futures = {}
+    self._segment_size = 0
 
-    self._first_log_idx = next(i for i in range(len(log_paths)) if log_paths[i] is not None)
-    self._current_log = self._first_log_idx
     self._idx = 0
     self._log_readers = [None]*len(log_paths)
+    self._first_log_idx = next(i for i in range(len(log_paths)) if self._has_events(i))
+    self._current_log = self._first_log_idx
     self.start_time = self._log_reader(self._first_log_idx)._ts[0]
 
   def _log_reader(self, i):
     if self._log_readers[i] is None and self._log_paths[i] is not None:
       log_path = self._log_paths[i]
-      self._log_readers[i] = LogReader(log_path, sort_by_time=self.sort_by_time)
+      future = self._futures.pop(i, None)
+      dat = future.result() if future is not None else None
+      if dat is not None:
+        self._segment_size = max(self._segment_size, len(dat))
+      self._log_readers[i] = LogReader(log_path, sort_by_time=self.sort_by_time, dat=dat, services=self._services)
+      self._schedule_prefetch(i)
 
     return self._log_readers[i]
 
+  def _has_events(self, i):
+    # filtering by services can leave segments empty
+    return self._log_paths[i] is not None and len(self._log_reader(i)._ents) > 0
+
+  def _prefetch_window(self, i):
+    return [j for j in range(i + 1, len(self._log_paths)) if self._log_paths[j] is not None][:self._prefetch]
+
+  def _schedule_prefetch(self, i):
+    if self._pool is None:
+      return
+
+    prefetched_bytes = self._prefetched_bytes()
+    for j in self._prefetch_window(i):
+      # until the size of a segment is known only one is fetched at a time
+      if prefetched_bytes >= self._prefetch_bytes or (self._segment_size == 0 and len(self._futures)):
+        break
+      if self._log_readers[j] is None and j not in self._futures:
+        self._futures[j] = self._pool.submit(fetch_log, self._log_paths[j])
+        prefetched_bytes += self._segment_size
+
+  def _prefetched_bytes(self):
+    total = 0
+    for f in self._futures.values():
+      if not f.done():
+        total += self._segment_size
+      elif not f.cancelled() and f.exception() is None:
+        size = len(f.result())
+        self._segment_size = max(self._segment_size, size)
+        total += size
+    return total
+
+  def _cancel_prefetch(self, i):
+    keep = set(self._prefetch_window(i)) | {i}
+    for j in list(self._futures):
+      if j not in keep:
+        self._futures.pop(j).cancel()
+
+  def close(self):
+    if self._pool is not None:
+      self._pool.shutdown(wait=False, cancel_futures=True)
+      self._pool = None
+    self._futures.clear()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
   def __iter__(self):
     return self
 
@@ -40,8 +404,10 @@ class MultiLogIterator:
     else:
       self._idx = 0
       self._current_log = next(i for i in range(self._current_log + 1, len(self._log_readers) + 1)
-                               if i == len(self._log_readers) or self._log_paths[i] is not None)
+                               if i == len(self._log_readers) or self._has_events(i))
       if self._current_log == len(self._log_readers):
+        # nothing is left to prefetch
+        self.close()
         raise StopIteration
 
   def __next__(self):
@@ -58,57 +424,129 @@ class MultiLogIterator:
   def seek(self, ts):
     # seek to nearest minute
     minute = int(ts/60)
-    if minute >= len(self._log_paths) or self._log_paths[minute] is None:
+    if minute >= len(self._log_paths) or not self._has_events(minute):
       return False
 
-    self._current_log = minute
+    # segments don't start exactly on the minute, so ts can be at the end of the previous one
+    target = self.start_time + int(ts * 1e9)
+    self._cancel_prefetch(minute)
+    if minute > 0 and self._log_reader(minute)._ts[0] > target and self._has_events(minute - 1):
+      minute -= 1
 
-    # HACK: O(n) seek afterward
-    self._idx = 0
-    while self.tell() < ts:
-      self._inc()
+    # binary search over the timestamps, which are only sorted with sort_by_time. otherwise the
+    # file order is kept, so scan for the first event at or after target like iterating would
+    lr = self._log_reader(minute)
+    self._current_log = minute
+    if self.sort_by_time:
+      self._idx = bisect.bisect_left(lr._ts, target)
+    else:
+      self._idx = next((i for i, t in enumerate(lr._ts) if t >= target), len(lr._ts))
+    if self._idx == len(lr._ts):
+      next_log = next((i for i in range(minute + 1, len(self._log_paths)) if self._has_events(i)), None)
+      if next_log is None:
+        self._idx = len(lr._ts) - 1
+      else:
+        self._current_log, self._idx = next_log, 0
     return True
 
   def reset(self):
-    self.__init__(self._log_paths, sort_by_time=self.sort_by_time)
+    self.close()
+    self.__init__(self._log_paths, sort_by_time=self.sort_by_time, prefetch=self._prefetch,
+                  prefetch_bytes=self._prefetch_bytes, services=self._services)
 
 
 class LogReader:
-  def __init__(self, fn, canonicalize=True, only_union_types=False, sort_by_time=False, dat=None):
+  def __init__(self, fn, canonicalize=True, only_union_types=False, sort_by_time=False, dat=None,
+               stream=False, reorder_window=REORDER_WINDOW, services=None, cache=None, time_range=None):
     self.data_version = None
     self._only_union_types = only_union_types
+    # only events of these services are decoded, others are skipped by their raw union discriminant
+    self._services = set(services) if services is not None else None
+    # (start, end) logMonoTime of the events to read, seekable logs only decompress the frames overlapping it
+    self._time_range = time_range
+
+    # in streaming mode events are decoded lazily on every iteration and never stored
+    self._fn = fn
+    self._dat = dat
+    self._stream = stream
+    self._sort_by_time = sort_by_time
+    self._reorder_window = reorder_window
 
     ext = None
     if not dat:
-      _, ext = os.path.splitext(urllib.parse.urlparse(fn).path)
-      if ext not in ('', '.bz2'):
-        # old rlogs weren't bz2 compressed
-        raise Exception(f"unknown extension {ext}")
+      ext = self._get_ext(fn)
+    if stream:
+      return
 
-      with FileReader(fn) as f:
-        dat = f.read()
+    if fn and not may_contain(fn, self._services):
+      self._ents, self._ts = [], []
+      return
 
-    if ext == ".bz2" or dat.startswith(b'BZh9'):
-      dat = bz2.decompress(dat)
+    if not dat:
+      dat = read_log(fn)
 
-    ents = capnp_log.Event.read_multiple_bytes(dat)
+    if ext == ".bz2" or dat[:4] == b'BZh9':
+      # False by default, true if LOGREADER_CACHE is set, but can be overwritten by the cache input
+      dat = decompress_log(dat, cache, time_range)
 
-    _ents = []
-    try:
-      for e in ents:
-        _ents.append(e)
-    except capnp.KjException:
-      warnings.warn("Corrupted events detected", RuntimeWarning)
+    if self._services is not None:
+      seen = set()
+      _ents = list(stream_events([dat], self._services, seen))
+      # services seen in part of a log aren't all of its services
+      if fn and time_range is None:
+        put_log_services(fn, seen)
+    else:
+      ents = capnp_log.Event.read_multiple_bytes(dat)
 
+      _ents = []
+      try:
+        for e in ents:
+          _ents.append(e)
+      except capnp.KjException:
+        warnings.warn("Corrupted events detected", RuntimeWarning)
+
+    if time_range is not None:
+      _ents = [e for e in _ents if in_time_range(e.logMonoTime, time_range)]
     self._ents = list(sorted(_ents, key=lambda x: x.logMonoTime) if sort_by_time else _ents)
     self._ts = [x.logMonoTime for x in self._ents]
 
+  @staticmethod
+  def _get_ext(fn):
+    _, ext = os.path.splitext(urllib.parse.urlparse(fn).path)
+    if ext not in ('', '.bz2'):
+      # old rlogs weren't bz2 compressed
+      raise Exception(f"unknown extension {ext}")
+    return ext
+
   @classmethod
   def from_bytes(cls, dat):
     return cls("", dat=dat)
 
+  def _stream_ents(self):
+    if self._fn and not may_contain(self._fn, self._services):
+      return
+
+    seen = set()
+    with (BytesIO(self._dat) if self._dat else FileReader(self._fn)) as f:
+      frames = None
+      if self._time_range is not None:
+        frames = read_frame_index(self._dat if self._dat else f)
+        f.seek(0)
+
+      if frames is not None:
+        chunks = map(bz2.decompress, read_frames(f, frames_in_range(frames, self._time_range)))
+      else:
+        chunks = decompress_stream(read_chunks(f))
+      ents = stream_events(chunks, self._services, seen)
+      if self._time_range is not None:
+        ents = (e for e in ents if in_time_range(e.logMonoTime, self._time_range))
+      yield from sort_events(ents, self._reorder_window) if self._sort_by_time else ents
+
+    if self._services is not None and self._fn and self._time_range is None:
+      put_log_services(self._fn, seen)
+
   def __iter__(self):
-    for ent in self._ents:
+    for ent in (self._stream_ents() if self._stream else self._ents):
       if self._only_union_types:
         try:
           ent.which()
@@ -118,13 +556,13 @@ class LogReader:
       else:
         yield ent
 
-def logreader_from_route_or_segment(r, sort_by_time=False):
+def logreader_from_route_or_segment(r, sort_by_time=False, prefetch=0, services=None):
   sn = SegmentName(r, allow_route_name=True)
   route = Route(sn.route_name.canonical_name)
   if sn.segment_num < 0:
-    return MultiLogIterator(route.log_paths(), sort_by_time=sort_by_time)
+    return MultiLogIterator(route.log_paths(), sort_by_time=sort_by_time, prefetch=prefetch, services=services)
   else:
-    return LogReader(route.log_paths()[sn.segment_num], sort_by_time=sort_by_time)
+    return LogReader(route.log_paths()[sn.segment_num], sort_by_time=sort_by_time, services=services)
 
 
 if __name__ == "__main__":
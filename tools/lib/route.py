@@ -1,7 +1,4 @@
-import os
-import re
 from urllib.parse import urlparse
-from collections import defaultdict
 from itertools import chain
 from typing import Optional
 
@@ -9,6 +6,7 @@ from typing import Optional
 #from tools.lib.auth_config import get_token
 #from tools.lib.api import CommaApi
 from tools.lib.helpers import RE
+from tools.lib.route_index import RouteIndex
 
 QLOG_FILENAMES = ['qlog', 'qlog.bz2']
 QCAMERA_FILENAMES = ['qcamera.ts']
@@ -16,6 +14,9 @@ LOG_FILENAMES = ['rlog', 'rlog.bz2', 'raw_log.bz2']
 CAMERA_FILENAMES = ['fcamera.hevc', 'video.hevc']
 DCAMERA_FILENAMES = ['dcamera.hevc']
 ECAMERA_FILENAMES = ['ecamera.hevc']
+# in the order of the Segment constructor arguments
+SEGMENT_FILENAMES = [LOG_FILENAMES, QLOG_FILENAMES, CAMERA_FILENAMES, DCAMERA_FILENAMES, ECAMERA_FILENAMES, QCAMERA_FILENAMES]
+SEGMENT_FILE_KINDS = {fn: kind for kind, filenames in enumerate(SEGMENT_FILENAMES) for fn in filenames}
 
 class Route:
   def __init__(self, name, data_dir=None):
@@ -93,67 +94,19 @@ class Route:
     return sorted(segments.values(), key=lambda seg: seg.name.segment_num)
 
   def _get_segments_local(self, data_dir):
-    files = os.listdir(data_dir)
-    segment_files = defaultdict(list)
-
-    for f in files:
-      fullpath = os.path.join(data_dir, f)
-      explorer_match = re.match(RE.EXPLORER_FILE, f)
-      op_match = re.match(RE.OP_SEGMENT_DIR, f)
-
-      if explorer_match:
-        segment_name = explorer_match.group('segment_name')
-        fn = explorer_match.group('file_name')
-        if segment_name.replace('_', '|').startswith(self.name.canonical_name):
-          segment_files[segment_name].append((fullpath, fn))
-      elif op_match and os.path.isdir(fullpath):
-        segment_name = op_match.group('segment_name')
-        if segment_name.startswith(self.name.canonical_name):
-          for seg_f in os.listdir(fullpath):
-            segment_files[segment_name].append((os.path.join(fullpath, seg_f), seg_f))
-      elif f == self.name.canonical_name:
-        for seg_num in os.listdir(fullpath):
-          if not seg_num.isdigit():
-            continue
-
-          segment_name = f'{self.name.canonical_name}--{seg_num}'
-          for seg_f in os.listdir(os.path.join(fullpath, seg_num)):
-            segment_files[segment_name].append((os.path.join(fullpath, seg_num, seg_f), seg_f))
+    with RouteIndex(data_dir) as index:
+      segment_files = index.route_files(self.name.canonical_name)
 
     segments = []
     for segment, files in segment_files.items():
-
-      try:
-        log_path = next(path for path, filename in files if filename in LOG_FILENAMES)
-      except StopIteration:
-        log_path = None
-
-      try:
-        qlog_path = next(path for path, filename in files if filename in QLOG_FILENAMES)
-      except StopIteration:
-        qlog_path = None
-
-      try:
-        camera_path = next(path for path, filename in files if filename in CAMERA_FILENAMES)
-      except StopIteration:
-        camera_path = None
-
-      try:
-        dcamera_path = next(path for path, filename in files if filename in DCAMERA_FILENAMES)
-      except StopIteration:
-        dcamera_path = None
-
-      try:
-        ecamera_path = next(path for path, filename in files if filename in ECAMERA_FILENAMES)
-      except StopIteration:
-        ecamera_path = None
-
-      try:
-        qcamera_path = next(path for path, filename in files if filename in QCAMERA_FILENAMES)
-      except StopIteration:
-        qcamera_path = None
-
-      segments.append(Segment(segment, log_path, qlog_path, camera_path, dcamera_path, ecamera_path, qcamera_path))
+      # the first file matching each kind wins
+      paths = {}
+      for path, filename in files:
+        kind = SEGMENT_FILE_KINDS.get(filename)
+        if kind is not None and kind not in paths:
+          paths[kind] = path
+
+      segments.append(Segment(segment, *(paths.get(kind) for kind in range(len(SEGMENT_FILENAMES)))))
 
     if len(segments) == 0:
       raise ValueError(f'Could not find segments for route {self.name.canonical_name} in data directory {data_dir}')
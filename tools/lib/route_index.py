@@ -0,0 +1,154 @@
+import os
+import re
+import sqlite3
+from collections import defaultdict
+
+from common.file_helpers import mkdirs_exists_ok
+from tools.lib.helpers import RE
+from tools.lib.url_file import CACHE_DIR, hash_256
+
+EXPLORER_FILE = 'explorer_file'
+SEGMENT_DIR = 'segment_dir'
+ROUTE_DIR = 'route_dir'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS data_dir (path TEXT PRIMARY KEY, mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS entries (name TEXT PRIMARY KEY, kind TEXT, route TEXT, segment_name TEXT, signature TEXT);
+CREATE TABLE IF NOT EXISTS files (entry TEXT, route TEXT, segment_name TEXT, path TEXT, fn TEXT);
+CREATE INDEX IF NOT EXISTS entries_route ON entries (route);
+CREATE INDEX IF NOT EXISTS files_route ON files (route);
+CREATE INDEX IF NOT EXISTS files_entry ON files (entry);
+"""
+
+
+def classify_entry(data_dir, name):
+  """Returns (kind, route, segment_name) for a top level entry of a data dir, or None if it isn't part of a route.
+     route is the canonical name of the route the entry belongs to."""
+  explorer_match = re.match(RE.EXPLORER_FILE, name)
+  if explorer_match:
+    route = f"{explorer_match.group('dongle_id')}|{explorer_match.group('timestamp')}"
+    return EXPLORER_FILE, route, explorer_match.group('segment_name')
+
+  fullpath = os.path.join(data_dir, name)
+  op_match = re.match(RE.OP_SEGMENT_DIR, name)
+  if op_match and os.path.isdir(fullpath):
+    route = f"{op_match.group('dongle_id')}|{op_match.group('timestamp')}"
+    # only segment dirs named with the canonical separator are matched
+    return SEGMENT_DIR, route if name.startswith(route) else None, op_match.group('segment_name')
+
+  if re.match(f"^{RE.ROUTE_NAME}$", name) and '|' in name and os.path.isdir(fullpath):
+    return ROUTE_DIR, name, None
+  return None
+
+
+class RouteIndex:
+  """Persistent index of the segment files in a local data dir, stored in sqlite.
+
+     The top level of the data dir is only listed again when its mtime changes, and the directories of a
+     route only when their own mtimes change, so looking up a route costs a few stats instead of a walk.
+  """
+  def __init__(self, data_dir, db_path=None):
+    self.data_dir = os.path.abspath(data_dir)
+    if db_path is None:
+      mkdirs_exists_ok(CACHE_DIR)
+      db_path = os.path.join(CACHE_DIR, f"route_index_{hash_256(self.data_dir)}.db")
+    self._db = sqlite3.connect(db_path, timeout=30)
+    with self._db:
+      self._db.executescript(SCHEMA)
+
+  def close(self):
+    self._db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def _update_top_level(self):
+    mtime_ns = os.stat(self.data_dir).st_mtime_ns
+    row = self._db.execute("SELECT mtime_ns FROM data_dir WHERE path = ?", (self.data_dir,)).fetchone()
+    if row is not None and row[0] == mtime_ns:
+      return
+
+    names = set(os.listdir(self.data_dir))
+    with self._db:
+      # takes the write lock before reading, so another process refreshing the same index waits for this one
+      self._db.execute("BEGIN IMMEDIATE")
+      row = self._db.execute("SELECT mtime_ns FROM data_dir WHERE path = ?", (self.data_dir,)).fetchone()
+      if row is not None and row[0] == mtime_ns:
+        return
+
+      known = {name for name, in self._db.execute("SELECT name FROM entries")}
+      for name in known - names:
+        self._db.execute("DELETE FROM entries WHERE name = ?", (name,))
+        self._db.execute("DELETE FROM files WHERE entry = ?", (name,))
+
+      for name in names - known:
+        # unrelated entries are kept too, so they aren't classified again on every change
+        kind, route, segment_name = classify_entry(self.data_dir, name) or (None, None, None)
+        # directories are listed lazily, when their route is looked up
+        self._db.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?)", (name, kind, route, segment_name, None))
+        if kind == EXPLORER_FILE:
+          fn = re.match(RE.EXPLORER_FILE, name).group('file_name')
+          self._db.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+                           (name, route, segment_name, os.path.join(self.data_dir, name), fn))
+
+      self._db.execute("INSERT OR REPLACE INTO data_dir VALUES (?, ?)", (self.data_dir, mtime_ns))
+
+  def _list_entry(self, name, kind, route, segment_name):
+    """Returns the files of a directory entry as (segment_name, path, filename)."""
+    fullpath = os.path.join(self.data_dir, name)
+    if kind == SEGMENT_DIR:
+      return [(segment_name, os.path.join(fullpath, seg_f), seg_f) for seg_f in os.listdir(fullpath)]
+
+    files = []
+    for seg_num in os.listdir(fullpath):
+      if not seg_num.isdigit():
+        continue
+      for seg_f in os.listdir(os.path.join(fullpath, seg_num)):
+        files.append((f'{route}--{seg_num}', os.path.join(fullpath, seg_num, seg_f), seg_f))
+    return files
+
+  def _signature(self, name, kind):
+    """mtimes of the directories that make up an entry, any file added or removed changes one of them."""
+    fullpath = os.path.join(self.data_dir, name)
+    if kind == SEGMENT_DIR:
+      return str(os.stat(fullpath).st_mtime_ns)
+
+    mtimes = [str(os.stat(fullpath).st_mtime_ns)]
+    for seg_num in sorted(os.listdir(fullpath)):
+      if seg_num.isdigit():
+        mtimes.append(f"{seg_num}:{os.stat(os.path.join(fullpath, seg_num)).st_mtime_ns}")
+    return ",".join(mtimes)
+
+  def _update_route(self, route):
+    entries = self._db.execute("SELECT name, kind, segment_name, signature FROM entries WHERE route = ? AND kind != ?",
+                               (route, EXPLORER_FILE)).fetchall()
+    for name, kind, segment_name, signature in entries:
+      try:
+        # taken before listing, a change while listing only makes the next lookup list the entry again
+        new_signature = self._signature(name, kind)
+        if new_signature == signature:
+          continue
+        signature, files = new_signature, self._list_entry(name, kind, route, segment_name)
+      except FileNotFoundError:
+        # removed since the top level was listed, picked up on its next mtime change
+        signature, files = None, []
+
+      with self._db:
+        self._db.execute("DELETE FROM files WHERE entry = ?", (name,))
+        self._db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+                             [(name, route, seg, path, fn) for seg, path, fn in files])
+        self._db.execute("UPDATE entries SET signature = ? WHERE name = ?", (signature, name))
+
+  def route_files(self, route):
+    """Returns {segment_name: [(path, filename), ...]} for all files of a route, by its canonical name."""
+    self._update_top_level()
+    self._update_route(route)
+
+    segment_files = defaultdict(list)
+    for segment_name, path, fn in self._db.execute("SELECT segment_name, path, fn FROM files WHERE route = ? ORDER BY rowid",
+                                                   (route,)):
+      segment_files[segment_name].append((path, fn))
+    return segment_files
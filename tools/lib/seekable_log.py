@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import os
+import sys
+import bz2
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from cereal import log as capnp_log
+from common.file_helpers import atomic_write_in_dir
+from tools.lib.logreader import FRAME_STRUCT, TRAILER_STRUCT, SEEKABLE_MAGIC, Frame, capnp_message_size, read_frame_index
+from tools.lib.route import LOG_FILENAMES, QLOG_FILENAMES
+
+# uncompressed size of a frame. bz2 compresses in 900k blocks, so larger frames barely compress better
+FRAME_BYTES = 1024 * 1024
+
+
+def split_frames(dat, frame_bytes=FRAME_BYTES):
+  """Splits raw events into runs of about frame_bytes. Yields (begin, end, count, start_time, end_time) of each."""
+  events = capnp_log.Event.read_multiple_bytes(dat)
+  begin = end = count = 0
+  start_time = end_time = None
+  while end < len(dat):
+    size = capnp_message_size(dat, end)
+    if size is None or end + size > len(dat):
+      raise ValueError(f"truncated event at {end}")
+
+    t = next(events).logMonoTime
+    start_time = t if start_time is None else min(start_time, t)
+    end_time = t if end_time is None else max(end_time, t)
+    end += size
+    count += 1
+    if end - begin >= frame_bytes or end == len(dat):
+      yield begin, end, count, start_time, end_time
+      begin, count = end, 0
+      start_time = end_time = None
+
+
+def write_seekable_log(dat, f, frame_bytes=FRAME_BYTES):
+  """Writes raw events to f as a seekable log, see read_frame_index. Returns its frames."""
+  frames = []
+  offset = 0
+  for begin, end, count, start_time, end_time in split_frames(dat, frame_bytes):
+    compressed = bz2.compress(dat[begin:end])
+    f.write(compressed)
+    frames.append(Frame(offset, len(compressed), count, start_time, end_time))
+    offset += len(compressed)
+
+  for frame in frames:
+    f.write(FRAME_STRUCT.pack(*frame))
+  f.write(TRAILER_STRUCT.pack(len(frames), SEEKABLE_MAGIC))
+  return frames
+
+
+def convert_log(path, frame_bytes=FRAME_BYTES):
+  """Rewrites a log in place as a seekable log. Returns False if it already was one or is empty."""
+  with open(path, "rb") as f:
+    dat = f.read()
+  if not dat or read_frame_index(dat) is not None:
+    return False
+
+  if dat.startswith(b'BZh9'):
+    dat = bz2.decompress(dat)
+  with atomic_write_in_dir(path, mode="wb", overwrite=True) as f:
+    write_seekable_log(dat, f, frame_bytes)
+  return True
+
+
+def find_logs(paths):
+  """Yields the rlogs and qlogs in paths, searching directories recursively."""
+  names = tuple(LOG_FILENAMES + QLOG_FILENAMES)
+  # explorer style files are named <segment>--<name>
+  suffixes = tuple('--' + name for name in names)
+  for path in paths:
+    if os.path.isfile(path):
+      yield path
+      continue
+
+    for root, _, files in os.walk(path):
+      for fn in sorted(files):
+        if fn in names or fn.endswith(suffixes):
+          yield os.path.join(root, fn)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Converts logs in place to seekable logs, which LogReader can read by time range")
+  parser.add_argument("--frame-bytes", type=int, default=FRAME_BYTES, help="Uncompressed size of a frame")
+  parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of logs converted in parallel")
+  parser.add_argument("paths", nargs='+', help="Logs or directories to convert")
+
+  if len(sys.argv) == 1:
+    parser.print_help()
+    sys.exit()
+  args = parser.parse_args()
+
+  logs = list(find_logs(args.paths))
+  with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+    for path, converted in zip(logs, pool.map(convert_log, logs, [args.frame_bytes] * len(logs))):
+      print(f"{path}: {'converted' if converted else 'skipped'}")
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+
+from tools.lib.log_cache import LogCache
+
+
+class TestLogCache(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.cache = LogCache(self.tmp.name, max_bytes=3000)
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def test_roundtrip(self):
+    self.assertIsNone(self.cache.get("a"))
+    self.cache.put("a", b"x" * 1000)
+    self.assertEqual(self.cache.get("a")[:], b"x" * 1000)
+    self.assertEqual(self.cache.get_or_put("a", lambda: b"y")[:], b"x" * 1000)
+
+  def test_lru_eviction(self):
+    for i, key in enumerate("abc"):
+      self.cache.put(key, b"x" * 1000)
+      os.utime(os.path.join(self.tmp.name, key + ".rlog"), (i, i))
+
+    # reading a makes b the least recently used entry
+    self.cache.get("a")
+    self.cache.put("d", b"x" * 1000)
+    self.assertIsNone(self.cache.get("b"))
+    for key in "acd":
+      self.assertIsNotNone(self.cache.get(key))
+
+
+if __name__ == "__main__":
+  unittest.main()
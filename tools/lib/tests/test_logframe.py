@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import tempfile
+import unittest
+
+import numpy as np
+
+from cereal import log as capnp_log
+from tools.lib.logframe import LogFrame, TIME_COLUMN, write_logframe
+
+
+class TestLogFrame(unittest.TestCase):
+  def test_roundtrip(self):
+    events = []
+    for i in range(100):
+      msg = capnp_log.Event.new_message(logMonoTime=i * int(1e7))
+      if i % 2:
+        msg.init('carState')
+        msg.carState.vEgo = i / 10.
+        msg.carState.cruiseState.enabled = i % 4 == 1
+      else:
+        msg.init('controlsState')
+        msg.controlsState.curvature = i / 100.
+      events.append(msg.as_reader())
+
+    with tempfile.TemporaryDirectory() as tmp:
+      write_logframe(events, tmp, services=['carState', 'controlsState'])
+      lf = LogFrame(tmp)
+      self.assertEqual(lf.services, ['carState', 'controlsState'])
+
+      cs = lf['carState']
+      self.assertIsInstance(cs['vEgo'], np.memmap)
+      np.testing.assert_array_equal(cs[TIME_COLUMN], np.arange(1, 100, 2) * int(1e7))
+      np.testing.assert_allclose(cs['vEgo'], np.arange(1, 100, 2) / 10., rtol=1e-6)
+      np.testing.assert_array_equal(cs['cruiseState.enabled'], np.arange(1, 100, 2) % 4 == 1)
+      np.testing.assert_allclose(lf['controlsState']['curvature'], np.arange(0, 100, 2) / 100., rtol=1e-6)
+
+
+if __name__ == "__main__":
+  unittest.main()
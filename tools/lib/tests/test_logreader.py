@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+import bz2
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from cereal import log as capnp_log
+from tools.lib.logreader import LogReader, MultiLogIterator, PREFETCH_BYTES, capnp_message_size, message_which, \
+                                get_log_services
+
+
+def make_log(ts, services=('carState',)):
+  msgs = []
+  for i, t in enumerate(ts):
+    msg = capnp_log.Event.new_message(logMonoTime=t)
+    msg.init(services[i % len(services)])
+    msgs.append(msg.to_bytes())
+  return b"".join(msgs)
+
+
+class TestLogReader(unittest.TestCase):
+  def setUp(self):
+    self.ts = [int(1e9) + i * int(1e7) for i in range(2000)]
+    self.dat = make_log(self.ts)
+
+    # the services of filtered reads are cached next to the downloads
+    cache_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(cache_dir.cleanup)
+    patcher = mock.patch("tools.lib.logreader.CACHE_DIR", cache_dir.name)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_message_size(self):
+    msg = capnp_log.Event.new_message(logMonoTime=1).to_bytes()
+    self.assertEqual(capnp_message_size(msg), len(msg))
+    self.assertEqual(capnp_message_size(msg + msg, len(msg)), len(msg))
+    self.assertIsNone(capnp_message_size(msg[:3]))
+
+  def test_stream_matches_eager(self):
+    for dat in (self.dat, bz2.compress(self.dat)):
+      with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, "rlog")
+        with open(fn, "wb") as f:
+          f.write(dat)
+
+        eager = [m.logMonoTime for m in LogReader(fn)]
+        streamed = [m.logMonoTime for m in LogReader(fn, stream=True)]
+        self.assertEqual(eager, self.ts)
+        self.assertEqual(streamed, self.ts)
+
+  def test_stream_sort_by_time(self):
+    ts = list(self.ts)
+    # shuffle within small windows, like the jitter between services in a real log
+    for i in range(0, len(ts), 10):
+      window = ts[i:i+10]
+      random.shuffle(window)
+      ts[i:i+10] = window
+
+    lr = LogReader.from_bytes(make_log(ts))
+    streamed = LogReader("", dat=bz2.compress(make_log(ts)), sort_by_time=True, stream=True, reorder_window=20)
+    self.assertEqual([m.logMonoTime for m in lr], ts)
+    self.assertEqual([m.logMonoTime for m in streamed], self.ts)
+
+  def test_message_which(self):
+    for service in ('carState', 'controlsState', 'can'):
+      msg = capnp_log.Event.new_message(logMonoTime=1)
+      msg.init(service)
+      self.assertEqual(message_which(msg.to_bytes()), service)
+
+  def test_services(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      fn = os.path.join(tmp, "rlog")
+      with open(fn, "wb") as f:
+        f.write(make_log(self.ts, services=('carState', 'controlsState', 'can')))
+
+      for stream in (False, True):
+        lr = list(LogReader(fn, services=['carState', 'can'], stream=stream))
+        self.assertEqual(len(lr), sum(1 for i in range(len(self.ts)) if i % 3 != 1))
+        self.assertEqual({m.which() for m in lr}, {'carState', 'can'})
+        self.assertEqual(get_log_services(fn), {'carState', 'controlsState', 'can'})
+
+      # the cached services let a reader skip the file without opening it
+      self.assertEqual(len(list(LogReader(fn, services=['gpsLocationExternal']))), 0)
+
+  def test_multilog_seek(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      log_paths = []
+      for seg in range(3):
+        fn = os.path.join(tmp, f"rlog{seg}")
+        with open(fn, "wb") as f:
+          f.write(make_log([int(60e9) * seg + int(0.5e9) + i * int(1e8) for i in range(600)]))
+        log_paths.append(fn)
+
+      mli = MultiLogIterator(log_paths)
+      # forwards, backwards and across segment boundaries
+      for ts in (65., 5., 120.2, 59.95, 0.):
+        self.assertTrue(mli.seek(ts))
+        self.assertGreaterEqual(mli.tell(), ts)
+        self.assertLess(mli.tell() - ts, 0.1 + 1e-6)
+      self.assertFalse(mli.seek(200.))
+
+  def test_multilog_seek_unsorted(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      ts = [int(0.5e9) + i * int(1e8) for i in range(600)]
+      for i in range(0, len(ts), 10):
+        window = ts[i:i+10]
+        random.shuffle(window)
+        ts[i:i+10] = window
+      fn = os.path.join(tmp, "rlog0")
+      with open(fn, "wb") as f:
+        f.write(make_log(ts))
+
+      # without sort_by_time the file order is kept, seek lands on the first event at or after ts
+      mli = MultiLogIterator([fn])
+      sorted_mli = MultiLogIterator([fn], sort_by_time=True)
+      for t in (35., 5.05, 20.3, 0.):
+        target = mli.start_time + int(t * 1e9)
+        self.assertTrue(mli.seek(t))
+        self.assertEqual(mli._idx, next(i for i, x in enumerate(ts) if x >= target))
+        target = sorted_mli.start_time + int(t * 1e9)
+        self.assertTrue(sorted_mli.seek(t))
+        self.assertEqual(next(sorted_mli).logMonoTime, min(x for x in ts if x >= target))
+
+  def test_multilog_prefetch(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      log_paths = []
+      for seg in range(4):
+        fn = os.path.join(tmp, f"rlog{seg}.bz2")
+        with open(fn, "wb") as f:
+          f.write(bz2.compress(make_log([int(60e9) * seg + int(0.5e9) + i * int(1e8) for i in range(600)])))
+        log_paths.append(fn)
+      # a missing segment in the middle
+      log_paths.insert(2, None)
+
+      expected = [m.logMonoTime for m in MultiLogIterator(log_paths)]
+      for prefetch_bytes in (PREFETCH_BYTES, 1):
+        with MultiLogIterator(log_paths, prefetch=2, prefetch_bytes=prefetch_bytes) as mli:
+          self.assertEqual([m.logMonoTime for m in mli], expected)
+          # the pool is shut down once the iteration is done
+          self.assertIsNone(mli._pool)
+
+      plain = MultiLogIterator(log_paths)
+      with MultiLogIterator(log_paths, prefetch=2) as prefetched:
+        for ts in (65., 5., 130.2, 200.2, 59.95, 0.):
+          self.assertEqual(plain.seek(ts), prefetched.seek(ts))
+          self.assertEqual([next(plain).logMonoTime for _ in range(300)], [next(prefetched).logMonoTime for _ in range(300)])
+      self.assertIsNone(prefetched._pool)
+
+
+if __name__ == "__main__":
+  unittest.main()
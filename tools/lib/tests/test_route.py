@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from tools.lib.route import Route
+from tools.lib.route_index import RouteIndex
+
+ROUTE = "a2a0ccea32023010|2023-07-27--13-01-19"
+
+
+class TestLocalRoute(unittest.TestCase):
+  def setUp(self):
+    self.data_dir = tempfile.TemporaryDirectory()
+    self.index_dir = tempfile.TemporaryDirectory()
+    self.patcher = mock.patch("tools.lib.route_index.CACHE_DIR", self.index_dir.name)
+    self.patcher.start()
+
+  def tearDown(self):
+    self.patcher.stop()
+    self.data_dir.cleanup()
+    self.index_dir.cleanup()
+
+  def _touch(self, *path):
+    path = os.path.join(self.data_dir.name, *path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+    return path
+
+  def test_layouts(self):
+    rlog = self._touch(f"{ROUTE}--0", "rlog.bz2")
+    qlog = self._touch(f"{ROUTE}--1--qlog.bz2")
+    fcamera = self._touch(ROUTE, "2", "fcamera.hevc")
+    self._touch("ffffffffffffffff|2023-07-27--13-01-19--0", "rlog.bz2")
+
+    r = Route(ROUTE, self.data_dir.name)
+    self.assertEqual(r.log_paths(), [rlog, None, None])
+    self.assertEqual(r.qlog_paths(), [None, qlog, None])
+    self.assertEqual(r.camera_paths(), [None, None, fcamera])
+
+  def test_index_updates(self):
+    self._touch(f"{ROUTE}--0", "rlog.bz2")
+    self.assertEqual(Route(ROUTE, self.data_dir.name).max_seg_number, 0)
+
+    # new segments and files in known segments are picked up
+    rlog = self._touch(f"{ROUTE}--1", "rlog.bz2")
+    qlog = self._touch(f"{ROUTE}--0", "qlog.bz2")
+    r = Route(ROUTE, self.data_dir.name)
+    self.assertEqual(r.log_paths()[1], rlog)
+    self.assertEqual(r.qlog_paths()[0], qlog)
+
+  def test_concurrent_refresh(self):
+    for i in range(200):
+      self._touch(f"{ROUTE}--{i}--rlog.bz2")
+    db_path = os.path.join(self.index_dir.name, "route_index.db")
+    barrier = threading.Barrier(4)
+    results, errors = [], []
+
+    def refresh():
+      try:
+        with RouteIndex(self.data_dir.name, db_path) as index:
+          barrier.wait()
+          results.append(len(index.route_files(ROUTE)))
+      except Exception as e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=refresh) for _ in range(barrier.parties)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(errors, [])
+    self.assertEqual(results, [200] * barrier.parties)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import bz2
+import os
+import tempfile
+import unittest
+
+from tools.lib.logreader import LogReader, read_frame_index, frames_in_range
+from tools.lib.seekable_log import convert_log
+from tools.lib.tests.test_logreader import make_log
+
+
+class TestSeekableLog(unittest.TestCase):
+  def setUp(self):
+    self.ts = [int(1e9) + i * int(1e7) for i in range(2000)]
+    self.dat = make_log(self.ts)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.fn = os.path.join(self.tmp.name, "rlog.bz2")
+    with open(self.fn, "wb") as f:
+      f.write(bz2.compress(self.dat))
+    self.assertTrue(convert_log(self.fn, frame_bytes=len(self.dat) // 10))
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def test_convert(self):
+    with open(self.fn, "rb") as f:
+      dat = f.read()
+    frames = read_frame_index(dat)
+    self.assertGreaterEqual(len(frames), 10)
+    self.assertEqual(sum(f.count for f in frames), len(self.ts))
+    # still a plain bz2 file
+    self.assertEqual(bz2.decompress(dat), self.dat)
+    self.assertFalse(convert_log(self.fn))
+
+  def test_read(self):
+    for stream in (False, True):
+      self.assertEqual([m.logMonoTime for m in LogReader(self.fn, stream=stream)], self.ts)
+
+  def test_time_range(self):
+    time_range = (self.ts[1500], self.ts[1600])
+    with open(self.fn, "rb") as f:
+      frames = read_frame_index(f)
+    self.assertLess(len(frames_in_range(frames, time_range)), len(frames) // 2)
+
+    for stream in (False, True):
+      lr = LogReader(self.fn, stream=stream, time_range=time_range)
+      self.assertEqual([m.logMonoTime for m in lr], self.ts[1500:1600])
+      lr = LogReader(self.fn, stream=stream, time_range=(self.ts[-5], None))
+      self.assertEqual([m.logMonoTime for m in lr], self.ts[-5:])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import tools.lib.url_file as url_file
+from tools.lib.url_file import CHUNK_SIZE, HotChunks, URLFile, evict_cache
+
+DATA = os.urandom(3 * CHUNK_SIZE + 12345)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+  def log_message(self, *args):
+    pass
+
+  def do_HEAD(self):
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(DATA)))
+    self.end_headers()
+
+  def do_GET(self):
+    server = self.server
+    with server.lock:
+      server.in_flight += 1
+      server.max_in_flight = max(server.max_in_flight, server.in_flight)
+    try:
+      # slow enough for the chunk requests to overlap
+      time.sleep(0.05)
+      m = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+      if m is None:
+        server.requests.append(None)
+        self.send_response(200)
+        body = DATA
+      else:
+        start = int(m.group(1))
+        end = int(m.group(2)) + 1 if m.group(2) else len(DATA)
+        server.requests.append(start)
+        body = DATA[start:end]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{start + len(body) - 1}/{len(DATA)}")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    finally:
+      with server.lock:
+        server.in_flight -= 1
+
+
+class TestURLFile(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    cls.server.lock = threading.Lock()
+    cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+    cls.server_thread.start()
+    cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/rlog.bz2"
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+
+  def setUp(self):
+    self.server.requests = []
+    self.server.in_flight = 0
+    self.server.max_in_flight = 0
+
+    cache_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(cache_dir.cleanup)
+    self.cache_dir = cache_dir.name + "/"
+    for patcher in (mock.patch.object(url_file, "CACHE_DIR", self.cache_dir),
+                    mock.patch.object(URLFile, "_hot_chunks", HotChunks(url_file.HOT_CACHE_BYTES))):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def test_read_types(self):
+    for cache in (True, False):
+      f = URLFile(self.url, cache=cache)
+      f.seek(CHUNK_SIZE - 10)
+      dat = f.read(CHUNK_SIZE + 20)
+      self.assertIsInstance(dat, bytes)
+      self.assertEqual(dat, DATA[CHUNK_SIZE - 10:2 * CHUNK_SIZE + 10])
+
+      f.seek(len(DATA))
+      self.assertEqual(f.read(10), b"")
+      f.seek(0)
+      self.assertEqual(f.read(), DATA)
+
+  def test_parallel_download(self):
+    f = URLFile(self.url, cache=True)
+    self.assertEqual(f.read(), DATA)
+    # every chunk is downloaded once, the ones after the first in parallel
+    self.assertEqual(sorted(self.server.requests), [i * CHUNK_SIZE for i in range(4)])
+    self.assertGreater(self.server.max_in_flight, 1)
+
+    # and then read from the cache
+    self.server.requests.clear()
+    for hot_chunks in (URLFile._hot_chunks, HotChunks(url_file.HOT_CACHE_BYTES)):
+      with mock.patch.object(URLFile, "_hot_chunks", hot_chunks):
+        f = URLFile(self.url, cache=True)
+        f.seek(100)
+        self.assertEqual(f.read(3 * CHUNK_SIZE), DATA[100:3 * CHUNK_SIZE + 100])
+    self.assertEqual(self.server.requests, [])
+
+  def test_hot_chunks_bounded(self):
+    hot = HotChunks(3 * 100)
+    for i in range(5):
+      hot.put(i, bytes(100))
+    self.assertIsNone(hot.get(0))
+    self.assertIsNone(hot.get(1))
+    # used chunks are kept over older ones
+    self.assertIsNotNone(hot.get(2))
+    hot.put(5, bytes(100))
+    self.assertIsNotNone(hot.get(2))
+    self.assertIsNone(hot.get(3))
+    self.assertLessEqual(hot._size, hot.max_bytes)
+    # chunks larger than the whole cache aren't kept
+    hot.put(6, bytes(400))
+    self.assertIsNone(hot.get(6))
+
+  def test_evict_cache(self):
+    f = URLFile(self.url, cache=True)
+    f.read()
+    chunk_files = sorted(fn for fn in os.listdir(self.cache_dir) if url_file.CHUNK_FILE_RE.match(fn))
+    self.assertEqual(len(chunk_files), 4)
+
+    # the least recently used chunks go first
+    for i, fn in enumerate(chunk_files):
+      os.utime(os.path.join(self.cache_dir, fn), (1000 + i, 1000 + i))
+    evict_cache(max_bytes=2 * CHUNK_SIZE)
+    left = sorted(fn for fn in os.listdir(self.cache_dir) if url_file.CHUNK_FILE_RE.match(fn))
+    self.assertEqual(left, chunk_files[2:])
+
+
+if __name__ == "__main__":
+  unittest.main()
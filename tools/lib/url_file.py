@@ -1,11 +1,15 @@
 # pylint: skip-file
 
 import os
+import re
 import time
+import fcntl
 import tempfile
 import threading
 import urllib.parse
 import pycurl
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha256
 from io import BytesIO
 from tenacity import retry, wait_random_exponential, stop_after_attempt
@@ -15,6 +19,18 @@ K = 1000
 CHUNK_SIZE = 1000 * K
 
 CACHE_DIR = os.environ.get("FLOWDRIVE_CACHE", "/tmp/flowdrive_download_cache/")
+# number of chunks downloaded in parallel, shared by all URLFiles in the process
+CONCURRENCY = int(os.environ.get("URLFILE_CONCURRENCY", "8"))
+# size limit of the chunks in CACHE_DIR, the least recently used ones are removed beyond it
+CACHE_MAX_BYTES = int(os.environ.get("FLOWDRIVE_CACHE_BYTES", 10 * 1000 * 1000 * K))
+# the cache is trimmed every time this many bytes were written to it
+EVICT_INTERVAL = 64 * CHUNK_SIZE
+# size limit of the in-process cache of recently used chunks
+HOT_CACHE_BYTES = int(os.environ.get("URLFILE_HOT_CACHE_BYTES", 64 * CHUNK_SIZE))
+
+CHUNK_FILE_RE = re.compile(r"^[0-9a-f]{64}_[0-9]+\.0$")
+
+CONTENT_RANGE_RE = re.compile(rb"^content-range:\s*bytes\s+\d+-\d+/(\d+)", re.IGNORECASE)
 
 
 def hash_256(link):
@@ -22,11 +38,70 @@ def hash_256(link):
   return hsh
 
 
+def evict_cache(max_bytes=CACHE_MAX_BYTES):
+  """Removes the least recently used chunks until the ones in CACHE_DIR fit in max_bytes."""
+  fd = os.open(CACHE_DIR, 0)
+  fcntl.flock(fd, fcntl.LOCK_EX)
+  try:
+    chunks = []
+    for fn in os.listdir(CACHE_DIR):
+      if CHUNK_FILE_RE.match(fn):
+        try:
+          st = os.stat(os.path.join(CACHE_DIR, fn))
+        except FileNotFoundError:
+          continue
+        chunks.append((st.st_mtime, st.st_size, fn))
+
+    total = sum(size for _, size, _ in chunks)
+    for _, size, fn in sorted(chunks):
+      if total <= max_bytes:
+        break
+      os.remove(os.path.join(CACHE_DIR, fn))
+      total -= size
+  finally:
+    os.close(fd)
+
+
+class HotChunks:
+  """Thread safe, in-process LRU cache of chunks, bounded by their total size."""
+  def __init__(self, max_bytes):
+    self.max_bytes = max_bytes
+    self._size = 0
+    self._chunks = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      data = self._chunks.get(key)
+      if data is not None:
+        self._chunks.move_to_end(key)
+      return data
+
+  def put(self, key, data):
+    if len(data) > self.max_bytes:
+      return
+    with self._lock:
+      old = self._chunks.pop(key, None)
+      if old is not None:
+        self._size -= len(old)
+      self._chunks[key] = data
+      self._size += len(data)
+      while self._size > self.max_bytes:
+        _, old = self._chunks.popitem(last=False)
+        self._size -= len(old)
+
+
 class URLFile:
   _tlocal = threading.local()
+  # the download threads and their curl handles are shared between files, so keep-alive connections are reused
+  _pool = None
+  _pool_lock = threading.Lock()
+  _hot_chunks = HotChunks(HOT_CACHE_BYTES)
+  _written_bytes = 0
 
   def __init__(self, url, debug=False, cache=None):
     self._url = url
+    self._url_hash = hash_256(url)
     self._pos = 0
     self._length = None
     self._local_file = None
@@ -36,11 +111,23 @@ class URLFile:
     if cache is not None:
       self._force_download = not cache
 
+    self._curl = self._get_curl()
+    mkdirs_exists_ok(CACHE_DIR)
+
+  @classmethod
+  def _get_curl(cls):
     try:
-      self._curl = self._tlocal.curl
+      return cls._tlocal.curl
     except AttributeError:
-      self._curl = self._tlocal.curl = pycurl.Curl()
-    mkdirs_exists_ok(CACHE_DIR)
+      cls._tlocal.curl = pycurl.Curl()
+      return cls._tlocal.curl
+
+  @classmethod
+  def _get_pool(cls):
+    with cls._pool_lock:
+      if cls._pool is None:
+        cls._pool = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="urlfile")
+      return cls._pool
 
   def __enter__(self):
     return self
@@ -65,70 +152,120 @@ class URLFile:
     c.reset()
     return length
 
+  def _length_path(self):
+    return os.path.join(CACHE_DIR, self._url_hash + "_length")
+
+  def _set_length(self, length):
+    self._length = length
+    if not self._force_download and not os.path.exists(self._length_path()):
+      with atomic_write_in_dir(self._length_path(), mode="w", overwrite=True) as file_length:
+        file_length.write(str(self._length))
+
+  def _get_cached_length(self):
+    if self._length is None and not self._force_download and os.path.exists(self._length_path()):
+      with open(self._length_path()) as file_length:
+        self._length = int(file_length.read())
+    return self._length
+
   def get_length(self):
-    if self._length is not None:
+    if self._get_cached_length() is not None:
       return self._length
-    file_length_path = os.path.join(CACHE_DIR, hash_256(self._url) + "_length")
-    if os.path.exists(file_length_path) and not self._force_download:
-      with open(file_length_path) as file_length:
-          content = file_length.read()
-          self._length = int(content)
-          return self._length
-
-    self._length = self.get_length_online()
-    if not self._force_download:
-      with atomic_write_in_dir(file_length_path, mode="w") as file_length:
-        file_length.write(str(self._length))
+
+    self._set_length(self.get_length_online())
     return self._length
 
+  def _chunk_path(self, chunk_number):
+    # chunk numbers used to be floats, keep the names so existing caches stay valid
+    return os.path.join(CACHE_DIR, self._url_hash + "_" + str(float(chunk_number)))
+
+  @classmethod
+  def _count_written(cls, n):
+    with cls._pool_lock:
+      cls._written_bytes += n
+      evict = cls._written_bytes >= EVICT_INTERVAL
+      if evict:
+        cls._written_bytes = 0
+    if evict:
+      evict_cache()
+
+  def _get_chunk(self, chunk_number):
+    key = (self._url_hash, chunk_number)
+    data = self._hot_chunks.get(key)
+    if data is not None:
+      return data
+
+    full_path = self._chunk_path(chunk_number)
+    try:
+      with open(full_path, "rb") as cached_file:
+        # mtime tracks when the chunk was last used for eviction
+        os.utime(cached_file.fileno())
+        data = cached_file.read()
+    except FileNotFoundError:
+      data = self._download(chunk_number * CHUNK_SIZE, (chunk_number + 1) * CHUNK_SIZE)
+      if len(data):
+        with atomic_write_in_dir(full_path, mode="wb", overwrite=True) as new_cached_file:
+          new_cached_file.write(data)
+        self._count_written(len(data))
+
+    self._hot_chunks.put(key, data)
+    return data
+
   def read(self, ll=None):
     if self._force_download:
       return self.read_aux(ll=ll)
 
     file_begin = self._pos
-    file_end = self._pos + ll if ll is not None else self.get_length()
+    #  We have to align with chunks we store. The first chunk is the latest one that starts before or at our position
+    first_chunk = file_begin // CHUNK_SIZE
+    chunks = {}
+    if self._get_cached_length() is None:
+      #  The response tells us the file length, which saves a HEAD request
+      chunks[first_chunk] = self._get_chunk(first_chunk)
+
+    file_end = self.get_length() if ll is None else min(file_begin + ll, self.get_length())
     assert file_end != -1, f"Remote file is empty or doesn't exist: {self._url}"
-    #  We have to align with chunks we store. Position is the begginiing of the latest chunk that starts before or at our file
-    position = (file_begin // CHUNK_SIZE) * CHUNK_SIZE
-    response = b""
-    while True:
-      self._pos = position
-      chunk_number = self._pos / CHUNK_SIZE
-      file_name = hash_256(self._url) + "_" + str(chunk_number)
-      full_path = os.path.join(CACHE_DIR, str(file_name))
-      data = None
-      #  If we don't have a file, download it
-      if not os.path.exists(full_path):
-        data = self.read_aux(ll=CHUNK_SIZE)
-        with atomic_write_in_dir(full_path, mode="wb") as new_cached_file:
-          new_cached_file.write(data)
-      else:
-        with open(full_path, "rb") as cached_file:
-          data = cached_file.read()
+    if file_begin >= file_end:
+      return b""
+
+    chunk_numbers = range(first_chunk, (file_end - 1) // CHUNK_SIZE + 1)
+    missing = [i for i in chunk_numbers if i not in chunks]
+    if len(missing) > 1:
+      chunks.update(zip(missing, self._get_pool().map(self._get_chunk, missing)))
+    else:
+      chunks.update((i, self._get_chunk(i)) for i in missing)
+
+    #  The chunks are joined through views, so each byte is copied only once into the result
+    parts = []
+    for i in chunk_numbers:
+      src_begin = max(0, file_begin - i * CHUNK_SIZE)
+      src_end = min(len(chunks[i]), file_end - i * CHUNK_SIZE)
+      parts.append(memoryview(chunks[i])[src_begin:src_end])
+    self._pos = file_end
+    return b"".join(parts)
 
-      response += data[max(0, file_begin - position): min(CHUNK_SIZE, file_end - position)]
-
-      position += CHUNK_SIZE
-      if position >= file_end:
-        self._pos = file_end
-        return response
+  def read_aux(self, ll=None):
+    if ll is None:
+      ret = self._download(self._pos) if self._pos != 0 else self._download()
+    else:
+      ret = self._download(self._pos, self._pos + ll)
+    self._pos += len(ret)
+    return ret
 
   @retry(wait=wait_random_exponential(multiplier=1, max=5), stop=stop_after_attempt(3), reraise=True)
-  def read_aux(self, ll=None):
-    download_range = False
+  def _download(self, start=None, end=None):
+    """Downloads bytes [start, end) of the file, the whole file if start is None and until EOF if end is None.
+       Ranges past the end of the file are truncated. Safe to call from several threads at once."""
+    download_range = start is not None
     headers = ["Connection: keep-alive"]
-    if self._pos != 0 or ll is not None:
-      if ll is None:
-        end = self.get_length() - 1
-      else:
-        end = min(self._pos + ll, self.get_length()) - 1
-      if self._pos >= end:
-        return b""
-      headers.append(f"Range: bytes={self._pos}-{end}")
-      download_range = True
+    if download_range:
+      if self._length is not None:
+        end = self._length if end is None else min(end, self._length)
+        if start >= end:
+          return b""
+      headers.append(f"Range: bytes={start}-{end - 1 if end is not None else ''}")
 
     dats = BytesIO()
-    c = self._curl
+    c = self._get_curl()
     c.setopt(pycurl.URL, self._url)
     c.setopt(pycurl.WRITEDATA, dats)
     c.setopt(pycurl.NOSIGNAL, 1)
@@ -136,14 +273,18 @@ class URLFile:
     c.setopt(pycurl.HTTPHEADER, headers)
     c.setopt(pycurl.FOLLOWLOCATION, True)
 
-    if self._debug:
-      print("downloading", self._url)
+    total_length = []
+    def header(x):
+      m = CONTENT_RANGE_RE.match(x)
+      if m:
+        total_length.append(int(m.group(1)))
+      if self._debug and b'MISS' in x:
+        print(x.strip())
 
-      def header(x):
-        if b'MISS' in x:
-          print(x.strip())
+    c.setopt(pycurl.HEADERFUNCTION, header)
 
-      c.setopt(pycurl.HEADERFUNCTION, header)
+    if self._debug:
+      print("downloading", self._url)
 
       def test(debug_type, debug_msg):
        print("  debug(%d): %s" % (debug_type, debug_msg.strip()))
@@ -160,16 +301,18 @@ class URLFile:
         print(f"get {self._url} {headers!r} {t2 - t1:.f} slow")
 
     response_code = c.getinfo(pycurl.RESPONSE_CODE)
-    if response_code == 416:  # Requested Range Not Satisfiable
+    if response_code == 416 and self._length is None:  # Requested Range Not Satisfiable, start is past EOF
+      return b""
+    if response_code == 416:
       raise Exception(f"Error, range out of bounds {response_code} {headers} ({self._url}): {repr(dats.getvalue())[:500]}")
     if download_range and response_code != 206:  # Partial Content
       raise Exception(f"Error, requested range but got unexpected response {response_code} {headers} ({self._url}): {repr(dats.getvalue())[:500]}")
     if (not download_range) and response_code != 200:  # OK
       raise Exception(f"Error {response_code} {headers} ({self._url}): {repr(dats.getvalue())[:500]}")
 
-    ret = dats.getvalue()
-    self._pos += len(ret)
-    return ret
+    if total_length and self._length is None:
+      self._set_length(total_length[-1])
+    return dats.getvalue()
 
   def seek(self, pos):
     self._pos = pos
@@ -10,6 +10,8 @@ import tarfile
 import tempfile
 import requests
 import argparse
+from collections import deque
+from itertools import islice
 
 from common.basedir import BASEDIR
 from tools.lib.logreader import LogReader
@@ -23,16 +25,22 @@ INSTALL_DIR = os.path.join(juggle_dir, "bin")
 PLOTJUGGLER_BIN = os.path.join(juggle_dir, "bin/plotjuggler")
 MINIMUM_PLOTJUGGLER_VERSION = (3, 5, 2)
 MAX_STREAMING_BUFFER_SIZE = 1000
+WORKERS = 24
 
-def save_log(dest, log_msgs, compress=True):
-  dat = b"".join(msg.as_builder().to_bytes() for msg in log_msgs)
+def write_log(f, chunks, compress=True):
+  """Writes an iterable of raw event bytes to a file object as they come, bz2 compressing them on the fly."""
+  compressor = bz2.BZ2Compressor() if compress else None
+  for dat in chunks:
+    f.write(compressor.compress(dat) if compressor else dat)
+  if compressor:
+    f.write(compressor.flush())
 
-  if compress:
-    dat = bz2.compress(dat)
 
+def save_log(dest, log_msgs, compress=True):
   with open(dest, "wb") as f:
-    f.write(dat)
-    
+    write_log(f, (msg.as_builder().to_bytes() for msg in log_msgs), compress)
+
+
 def install():
   m = f"{platform.system()}-{platform.machine()}"
   supported = ("Linux-x86_64")
@@ -60,15 +68,71 @@ def get_plotjuggler_version():
   return tuple(map(int, version.split(".")))
 
 
-def load_segment(segment_name):
+def infer_dbc(msg):
+  try:
+    DBC = __import__(f"selfdrive.car.{msg.carParams.carName}.values", fromlist=['DBC']).DBC
+    return DBC[msg.carParams.carFingerprint]['pt']
+  except Exception:
+    return None
+
+
+def load_segment(segment_name, can=True, services=None, decimation=1):
+  """Returns the events of a log as raw bytes, keeping every decimation'th event of each service, and the DBC name
+     inferred from its first carParams. Runs in the worker processes, so only bytes are sent back. A log that fails
+     to parse returns the events read before the error."""
   if segment_name is None:
-    return []
+    return b"", None
 
+  dat = []
+  dbc = None
+  seen_car_params = False
+  counts = {}
   try:
-    return list(LogReader(segment_name))
+    for msg in LogReader(segment_name, stream=True, services=services):
+      which = msg.which()
+      if not can and which in ('can', 'sendcan'):
+        continue
+      if which == 'carParams' and not seen_car_params:
+        seen_car_params = True
+        dbc = infer_dbc(msg)
+
+      counts[which] = counts.get(which, 0) + 1
+      if (counts[which] - 1) % decimation == 0:
+        dat.append(msg.as_builder().to_bytes())
   except (AssertionError, ValueError) as e:
-    print(f"Error parsing {segment_name}: {e}")
-    return []
+    # stdout may be the merged log
+    print(f"Error parsing {segment_name}: {e}", file=sys.stderr)
+  return b"".join(dat), dbc
+
+
+def _load_segment(args):
+  return load_segment(*args)
+
+
+def merge_segments(logs, f, can=True, services=None, decimation=1, compress=False, workers=WORKERS):
+  """Loads logs in a pool of workers and writes them to f in order, one segment at a time.
+     Returns the DBC name inferred from the first carParams."""
+  if decimation < 1:
+    raise ValueError(f"decimation must be at least 1, got {decimation}")
+
+  dbcs = []
+  with multiprocessing.Pool(workers) as pool:
+    def load(fn):
+      return pool.apply_async(_load_segment, ((fn, can, services, decimation),))
+
+    def chunks():
+      # only a couple of segments per worker are loaded ahead of the writer, so a slow output doesn't
+      # pile up the whole route in memory
+      remaining = iter(logs)
+      pending = deque(load(fn) for fn in islice(remaining, 2 * workers))
+      while pending:
+        dat, dbc = pending.popleft().get()
+        pending.extend(load(fn) for fn in islice(remaining, 1))
+        dbcs.append(dbc)
+        yield dat
+
+    write_log(f, chunks(), compress)
+  return next((dbc for dbc in dbcs if dbc is not None), None)
 
 
 def start_juggler(fn=None, dbc=None, layout=None, route_or_segment_name=None):
@@ -90,7 +154,7 @@ def start_juggler(fn=None, dbc=None, layout=None, route_or_segment_name=None):
   subprocess.call(cmd, shell=True, env=env, cwd=juggle_dir)
 
 
-def juggle_route(route_or_segment_name, segment_count, qlog, can, layout, dbc=None):
+def juggle_route(route_or_segment_name, segment_count, qlog, can, layout, dbc=None, services=None, decimation=1, output=None):
   segment_start = 0
   if 'cabana' in route_or_segment_name:
     query = parse_qs(urlparse(route_or_segment_name).query)
@@ -119,28 +183,27 @@ def juggle_route(route_or_segment_name, segment_count, qlog, can, layout, dbc=No
       print("Please try a different route or segment")
       return
 
-  all_data = []
-  with multiprocessing.Pool(24) as pool:
-    for d in pool.map(load_segment, logs):
-      all_data += d
+  # segments are merged as they are loaded, so only a few are ever in memory
+  if output == '-':
+    merge_segments(logs, sys.stdout.buffer, can, services, decimation, compress=False)
+    return
+  if output is not None:
+    with open(output, "wb") as f:
+      merge_segments(logs, f, can, services, decimation, compress=output.endswith(".bz2"))
+    return
 
-  if not can:
-    all_data = [d for d in all_data if d.which() not in ['can', 'sendcan']]
+  with tempfile.NamedTemporaryFile(suffix='.rlog', dir=juggle_dir) as tmp:
+    # Infer DBC name from logs
+    inferred_dbc = merge_segments(logs, tmp, can, services, decimation, compress=False)
+    tmp.flush()
+    start_juggler(tmp.name, dbc or inferred_dbc, layout, route_or_segment_name)
 
-  # Infer DBC name from logs
-  if dbc is None:
-    for cp in [m for m in all_data if m.which() == 'carParams']:
-      try:
-        DBC = __import__(f"selfdrive.car.{cp.carParams.carName}.values", fromlist=['DBC']).DBC
-        dbc = DBC[cp.carParams.carFingerprint]['pt']
-      except Exception:
-        pass
-      break
 
-  with tempfile.NamedTemporaryFile(suffix='.rlog', dir=juggle_dir) as tmp:
-    save_log(tmp.name, all_data, compress=False)
-    del all_data
-    start_juggler(tmp.name, dbc, layout, route_or_segment_name)
+def positive_int(value):
+  value = int(value)
+  if value < 1:
+    raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+  return value
 
 
 if __name__ == "__main__":
@@ -153,6 +216,10 @@ if __name__ == "__main__":
   parser.add_argument("--layout", nargs='?', help="Run PlotJuggler with a pre-defined layout")
   parser.add_argument("--install", action="store_true", help="Install or update PlotJuggler + plugins")
   parser.add_argument("--dbc", help="Set the DBC name to load for parsing CAN data. If not set, the DBC will be automatically inferred from the logs.")
+  parser.add_argument("--services", nargs='+', help="Only plot these services")
+  parser.add_argument("--decimation", type=positive_int, default=1, help="Only keep every n-th message of each service")
+  parser.add_argument("--output", help="Write the merged log to this file instead of starting PlotJuggler, - for stdout. Compressed if it ends in .bz2. "
+                                       "A segment that fails to parse contributes the events read before the error")
   parser.add_argument("route_or_segment_name", nargs='?', help="The route or segment name to plot")
   parser.add_argument("segment_count", type=int, nargs='?', help="The number of segments to plot")
 
@@ -165,6 +232,14 @@ if __name__ == "__main__":
     install()
     sys.exit()
 
+  if args.route_or_segment_name is None and (args.output is not None or not args.stream):
+    parser.error("the route_or_segment_name is required unless streaming")
+
+  if args.output is not None:
+    juggle_route(args.route_or_segment_name.strip(), args.segment_count, args.qlog, args.can, args.layout, args.dbc,
+                 args.services, args.decimation, args.output)
+    sys.exit()
+
   if not os.path.exists(PLOTJUGGLER_BIN):
     print("PlotJuggler is missing. Downloading...")
     install()
@@ -177,4 +252,5 @@ if __name__ == "__main__":
     start_juggler(layout=args.layout)
   else:
     route_or_segment_name = args.route_or_segment_name.strip()
-    juggle_route(route_or_segment_name, args.segment_count, args.qlog, args.can, args.layout, args.dbc)
+    juggle_route(route_or_segment_name, args.segment_count, args.qlog, args.can, args.layout, args.dbc,
+                 args.services, args.decimation)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from cereal import log as capnp_log
+import tools.plotjuggler.juggle as juggle
+from tools.lib.logreader import LogReader
+
+
+def touch_segment(fn, can, services, decimation):
+  open(fn, "w").close()
+  return os.path.basename(fn).encode(), None
+
+
+class CountingWriter:
+  """Records how many segments were started by the workers when each one is written"""
+  def __init__(self, marker_dir):
+    self.marker_dir = marker_dir
+    self.started = []
+
+  def write(self, dat):
+    self.started.append(len(os.listdir(self.marker_dir)))
+
+
+class TestJuggle(unittest.TestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.tmp = tmp.name
+
+  def _make_log(self, seg, n):
+    fn = os.path.join(self.tmp, f"rlog{seg}")
+    with open(fn, "wb") as f:
+      for i in range(n):
+        msg = capnp_log.Event.new_message(logMonoTime=seg * 1000 + i)
+        msg.init('carState' if i % 2 == 0 else 'controlsState')
+        f.write(msg.to_bytes())
+    return fn
+
+  def test_merge_in_order(self):
+    logs = [self._make_log(seg, 10) for seg in range(5)]
+    for decimation in (1, 3):
+      out = os.path.join(self.tmp, "merged")
+      with open(out, "wb") as f:
+        juggle.merge_segments(logs, f, decimation=decimation, workers=2)
+
+      # every decimation'th message of each service, starting with the first
+      expected = [seg * 1000 + i for seg in range(5) for i in range(10) if (i // 2) % decimation == 0]
+      self.assertEqual([m.logMonoTime for m in LogReader(out, sort_by_time=False)], expected)
+
+  def test_bounded_in_flight(self):
+    marker_dir = os.path.join(self.tmp, "started")
+    os.mkdir(marker_dir)
+    logs = [os.path.join(marker_dir, str(i)) for i in range(30)]
+    writer = CountingWriter(marker_dir)
+    with mock.patch.object(juggle, "load_segment", touch_segment):
+      juggle.merge_segments(logs, writer, workers=2)
+
+    self.assertEqual(len(writer.started), len(logs))
+    for written, started in enumerate(writer.started):
+      # the segment being written and at most 2 per worker after it
+      self.assertLessEqual(started, written + 1 + 2 * 2)
+
+  def test_decimation_validated(self):
+    with self.assertRaises(ValueError):
+      juggle.merge_segments([], io.BytesIO(), decimation=0)
+    self.assertEqual(juggle.positive_int("2"), 2)
+    for value in ("0", "-1"):
+      with self.assertRaises(argparse.ArgumentTypeError):
+        juggle.positive_int(value)
+
+
+if __name__ == "__main__":
+  unittest.main()